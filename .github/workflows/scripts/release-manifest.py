@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Write the release manifest, the SHA-256 and SHA-512 checksums of every
+release artifact, plus the ``<artifact>.sha256`` files kept for older
+consumers.
+
+Each artifact is read once, both digests are computed from the same stream.
+Every artifact entry is kept on its own line so the manifest can be checked
+with a line oriented tool as well as parsed as JSON.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import re
+import sys
+import tempfile
+
+REPO_ROOT = pathlib.Path(__file__).resolve().parent.parent.parent.parent
+MANIFEST_NAME = "bootstrap-salt.manifest.json"
+DEFAULT_ARTIFACTS = (
+    "bootstrap-salt.sh",
+    "bootstrap-salt.ps1",
+    "bootstrap-salt-loader.sh",
+)
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    sha512 = hashlib.sha512()
+    size = 0
+    with open(path, "rb") as rfh:
+        while chunk := rfh.read(CHUNK_SIZE):
+            sha256.update(chunk)
+            sha512.update(chunk)
+            size += len(chunk)
+    return {
+        "sha256": sha256.hexdigest(),
+        "sha512": sha512.hexdigest(),
+        "size": size,
+    }
+
+
+def script_version(path):
+    match = re.search(
+        r'^\$?__ScriptVersion\s*=\s*"([^"]+)"', path.read_text(), re.MULTILINE
+    )
+    if match is None:
+        return None
+    return match.group(1)
+
+
+def render_manifest(version, artifacts):
+    lines = [f'{{"version": {json.dumps(version)}, "artifacts": {{']
+    entries = [
+        f"  {json.dumps(name)}: {json.dumps(details, sort_keys=True)}"
+        for name, details in sorted(artifacts.items())
+    ]
+    lines.append(",\n".join(entries))
+    lines.append("}}")
+    return "\n".join(lines) + "\n"
+
+
+def write_atomic(path, contents):
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as wfh:
+            wfh.write(contents)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "artifacts",
+        nargs="*",
+        type=pathlib.Path,
+        default=[REPO_ROOT / name for name in DEFAULT_ARTIFACTS],
+        help="The release artifacts. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--version",
+        help="The release version. Default: the version of bootstrap-salt.sh",
+    )
+    parser.add_argument(
+        "--output",
+        type=pathlib.Path,
+        default=REPO_ROOT / MANIFEST_NAME,
+        help="Where to write the manifest. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--no-sha256-files",
+        action="store_true",
+        help="Do not write the <artifact>.sha256 files",
+    )
+    options = parser.parse_args()
+
+    artifacts = {}
+    for path in options.artifacts:
+        if not path.is_file():
+            parser.exit(1, f"{path} does not exist\n")
+        if path.name in artifacts:
+            parser.exit(1, f"{path.name} was passed more than once\n")
+        artifacts[path.name] = hash_file(path)
+        if not options.no_sha256_files:
+            write_atomic(
+                path.with_name(f"{path.name}.sha256"),
+                f"{artifacts[path.name]['sha256']}\n",
+            )
+        print(f"{artifacts[path.name]['sha256']}  {path.name}")
+
+    version = options.version
+    if version is None:
+        for path in options.artifacts:
+            if path.name == "bootstrap-salt.sh":
+                version = script_version(path)
+    if version is None:
+        parser.exit(1, "Unable to find the release version, pass --version\n")
+
+    contents = render_manifest(version, artifacts)
+    # Make sure what is about to be published parses back to the same data
+    if json.loads(contents) != {"version": version, "artifacts": artifacts}:
+        parser.exit(1, "The rendered manifest does not round trip\n")
+    write_atomic(options.output, contents)
+    print(f"Wrote {options.output}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
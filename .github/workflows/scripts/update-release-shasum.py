@@ -1,47 +1,98 @@
 #!/usr/bin/env python
-import sys
+import os
 import pathlib
-import subprocess
+import re
+import sys
+import tempfile
 
 THIS_FILE = pathlib.Path(__file__).resolve()
 CODE_ROOT = THIS_FILE.parent.parent.parent.parent
 README_PATH = CODE_ROOT / "README.rst"
 
+ANCHOR = ".. _sha256sums:"
+ENTRY_RE = re.compile(r"^- (?P<version>\S+): ``(?P<sha256sum>[0-9a-f]{64})``$")
+
+
+def sha256sum_entries(contents):
+    """
+    Return the ``(version, sha256sum)`` entries of the sha256sums list.
+    """
+    entries = []
+    lines = contents.splitlines()
+    start = next(idx for idx, line in enumerate(lines) if line.startswith(ANCHOR))
+    for line in lines[start + 1 :]:
+        if not entries and not line.startswith("-"):
+            continue
+        match = ENTRY_RE.match(line)
+        if match is None:
+            break
+        entries.append((match.group("version"), match.group("sha256sum")))
+    return entries
+
+
+def update_readme(contents, version, sha256sum):
+    """
+    Return the README contents with the release entry inserted at the top of
+    the sha256sums list, in a single pass over the lines.
+    """
+    entry = f"- {version}: ``{sha256sum}``\n"
+    lines = contents.splitlines(True)
+    out_lines = []
+    found_anchor = False
+    inserted_at = None
+    for line in lines:
+        if inserted_at is None and found_anchor and line.startswith("-"):
+            match = ENTRY_RE.match(line.rstrip("\n"))
+            if match is None:
+                raise ValueError(f"Unexpected sha256sums entry: {line!r}")
+            if match.group("version") == version:
+                raise ValueError(f"README already has an entry for version {version}")
+            inserted_at = len(out_lines)
+            out_lines.append(entry)
+        elif inserted_at is not None and line.startswith(f"- {version}:"):
+            raise ValueError(f"README already has an entry for version {version}")
+        out_lines.append(line)
+        if line.startswith(ANCHOR):
+            found_anchor = True
+
+    if not found_anchor:
+        raise ValueError(f"Could not find the {ANCHOR!r} anchor")
+    if inserted_at is None:
+        raise ValueError("Could not find the sha256sums list")
+
+    out_contents = "".join(out_lines)
+    # Parsed again, the new entry must head the list and nothing else may change
+    if len(out_lines) != len(lines) + 1 or sha256sum_entries(out_contents) != [
+        (version, sha256sum),
+        *sha256sum_entries(contents),
+    ]:
+        raise ValueError("Too Many Changes to the readme file")
+    return out_contents
+
 
 def main(version, sha256sum):
-    in_contents = README_PATH.read_text()
-    if version in in_contents:
-        print(f"README file already contains an entry for version {version}")
+    if not re.fullmatch(r"[0-9a-f]{64}", sha256sum):
+        print(f"{sha256sum!r} is not a sha256sum")
         sys.exit(1)
-    out_contents = ""
-    found_anchor = False
-    updated_version = False
-    if version not in in_contents:
-        for line in in_contents.splitlines(True):
-            if updated_version:
-                out_contents += line
-                continue
-            if found_anchor:
-                if not line.startswith("-"):
-                    out_contents += line
-                    continue
-                out_contents += "- {}: ``{}``\n".format(version, sha256sum)
-                out_contents += line
-                updated_version = True
-                continue
-
-            out_contents += line
-            if line.startswith(".. _sha256sums:"):
-                found_anchor = True
-    if in_contents != out_contents:
-        README_PATH.write_text(out_contents)
-
-    ret = subprocess.run(
-        ["git", "diff", "--stat"], universal_newlines=True, capture_output=True
-    )
-    if "1 file changed, 1 insertion(+)" not in ret.stdout:
-        print("Too Many Changes to the readme file")
+
+    in_contents = README_PATH.read_text()
+    try:
+        out_contents = update_readme(in_contents, version, sha256sum)
+    except ValueError as exc:
+        print(exc)
         sys.exit(1)
+
+    # Write it in place atomically, a failed run never leaves a truncated README
+    fd, tmp_path = tempfile.mkstemp(dir=README_PATH.parent, prefix=".README.rst.")
+    try:
+        with os.fdopen(fd, "w") as wfh:
+            wfh.write(out_contents)
+        os.chmod(tmp_path, README_PATH.stat().st_mode & 0o777)
+        os.replace(tmp_path, README_PATH)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    print(f"Added the {version} sha256sum to {README_PATH}")
     sys.exit(0)
 
 
@@ -0,0 +1,119 @@
+#!/bin/sh
+#======================================================================================================================
+# vim: softtabstop=4 shiftwidth=4 expandtab fenc=utf-8 spell spelllang=en cc=120
+#======================================================================================================================
+#
+#          FILE: bootstrap-salt-loader.sh
+#
+#   DESCRIPTION: Run the current bootstrap-salt.sh release from a local, verified cache. Only the published
+#                sha256 digest is downloaded on every run, the script itself only when the digest changed.
+#
+#                Pass it the bootstrap-salt.sh options, i.e. for the loader published with the releases:
+#
+#                  curl -sSL "$URL/bootstrap-salt-loader.sh" | sudo sh -s -- -A salt.example.com onedir
+#
+#                where URL is https://github.com/saltstack/salt-bootstrap/releases/latest/download
+#
+#          BUGS: https://github.com/saltstack/salt-bootstrap/issues
+#
+#     COPYRIGHT: (c) 2012-2024 by the SaltStack Team, see AUTHORS.rst for more
+#                details.
+#
+#       LICENSE: Apache 2.0
+#  ORGANIZATION: SaltStack (saltproject.io)
+#======================================================================================================================
+set -o nounset                              # Treat unset variables as an error
+
+__ScriptName="bootstrap-salt-loader.sh"
+
+#======================================================================================================================
+#  Environment variables taken into account.
+#----------------------------------------------------------------------------------------------------------------------
+#   * BS_LOADER_URL:            Where bootstrap-salt.sh is downloaded from.
+#                               Defaults to https://github.com/saltstack/salt-bootstrap/releases/latest/download
+#   * BS_LOADER_DIGEST_URL:     Where its sha256 digest is downloaded from.
+#                               Defaults to $BS_LOADER_URL/bootstrap-salt.sh.sha256
+#   * BS_LOADER_CACHE_DIR:      Where the verified copy is kept. Defaults to /var/cache/salt-bootstrap
+#   * BS_LOADER_OFFLINE:        If 1, run the cached copy when the digest cannot be downloaded. Default 0
+#======================================================================================================================
+
+_BASE_URL=${BS_LOADER_URL:-https://github.com/saltstack/salt-bootstrap/releases/latest/download}
+_DIGEST_URL=${BS_LOADER_DIGEST_URL:-${_BASE_URL}/bootstrap-salt.sh.sha256}
+_CACHE_DIR=${BS_LOADER_CACHE_DIR:-/var/cache/salt-bootstrap}
+_OFFLINE=${BS_LOADER_OFFLINE:-0}
+_CACHED_SCRIPT="${_CACHE_DIR}/bootstrap-salt.sh"
+
+echoinfo() {
+    printf " *  INFO: %s\\n" "$@" 1>&2;
+}
+
+echoerror() {
+    printf " * ERROR: %s\\n" "$@" 1>&2;
+}
+
+__fetch_url() {
+    curl -L -s -f -o "$1" "$2" >/dev/null 2>&1     ||
+        wget -q -O "$1" "$2" >/dev/null 2>&1       ||
+            fetch -q -o "$1" "$2" >/dev/null 2>&1  ||  # FreeBSD
+                ftp -o "$1" "$2" >/dev/null 2>&1       # OpenBSD
+}
+
+__fetch_url_stdout() {
+    # Only one downloader, falling back to another one after a partial download would corrupt the stream
+    if command -v curl >/dev/null 2>&1; then
+        curl -L -s -f "$1" 2>/dev/null
+    elif command -v wget >/dev/null 2>&1; then
+        wget -q -O - "$1" 2>/dev/null
+    else
+        fetch -q -o - "$1" 2>/dev/null  # FreeBSD
+    fi
+}
+
+__sha256() {
+    if command -v sha256sum >/dev/null 2>&1; then
+        sha256sum "$1" | awk '{ print $1 }'
+    elif command -v shasum >/dev/null 2>&1; then
+        shasum -a 256 "$1" | awk '{ print $1 }'
+    else
+        sha256 -q "$1"  # BSD
+    fi
+}
+
+mkdir -p "${_CACHE_DIR}" || exit 1
+
+_DIGEST=$(__fetch_url_stdout "${_DIGEST_URL}" | sed -n 's/^\([0-9a-fA-F]\{64\}\).*/\1/p' | head -n 1 | tr 'A-F' 'a-f')
+
+if [ -z "${_DIGEST}" ]; then
+    # Without the published digest, the cached copy can only be checked against the digest it was stored with
+    if [ "${_OFFLINE}" -eq 1 ] && [ -f "${_CACHED_SCRIPT}" ] && [ -f "${_CACHED_SCRIPT}.sha256" ] && \
+            [ "$(__sha256 "${_CACHED_SCRIPT}")" = "$(cat "${_CACHED_SCRIPT}.sha256")" ]; then
+        echoerror "Unable to download ${_DIGEST_URL}, the cached copy might not be the current release"
+        exec sh "${_CACHED_SCRIPT}" "$@"
+    fi
+    echoerror "Unable to download the bootstrap-salt.sh digest from ${_DIGEST_URL}"
+    exit 1
+fi
+
+if [ -f "${_CACHED_SCRIPT}" ] && [ "$(__sha256 "${_CACHED_SCRIPT}")" = "${_DIGEST}" ]; then
+    echoinfo "The cached bootstrap-salt.sh is the current release"
+    exec sh "${_CACHED_SCRIPT}" "$@"
+fi
+
+# Download next to the cached copy, so it is only replaced, with a rename, once verified
+_TEMP_SCRIPT="${_CACHED_SCRIPT}.$$"
+trap 'rm -f "${_TEMP_SCRIPT}"' EXIT INT TERM
+echoinfo "Downloading ${_BASE_URL}/bootstrap-salt.sh"
+if ! __fetch_url "${_TEMP_SCRIPT}" "${_BASE_URL}/bootstrap-salt.sh"; then
+    echoerror "Unable to download ${_BASE_URL}/bootstrap-salt.sh"
+    exit 1
+fi
+if [ "$(__sha256 "${_TEMP_SCRIPT}")" != "${_DIGEST}" ]; then
+    echoerror "The downloaded bootstrap-salt.sh does not match the published digest ${_DIGEST}"
+    exit 1
+fi
+chmod 755 "${_TEMP_SCRIPT}"
+mv -f "${_TEMP_SCRIPT}" "${_CACHED_SCRIPT}" || exit 1
+echo "${_DIGEST}" > "${_CACHED_SCRIPT}.sha256"
+trap - EXIT INT TERM
+
+exec sh "${_CACHED_SCRIPT}" "$@"
@@ -45,9 +45,40 @@ __ScriptArgs="$*"
 #   * BS_KEEP_TEMP_FILES:       If 1, don't move temporary files, instead copy them
 #   * BS_FORCE_OVERWRITE:       Force overriding copied files(config, init.d, etc)
 #   * BS_UPGRADE_SYS:           If 1 and an option, upgrade system. Default 0.
+#   * BS_UPGRADE_MODE:          How much of the system -U upgrades: security, deps or full. Default full
 #   * BS_GENTOO_USE_BINHOST:    If 1 add `--getbinpkg` to gentoo's emerge
 #   * BS_SALT_MASTER_ADDRESS:   The IP or DNS name of the salt-master the minion should connect to
 #   * BS_SALT_GIT_CHECKOUT_DIR: The directory where to clone Salt on git installations
+#   * BS_PHASES:                Comma separated bootstrap phases to run, same as -o. Default: all
+#   * BS_STATE_FILE:            Where the resolved state is kept between phased runs.
+#                               Defaults to /var/lib/salt-bootstrap/state
+#   * BS_LEAN:                  If 1, use the lean install profile, same as -e. Default 0
+#   * BS_PRECOMPILE:            If 0, do not precompile Salt to bytecode after git and pip installs, same as -Z. Default 1
+#   * BS_MIRRORS:               Comma separated mirrors of packages.broadcom.com/artifactory, same as -m
+#   * BS_MIRROR_CACHE_FILE:     Where the mirror probe results are cached.
+#                               Defaults to /var/cache/salt-bootstrap/mirrors
+#   * BS_MIRROR_CACHE_TTL:      Seconds the mirror probe results are reused for. Default 300
+#   * BS_MIRROR_PROBE_TIMEOUT:  Seconds a mirror has to answer the probe. Default 5
+#   * BS_CLEANUP:               If 1, remove what was only needed to build Salt after installing it, same as -E.
+#                               Default 0
+#   * BS_AUTO_TUNE:             If 1, write master.d and minion.d drop-ins tuned to this host, same as -t. Default 0
+#   * BS_START_JITTER:          Defer the salt-minion start, same as -w, i.e. random:300 or hash:600
+#   * BS_NON_INTERACTIVE:       If 1, do not wait through the cancel and overwrite countdowns, same as -y. Default 0
+#   * BS_LOADER_CACHE_DIR:      If set, keep a copy of this script there for bootstrap-salt-loader.sh, which then
+#                               only downloads the script again once a newer release is published
+#   * BS_DIAG_TIMEOUT:          Seconds each daemon is run in the foreground for, when gathering the diagnostics of
+#                               daemons which failed to start with -D. Default 30
+#   * BS_DIAG_LOG_LINES:        How many of the last lines of each daemon log go in the diagnostics. Default 200
+#   * BS_DIAG_BUNDLE:           Where the diagnostics of daemons which failed to start are packed.
+#                               Defaults to /tmp/bootstrap-salt-diagnostics.tar.gz
+#   * BS_PLAN:                  If 1, only print the resolved plan as JSON, same as -O. Default 0
+#   * BS_PLAN_RESOLVE:          If 1, the plan resolves latest, 3006 and 3007 to the exact release against the
+#                               repository, which needs wget and network access. Default 0
+#   * BS_LOG_TIMESTAMPS:        If 1, prefix the INFO, WARN, ERROR and DEBUG lines with an UTC timestamp, which
+#                               lets tools/logs.py measure how long each phase took. Default 0
+#   * BS_TRACE:                 Write a trace of every command, with its function stack and a microsecond timestamp,
+#                               to this file. tools/trace.py folds it into flame graph stacks. Requires bash 5, the
+#                               script runs itself again with bash when started by another shell
 #======================================================================================================================
 
 
@@ -58,6 +89,25 @@ BS_FALSE=0
 # Default sleep time used when waiting for daemons to start, restart and checking for these running
 __DEFAULT_SLEEP=3
 
+_LOG_TIMESTAMPS=${BS_LOG_TIMESTAMPS:-$BS_FALSE}
+
+# Trace every command as early as possible, bash 5 gives the timestamps and function stacks without forking for them
+_TRACE_FILE=${BS_TRACE:-}
+if [ -n "$_TRACE_FILE" ]; then
+    if [ -z "${EPOCHREALTIME:-}" ]; then
+        if [ -z "${BASH_VERSION:-}" ] && [ -f "$0" ] && command -v bash >/dev/null 2>&1; then
+            exec bash "$0" "$@"
+        fi
+        echo "BS_TRACE requires bash 5 or newer, and the script to be run from a file" 1>&2
+        exit 1
+    fi
+    exec 9>"$_TRACE_FILE"
+    BASH_XTRACEFD=9
+    # shellcheck disable=SC2016,SC3028
+    PS4='+${EPOCHREALTIME} ${BASHPID} ${FUNCNAME[*]:-main}| '
+    set -x
+fi
+
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
 #          NAME:  __detect_color_support
 #   DESCRIPTION:  Try to detect color support.
@@ -82,11 +132,22 @@ __detect_color_support() {
 __detect_color_support
 
 
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __log_timestamp
+#   DESCRIPTION:  Print the timestamp prefix of the echo* lines when BS_LOG_TIMESTAMPS is set.
+#----------------------------------------------------------------------------------------------------------------------
+__log_timestamp() {
+    if [ "$_LOG_TIMESTAMPS" -eq $BS_TRUE ]; then
+        printf '%s ' "$(date -u '+%Y-%m-%dT%H:%M:%SZ')"
+    fi
+}
+
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
 #          NAME:  echoerr
 #   DESCRIPTION:  Echo errors to stderr.
 #----------------------------------------------------------------------------------------------------------------------
 echoerror() {
+    __log_timestamp 1>&2
     printf "${RC} * ERROR${EC}: %s\\n" "$@" 1>&2;
 }
 
@@ -95,6 +156,7 @@ echoerror() {
 #   DESCRIPTION:  Echo information to stdout.
 #----------------------------------------------------------------------------------------------------------------------
 echoinfo() {
+    __log_timestamp
     printf "${GC} *  INFO${EC}: %s\\n" "$@";
 }
 
@@ -103,6 +165,7 @@ echoinfo() {
 #   DESCRIPTION:  Echo warning information to stdout.
 #----------------------------------------------------------------------------------------------------------------------
 echowarn() {
+    __log_timestamp
     printf "${YC} *  WARN${EC}: %s\\n" "$@";
 }
 
@@ -112,6 +175,7 @@ echowarn() {
 #----------------------------------------------------------------------------------------------------------------------
 echodebug() {
     if [ "$_ECHO_DEBUG" -eq $BS_TRUE ]; then
+        __log_timestamp
         printf "${BC} * DEBUG${EC}: %s\\n" "$@";
     fi
 }
@@ -240,6 +304,43 @@ __check_unparsed_options() {
 }
 
 
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __phase_enabled
+#  DESCRIPTION:  Checks if the passed bootstrap phase was requested to run
+#----------------------------------------------------------------------------------------------------------------------
+__phase_enabled() {
+
+    [ "$_PHASES" = "all" ] && return 0
+
+    case ",${_PHASES}," in
+        *",$1,"* )
+            return 0
+            ;;
+    esac
+    return 1
+}
+
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __upgrade_enabled
+#  DESCRIPTION:  Checks if the system would be upgraded. The upgrade needs -U or -u, and runs before the dependencies,
+#                so phased runs upgrade when they include the upgrade or the deps phase.
+#----------------------------------------------------------------------------------------------------------------------
+__upgrade_enabled() {
+
+    [ "$_UPGRADE_SYS" -eq $BS_TRUE ] || return 1
+    [ "$_CONFIG_ONLY" -eq $BS_FALSE ] || return 1
+
+    if [ "$_PHASES" = "all" ]; then
+        # Full upgrades are left to the dependencies install functions
+        [ "$_UPGRADE_MODE" != "full" ] || [ "$_NO_DEPS" -eq $BS_FALSE ]
+        return $?
+    fi
+
+    __phase_enabled upgrade || __phase_enabled deps
+}
+
+
 #----------------------------------------------------------------------------------------------------------------------
 #  Handle command line arguments
 #----------------------------------------------------------------------------------------------------------------------
@@ -269,11 +370,15 @@ _GENTOO_USE_BINHOST=${BS_GENTOO_USE_BINHOST:-$BS_FALSE}
 _EPEL_REPO=${BS_EPEL_REPO:-epel}
 _EPEL_REPOS_INSTALLED=$BS_FALSE
 _UPGRADE_SYS=${BS_UPGRADE_SYS:-$BS_FALSE}
+_UPGRADE_MODE=${BS_UPGRADE_MODE:-full}
 _INSECURE_DL=${BS_INSECURE_DL:-$BS_FALSE}
 _CURL_ARGS=${BS_CURL_ARGS:-}
 _FETCH_ARGS=${BS_FETCH_ARGS:-}
 _GPG_ARGS=${BS_GPG_ARGS:-}
 _WGET_ARGS=${BS_WGET_ARGS:-}
+_APT_INSTALL_ARGS=""
+_DNF_INSTALL_ARGS=""
+_ZYPPER_INSTALL_ARGS=""
 _SALT_MASTER_ADDRESS=${BS_SALT_MASTER_ADDRESS:-null}
 _SALT_MINION_ID="null"
 # _SIMPLIFY_VERSION is mostly used in Solaris based distributions
@@ -300,6 +405,29 @@ _PIP_DOWNLOAD_ARGS=""
 _QUICK_START="$BS_FALSE"
 _AUTO_ACCEPT_MINION_KEYS="$BS_FALSE"
 _SYSTEMD_FUNCTIONAL=$BS_TRUE
+_PHASES=${BS_PHASES:-all}
+_STATE_FILE=${BS_STATE_FILE:-/var/lib/salt-bootstrap/state}
+_PRECOMPILE=${BS_PRECOMPILE:-$BS_TRUE}
+_LEAN=${BS_LEAN:-$BS_FALSE}
+_LEAN_BUILD_PKGS=""
+_CLEANUP=${BS_CLEANUP:-$BS_FALSE}
+_BAKE=$BS_FALSE
+_BAKED_SERVICES=""
+_CLEANUP_PATHS=""
+_AUTO_TUNE=${BS_AUTO_TUNE:-$BS_FALSE}
+_START_JITTER=${BS_START_JITTER:-}
+_NON_INTERACTIVE=${BS_NON_INTERACTIVE:-$BS_FALSE}
+_LOADER_CACHE_DIR=${BS_LOADER_CACHE_DIR:-}
+_DIAG_TIMEOUT=${BS_DIAG_TIMEOUT:-30}
+_DIAG_LOG_LINES=${BS_DIAG_LOG_LINES:-200}
+_DIAG_BUNDLE=${BS_DIAG_BUNDLE:-/tmp/bootstrap-salt-diagnostics.tar.gz}
+_MIRRORS=${BS_MIRRORS:-}
+_MIRRORS_HEALTHY=""
+_MIRROR_CACHE_FILE=${BS_MIRROR_CACHE_FILE:-/var/cache/salt-bootstrap/mirrors}
+_MIRROR_CACHE_TTL=${BS_MIRROR_CACHE_TTL:-300}
+_MIRROR_PROBE_TIMEOUT=${BS_MIRROR_PROBE_TIMEOUT:-5}
+_PLAN=${BS_PLAN:-$BS_FALSE}
+_PLAN_RESOLVE=${BS_PLAN_RESOLVE:-$BS_FALSE}
 
 # Defaults for install arguments
 ITYPE="stable"
@@ -330,6 +458,13 @@ __usage() {
     - onedir [version]     Install a specific version. Only supported for
                            onedir packages available at packages.broadcom.com
 
+    - onedir_tarball       Install latest onedir release from the relocatable
+                           onedir tarball, without configuring any package
+                           repository or touching the system package manager
+    - onedir_tarball [version]
+                           Install a specific version from the onedir tarball.
+                           Only supported for Linux
+
     - onedir_rc            Install latest onedir RC release.
     - onedir_rc [version]  Install a specific version. Only supported for
                            onedir RC packages available at packages.broadcom.com
@@ -348,6 +483,8 @@ __usage() {
     - ${__ScriptName} git 06f249901a2e2f1ed310d58ea3921a129f214358
     - ${__ScriptName} onedir
     - ${__ScriptName} onedir 3006
+    - ${__ScriptName} onedir_tarball
+    - ${__ScriptName} onedir_tarball 3007.1
     - ${__ScriptName} onedir_rc
     - ${__ScriptName} onedir_rc 3008
 
@@ -370,6 +507,14 @@ __usage() {
         You can also do this by touching /tmp/disable_salt_checks on the target
         host. Default: \${BS_FALSE}
     -D  Show debug output
+    -E  Cleanup phase. After the post install step, remove the compilers and
+        development packages, the git checkout, the built wheels and the pip
+        cache which this script added only to build Salt, check that Salt
+        still runs and report the space reclaimed. Anything which existed
+        before the run is kept
+    -e  Lean install profile. Do not install recommended or weak dependencies,
+        remove the build only packages this script installed once Salt is
+        installed, clean the package manager caches and report the space saved
     -f  Force shallow cloning for git installations.
         This may result in an "n/a" in the version number.
     -F  Allow copied files to overwrite existing (config, init.d, etc)
@@ -398,11 +543,27 @@ __usage() {
     -K  If set, keep the temporary files in the temporary directories specified
         with -c and -k
     -l  Disable ssl checks. When passed, switches "https" calls to "http" where
-        possible.
+        possible, including the package repositories and GPG keys under the -R
+        URL, so only use it with -R mirrors you trust.
     -L  Also install salt-cloud and required python-libcloud package
     -M  Also install salt-master
     -n  No colours
     -N  Do not install salt-minion
+    -o  Only run the given comma separated bootstrap phases. Phases always run
+        in this order: upgrade, deps, repo, config, preseed, install, post,
+        cleanup and start. The upgrade phase requires -U or -u, which also
+        upgrade the system in phased runs with the deps phase.
+        The resolved state is kept in \${BS_STATE_FILE} between runs,
+        so each phase can run in its own container image layer. Default: all
+        For golden images, 'bake' installs and pre-warms Salt, then stops and
+        disables it and removes the minion id, master address and keys.
+        'personalize', at first boot, only applies -i, -A, -k and the -c keys,
+        configs and grains, and enables and starts the daemons
+    -O  Print the resolved plan as JSON on stdout and exit without changing
+        the system: the functions each phase would run, the Salt version, the
+        repository, GPG key and download URLs and the Salt packages. latest,
+        3006 and 3007 are only resolved against the repository with
+        BS_PLAN_RESOLVE=1. Messages go to stderr. Does not require root
     -p  Extra-package to install while installing Salt dependencies. One package
         per -p flag. You are responsible for providing the proper package name.
     -P  Allow pip based installations. On some distributions the required salt
@@ -418,25 +579,53 @@ __usage() {
         packages.broadcom.com. The option passed with -R replaces the
         "packages.broadcom.com". If -R is passed, -r is also set. Currently only
         works on CentOS/RHEL and Debian based distributions and macOS.
+    -m  Comma separated list of mirrors, in the same format as -R, in order of
+        preference. The mirrors are probed in parallel and the fastest healthy
+        one is used. Downloads made by this script fail over to the next
+        mirror. The package manager repositories point at the mirror selected
+        when they are set up and do not fail over. Probe results are cached
+        in \${BS_MIRROR_CACHE_FILE} for \${BS_MIRROR_CACHE_TTL} seconds.
+    -t  Auto-tune Salt to this host. Writes master.d and minion.d drop-ins,
+        named 00-bootstrap-tuning.conf, with the master's worker threads,
+        socket pool and key cache derived from the number of CPU cores and
+        the memory, and with the minion's reconnect, re-authentication
+        back-off and jitter settings for large fleets. Settings already present
+        in the master or minion config files or other drop-ins are left out
     -s  Sleep time used when waiting for daemons to start, restart and when
         checking for the services running. Default: ${__DEFAULT_SLEEP}
     -S  Also install salt-syndic
     -r  Disable all repository configuration performed by this script. This
         option assumes all necessary repository configuration is already present
         on the system.
+    -u  Upgrade mode, implies -U. 'security' only applies security updates,
+        'deps' only upgrades the dependency closure of the installed packages
+        this script relies on and 'full' upgrades the whole system. The
+        'security' and 'deps' upgrades report the packages they upgraded and
+        the time taken. Default: full
     -U  If set, fully upgrade the system prior to bootstrapping Salt
     -v  Display script version
     -V  Install Salt into virtualenv
         (only available for Ubuntu based distributions)
+    -w  Defer the salt-minion start to spread the authentication load of many
+        minions bootstrapped at once. 'random:<seconds>' starts it after a
+        random delay within the window and 'hash:<seconds>' in a slot of the
+        window derived from the minion id. The rest of the bootstrap, and the
+        other daemons, do not wait for it. The deferred start is scheduled
+        with a systemd timer when systemd is functional
     -W  Also install salt-api
+    -Z  Do not precompile the installed Salt tree and its dependencies to
+        bytecode after git and pip installs. Saves space on minimal images at the
+        cost of a slower first daemon start
     -x  Changes the Python version used to install Salt (default: Python 3).
         Python 2.7 is no longer supported.
     -X  Do not start daemons after installation
+    -y  Non-interactive. Do not wait through the countdowns which give a
+        chance to cancel git installs and config overwrites with -C
 
 EOT
 }   # ----------  end of function __usage  ----------
 
-while getopts ':hvnDc:g:Gx:k:s:MSWNXCPFUKIA:i:Lp:dH:bflV:J:j:rR:aqQ' opt
+while getopts ':hvnDc:g:Gx:k:s:MSWNXCPFUKIA:i:Lp:dH:bflV:J:j:rR:aqQo:m:Zeu:OEtw:y' opt
 do
   case "${opt}" in
 
@@ -483,6 +672,16 @@ do
     q )  _QUIET_GIT_INSTALLATION=$BS_TRUE               ;;
     Q )  _QUICK_START=$BS_TRUE                          ;;
     x )  _PY_EXE="$OPTARG"                              ;;
+    o )  _PHASES="$OPTARG"                              ;;
+    m )  _MIRRORS="$OPTARG"                             ;;
+    Z )  _PRECOMPILE=$BS_FALSE                          ;;
+    e )  _LEAN=$BS_TRUE                                 ;;
+    u )  _UPGRADE_MODE="$OPTARG"; _UPGRADE_SYS=$BS_TRUE ;;
+    O )  _PLAN=$BS_TRUE                                 ;;
+    E )  _CLEANUP=$BS_TRUE                              ;;
+    t )  _AUTO_TUNE=$BS_TRUE                            ;;
+    w )  _START_JITTER="$OPTARG"                        ;;
+    y )  _NON_INTERACTIVE=$BS_TRUE                      ;;
 
     \?)  echo
          echoerror "Option does not exist : $OPTARG"
@@ -497,25 +696,30 @@ shift $((OPTIND-1))
 # Define our logging file and pipe paths
 LOGFILE="/tmp/$( echo "$__ScriptName" | sed s/.sh/.log/g )"
 LOGPIPE="/tmp/$( echo "$__ScriptName" | sed s/.sh/.logpipe/g )"
-# Ensure no residual pipe exists
-rm "$LOGPIPE" 2>/dev/null
+if [ "$_PLAN" -eq $BS_TRUE ]; then
+    # The plan goes to the original stdout, everything else to stderr, and nothing is logged to disk
+    exec 3>&1 1>&2
+else
+    # Ensure no residual pipe exists
+    rm "$LOGPIPE" 2>/dev/null
 
-# Create our logging pipe
-# On FreeBSD we have to use mkfifo instead of mknod
-if ! (mknod "$LOGPIPE" p >/dev/null 2>&1 || mkfifo "$LOGPIPE" >/dev/null 2>&1); then
-    echoerror "Failed to create the named pipe required to log"
-    exit 1
-fi
+    # Create our logging pipe
+    # On FreeBSD we have to use mkfifo instead of mknod
+    if ! (mknod "$LOGPIPE" p >/dev/null 2>&1 || mkfifo "$LOGPIPE" >/dev/null 2>&1); then
+        echoerror "Failed to create the named pipe required to log"
+        exit 1
+    fi
 
-# What ever is written to the logpipe gets written to the logfile
-tee < "$LOGPIPE" "$LOGFILE" &
+    # What ever is written to the logpipe gets written to the logfile
+    tee < "$LOGPIPE" "$LOGFILE" &
 
-# Close STDOUT, reopen it directing it to the logpipe
-exec 1>&-
-exec 1>"$LOGPIPE"
-# Close STDERR, reopen it directing it to the logpipe
-exec 2>&-
-exec 2>"$LOGPIPE"
+    # Close STDOUT, reopen it directing it to the logpipe
+    exec 1>&-
+    exec 1>"$LOGPIPE"
+    # Close STDERR, reopen it directing it to the logpipe
+    exec 2>&-
+    exec 2>"$LOGPIPE"
+fi
 
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
@@ -538,8 +742,17 @@ APT_ERR=$(mktemp /tmp/apt_error.XXXXXX)
 __exit_cleanup() {
     EXIT_CODE=$?
 
+    if [ "$_PLAN" -eq $BS_TRUE ]; then
+        # Nothing else was set up, and the checkout, pipe and tee of a concurrent run must be left alone
+        rm -f "$APT_ERR"
+        exit $EXIT_CODE
+    fi
+
     if [ "$ITYPE" = "git" ] && [ -d "${_SALT_GIT_CHECKOUT_DIR}" ]; then
-        if [ $_KEEP_TEMP_FILES -eq $BS_FALSE ]; then
+        if ! __phase_enabled install; then
+            # A later phased run still needs the checked out repository
+            echodebug "Keeping the Salt Temporary Git Repository for the install phase"
+        elif [ $_KEEP_TEMP_FILES -eq $BS_FALSE ]; then
             # Clean up the checked out repository
             echodebug "Cleaning up the Salt Temporary Git Repository"
             # shellcheck disable=SC2164
@@ -552,6 +765,12 @@ __exit_cleanup() {
         fi
     fi
 
+    # Do not leave salt-minion held back when failing to install it
+    if [ -n "${__MINION_START_HELD:-}" ]; then
+        echodebug "Releasing the held back salt-minion start"
+        __release_minion_start
+    fi
+
     # Remove the logging pipe when the script exits
     if [ -p "$LOGPIPE" ]; then
         echodebug "Removing the logging pipe $LOGPIPE"
@@ -619,7 +838,7 @@ if [ "$#" -gt 0 ];then
 fi
 
 # Check installation type
-if [ "$(echo "$ITYPE" | grep -E '(latest|default|stable|testing|git|onedir|onedir_rc)')" = "" ]; then
+if [ "$(echo "$ITYPE" | grep -E '(latest|default|stable|testing|git|onedir|onedir_tarball|onedir_rc)')" = "" ]; then
     echoerror "Installation type \"$ITYPE\" is not known..."
     exit 1
 fi
@@ -692,6 +911,25 @@ elif [ "$ITYPE" = "onedir" ]; then
         fi
     fi
 
+elif [ "$ITYPE" = "onedir_tarball" ]; then
+    if [ "$#" -eq 0 ];then
+        ONEDIR_REV="latest"
+        STABLE_REV="latest"
+    else
+        if [ "$(echo "$1" | grep -E '^(latest|3006|3007)$')" != "" ]; then
+            ONEDIR_REV="$1"
+            STABLE_REV="$1"
+            shift
+        elif [ "$(echo "$1" | grep -E '^([3-9][0-9]{3}(\.[0-9]*)?)')" != "" ]; then
+            ONEDIR_REV="$1"
+            STABLE_REV="$1"
+            shift
+        else
+            echo "Unknown onedir_tarball version: $1 (valid: 3006, 3007, latest), versions older than 3006 are not available"
+            exit 1
+        fi
+    fi
+
 elif [ "$ITYPE" = "onedir_rc" ]; then
     echoerror "RC Releases are not supported at this time"
 
@@ -759,6 +997,85 @@ if [ "$#" -gt 0 ]; then
     exit 1
 fi
 
+# Check the requested upgrade mode
+case "$_UPGRADE_MODE" in
+    security|deps|full )
+        ;;
+    * )
+        echoerror "Unknown upgrade mode: $_UPGRADE_MODE (valid: security, deps, full)"
+        exit 1
+        ;;
+esac
+
+# Check the requested minion start jitter
+if [ -n "$_START_JITTER" ]; then
+    case "$_START_JITTER" in
+        random:*|hash:* )
+            ;;
+        * )
+            echoerror "Unknown start jitter: $_START_JITTER (valid: random:<seconds>, hash:<seconds>)"
+            exit 1
+            ;;
+    esac
+    if [ "$(echo "${_START_JITTER#*:}" | grep -E '^[0-9]+$')" = "" ]; then
+        echoerror "The start jitter window must be a number of seconds, not '${_START_JITTER#*:}'"
+        exit 1
+    fi
+fi
+
+# Expand the phase groups used to bake golden images and personalize them at first boot
+if [ "$_PHASES" != "all" ]; then
+    __PHASES=""
+    __PERSONALIZE=$BS_FALSE
+    for phase in $(echo "$_PHASES" | tr ',' ' '); do
+        case "$phase" in
+            bake )
+                _BAKE=$BS_TRUE
+                phase="deps,repo,config,install,post"
+                [ "$_UPGRADE_SYS" -eq $BS_TRUE ] && phase="upgrade,${phase}"
+                [ "$_CLEANUP" -eq $BS_TRUE ] && phase="${phase},cleanup"
+                ;;
+            personalize )
+                __PERSONALIZE=$BS_TRUE
+                phase="config,preseed,start"
+                ;;
+        esac
+        __PHASES="${__PHASES:+${__PHASES},}${phase}"
+    done
+    _PHASES="${__PHASES}"
+
+    if [ "$_BAKE" -eq $BS_TRUE ] && [ "$__PERSONALIZE" -eq $BS_TRUE ]; then
+        echoerror "The bake and personalize phases are meant for different runs"
+        exit 1
+    fi
+    if [ "$_BAKE" -eq $BS_TRUE ] && { [ "$_SALT_MASTER_ADDRESS" != "null" ] || [ "$_SALT_MINION_ID" != "null" ]; }; then
+        echowarn "The master address and minion id are not kept in a baked image, pass them when personalizing it"
+    fi
+fi
+
+# Check the requested bootstrap phases
+if [ "$_PHASES" != "all" ]; then
+    for phase in $(echo "$_PHASES" | tr ',' ' '); do
+        case "$phase" in
+            upgrade|deps|repo|config|preseed|install|post|start )
+                ;;
+            cleanup )
+                # Asking for the phase asks for the cleanup
+                _CLEANUP=$BS_TRUE
+                ;;
+            * )
+                echoerror "Unknown bootstrap phase: $phase (valid: upgrade, deps, repo, config, preseed, install, post, cleanup, start)"
+                exit 1
+                ;;
+        esac
+    done
+
+    if __phase_enabled upgrade && [ "$_UPGRADE_SYS" -eq $BS_FALSE ]; then
+        echoerror "The upgrade phase requires -U or -u"
+        exit 1
+    fi
+fi
+
 # whoami alternative for SunOS
 if [ -f /usr/xpg4/bin/id ]; then
     whoami='/usr/xpg4/bin/id -un'
@@ -766,8 +1083,8 @@ else
     whoami='whoami'
 fi
 
-# Root permissions are required to run this script
-if [ "$($whoami)" != "root" ]; then
+# Root permissions are required to run this script, printing the plan does not touch the system
+if [ "$($whoami)" != "root" ] && [ "$_PLAN" -eq $BS_FALSE ]; then
     echoerror "Salt requires root privileges to install. Please re-run this script as root."
     exit 1
 fi
@@ -838,7 +1155,7 @@ if [ -n "$_PY_EXE" ]; then
 fi
 
 # If the configuration directory or archive does not exist, error out
-if [ "$_TEMP_CONFIG_DIR" != "null" ]; then
+if [ "$_TEMP_CONFIG_DIR" != "null" ] && [ "$_PLAN" -eq $BS_FALSE ]; then
     _TEMP_CONFIG_DIR="$(__check_config_dir "$_TEMP_CONFIG_DIR")"
     [ "$_TEMP_CONFIG_DIR" = "null" ] && exit 1
 fi
@@ -896,6 +1213,13 @@ else
     _GPG_ARGS="${_GPG_ARGS} --keyserver-options ca-cert-file=/etc/ssl/certs/ca-certificates.crt"
 fi
 
+# Handle the lean profile flags
+if [ "$_LEAN" -eq $BS_TRUE ]; then
+    _APT_INSTALL_ARGS="--no-install-recommends"
+    _DNF_INSTALL_ARGS="--setopt=install_weak_deps=False"
+    _ZYPPER_INSTALL_ARGS="--no-recommends"
+fi
+
 # Export the http_proxy configuration to our current environment
 if [ "${_HTTP_PROXY}" != "" ]; then
     export http_proxy="${_HTTP_PROXY}"
@@ -929,7 +1253,8 @@ fi
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
 #         NAME:  __fetch_url
-#  DESCRIPTION:  Retrieves a URL and writes it to a given path
+#  DESCRIPTION:  Retrieves a URL and writes it to a given path. Failing over to another mirror changes _REPO_URL, so
+#                call it from the current shell, not from a command substitution or a pipeline, for mirror URLs.
 #----------------------------------------------------------------------------------------------------------------------
 __fetch_url() {
 
@@ -939,7 +1264,48 @@ __fetch_url() {
             fetch $_FETCH_ARGS -q -o "$1" "$2" >/dev/null 2>&1 ||  # FreeBSD
                 fetch -q -o "$1" "$2" >/dev/null 2>&1          ||  # Pre FreeBSD 10
                     ftp -o "$1" "$2" >/dev/null 2>&1           ||  # OpenBSD
-                        (echoerror "$2 failed to download to $1"; exit 1)
+                        { __mirror_next "$2" && __fetch_url "$1" "$__MIRROR_URL"; } ||
+                            (echoerror "$2 failed to download to $1"; exit 1)
+}
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __sha256
+#  DESCRIPTION:  Prints the sha256 sum of the passed file, or of standard input if no file is passed
+#----------------------------------------------------------------------------------------------------------------------
+__sha256() {
+
+    if __check_command_exists sha256sum; then
+        sha256sum ${1+"$1"} | awk '{ print $1 }'
+    else
+        shasum -a 256 ${1+"$1"} | awk '{ print $1 }'
+    fi
+}
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __loader_cache_seed
+#  DESCRIPTION:  Copy this script, along with its sha256 digest, to where bootstrap-salt-loader.sh caches it
+#----------------------------------------------------------------------------------------------------------------------
+__loader_cache_seed() {
+
+    # Nothing to copy when piped to sh
+    [ -f "$__ScriptFullName" ] || return 0
+
+    __SEED_SCRIPT="${_LOADER_CACHE_DIR}/bootstrap-salt.sh"
+    __SEED_SUM=$(__sha256 "$__ScriptFullName")
+    if [ -f "${__SEED_SCRIPT}" ] && [ "$(cat "${__SEED_SCRIPT}.sha256" 2>/dev/null)" = "${__SEED_SUM}" ]; then
+        return 0
+    fi
+
+    echodebug "Caching ${__ScriptFullName} in ${_LOADER_CACHE_DIR}"
+    mkdir -p "${_LOADER_CACHE_DIR}" && \
+        cp "$__ScriptFullName" "${__SEED_SCRIPT}.$$" && \
+        chmod 755 "${__SEED_SCRIPT}.$$" && \
+        mv -f "${__SEED_SCRIPT}.$$" "${__SEED_SCRIPT}" && \
+        echo "${__SEED_SUM}" > "${__SEED_SCRIPT}.sha256" && \
+        return 0
+
+    rm -f "${__SEED_SCRIPT}.$$"
+    return 1
 }
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
@@ -977,6 +1343,128 @@ __check_url_exists() {
     return 1
   fi
 }
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __mirror_next
+#  DESCRIPTION:  When the passed URL points at the mirror in use, drop that mirror, switch _REPO_URL to the next
+#                healthy one and set __MIRROR_URL to the passed URL rewritten for it. Returns 1 when the URL is not
+#                a mirror URL or when there is no mirror left to try.
+#----------------------------------------------------------------------------------------------------------------------
+__mirror_next() {
+
+    [ -n "$_MIRRORS_HEALTHY" ] || return 1
+
+    case "$1" in
+        *"://${_REPO_URL}/"* )
+            ;;
+        * )
+            return 1
+            ;;
+    esac
+
+    __MIRROR_FAILED="$_REPO_URL"
+    __MIRROR_REMAINING=""
+    for __MIRROR in $_MIRRORS_HEALTHY; do
+        [ "$__MIRROR" = "$__MIRROR_FAILED" ] && continue
+        __MIRROR_REMAINING="${__MIRROR_REMAINING} ${__MIRROR}"
+    done
+    _MIRRORS_HEALTHY="${__MIRROR_REMAINING# }"
+
+    [ -n "$_MIRRORS_HEALTHY" ] || return 1
+
+    _REPO_URL="${_MIRRORS_HEALTHY%% *}"
+    __MIRROR_URL="${1%%"://${__MIRROR_FAILED}/"*}://${_REPO_URL}/${1#*"://${__MIRROR_FAILED}/"}"
+    echowarn "Download from mirror ${__MIRROR_FAILED} failed, failing over to ${_REPO_URL}" 1>&2
+    return 0
+}
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __probe_mirrors
+#  DESCRIPTION:  Probe the passed mirrors in parallel and print the healthy ones, fastest first. A mirror is healthy
+#                when it serves the Salt Project GPG key, which every repository setup downloads from it, with a 2xx
+#                or 3xx status within _MIRROR_PROBE_TIMEOUT seconds.
+#   PARAMETERS:  The mirrors to probe
+#----------------------------------------------------------------------------------------------------------------------
+__probe_mirrors() {
+
+    if ! __check_command_exists curl; then
+        echodebug "curl is not available to probe the mirrors, keeping them in the order given"
+        for __MIRROR in "$@"; do
+            echo "$__MIRROR"
+        done
+        return 0
+    fi
+
+    __PROBE_DIR=$(mktemp -d) || return 1
+    __PROBE_IDX=0
+    for __MIRROR in "$@"; do
+        __PROBE_IDX=$((__PROBE_IDX + 1))
+        (
+            # shellcheck disable=SC2086
+            __PROBE_RESULT=$(curl $_CURL_ARGS -s -o /dev/null --max-time "$_MIRROR_PROBE_TIMEOUT" \
+                -w '%{http_code} %{time_total}' "${HTTP_VAL}://${__MIRROR}/api/security/keypair/SaltProjectKey/public" \
+                2>/dev/null)
+            echo "${__PROBE_RESULT} ${__PROBE_IDX} ${__MIRROR}" > "${__PROBE_DIR}/${__PROBE_IDX}"
+        ) &
+    done
+    wait
+
+    # Keep the mirrors which answered with a success or a redirect, fastest first and in the given order on ties
+    cat "${__PROBE_DIR}"/* 2>/dev/null | awk '$1 ~ /^[23][0-9][0-9]$/ { print $2, $3, $4 }' | \
+        sort -k1,1n -k2,2n | awk '{ print $3 }'
+    rm -rf "${__PROBE_DIR}"
+}
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __select_mirror
+#  DESCRIPTION:  Set _REPO_URL to the fastest healthy mirror in _MIRRORS, reusing recent probe results when they were
+#                taken for the same mirrors
+#----------------------------------------------------------------------------------------------------------------------
+__select_mirror() {
+
+    __MIRROR_LIST=$(echo "$_MIRRORS" | tr ',' ' ')
+    if [ "$_CUSTOM_REPO_URL" != "null" ]; then
+        __MIRROR_LIST="${_CUSTOM_REPO_URL} ${__MIRROR_LIST}"
+    fi
+    # shellcheck disable=SC2086
+    __MIRROR_LIST=$(__strip_duplicates $__MIRROR_LIST | tr '\n' ' ')
+    __MIRROR_LIST="${__MIRROR_LIST% }"
+    __MIRROR_NOW=$(date +%s)
+
+    if [ -f "$_MIRROR_CACHE_FILE" ]; then
+        # The first line holds when and for which mirrors the probe ran
+        read -r __MIRROR_CACHE_TIME __MIRROR_CACHE_LIST < "$_MIRROR_CACHE_FILE"
+        if [ "$__MIRROR_CACHE_LIST" = "$__MIRROR_LIST" ] && \
+                [ $((__MIRROR_NOW - ${__MIRROR_CACHE_TIME:-0})) -lt "$_MIRROR_CACHE_TTL" ]; then
+            _MIRRORS_HEALTHY=$(sed 1d "$_MIRROR_CACHE_FILE" | tr '\n' ' ')
+            _MIRRORS_HEALTHY="${_MIRRORS_HEALTHY% }"
+            echodebug "Using the mirror probe results cached in ${_MIRROR_CACHE_FILE}"
+        fi
+    fi
+
+    if [ -z "$_MIRRORS_HEALTHY" ]; then
+        echoinfo "Probing mirrors: ${__MIRROR_LIST}"
+        # shellcheck disable=SC2086
+        _MIRRORS_HEALTHY=$(__probe_mirrors $__MIRROR_LIST | tr '\n' ' ')
+        _MIRRORS_HEALTHY="${_MIRRORS_HEALTHY% }"
+
+        if [ -z "$_MIRRORS_HEALTHY" ]; then
+            echowarn "None of the mirrors answered the probe, trying them in the order given"
+            _MIRRORS_HEALTHY="$__MIRROR_LIST"
+        else
+            __MIRROR_CACHE_DIR=$(dirname "$_MIRROR_CACHE_FILE")
+            if { [ -d "$__MIRROR_CACHE_DIR" ] || mkdir -p "$__MIRROR_CACHE_DIR"; } 2>/dev/null; then
+                {
+                    echo "${__MIRROR_NOW} ${__MIRROR_LIST}"
+                    echo "$_MIRRORS_HEALTHY" | tr ' ' '\n'
+                } > "$_MIRROR_CACHE_FILE" 2>/dev/null || echodebug "Unable to cache the mirror probe results"
+            fi
+        fi
+    fi
+
+    _REPO_URL="${_MIRRORS_HEALTHY%% *}"
+    echoinfo "Using mirror ${_REPO_URL}"
+}
+
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
 #          NAME:  __gather_hardware_info
 #   DESCRIPTION:  Discover hardware information
@@ -996,6 +1484,18 @@ __gather_hardware_info() {
     CPU_VENDOR_ID_L=$( echo "$CPU_VENDOR_ID" | tr '[:upper:]' '[:lower:]' )
     CPU_ARCH=$(uname -m 2>/dev/null || uname -p 2>/dev/null || echo "unknown")
     CPU_ARCH_L=$( echo "$CPU_ARCH" | tr '[:upper:]' '[:lower:]' )
+
+    CPU_CORES=$(getconf _NPROCESSORS_ONLN 2>/dev/null || sysctl -n hw.ncpu 2>/dev/null || echo 1)
+    if [ -f /proc/meminfo ]; then
+        MEM_TOTAL_MB=$(awk '/^MemTotal:/ {print int($2 / 1024); exit}' /proc/meminfo)
+    elif [ -x /usr/sbin/prtconf ]; then
+        MEM_TOTAL_MB=$(/usr/sbin/prtconf 2>/dev/null | awk '/^Memory size:/ {print $3; exit}')
+    else
+        MEM_TOTAL_MB=$(( $(sysctl -n hw.memsize 2>/dev/null || sysctl -n hw.physmem 2>/dev/null || echo 0) / 1048576 ))
+    fi
+    # Never divide by, or tune for, nothing
+    [ "${CPU_CORES:-0}" -ge 1 ] 2>/dev/null || CPU_CORES=1
+    [ "${MEM_TOTAL_MB:-0}" -ge 0 ] 2>/dev/null || MEM_TOTAL_MB=0
 }
 __gather_hardware_info
 
@@ -1752,6 +2252,8 @@ echo
 echoinfo "System Information:"
 echoinfo "  CPU:          ${CPU_VENDOR_ID}"
 echoinfo "  CPU Arch:     ${CPU_ARCH}"
+echoinfo "  CPU Cores:    ${CPU_CORES}"
+echoinfo "  Memory:       ${MEM_TOTAL_MB} MB"
 echoinfo "  OS Name:      ${OS_NAME}"
 echoinfo "  OS Version:   ${OS_VERSION}"
 echoinfo "  Distribution: ${DISTRO_NAME} ${DISTRO_VERSION}"
@@ -1795,6 +2297,16 @@ if [ "${_HTTP_PROXY}" != "" ]; then
     echoinfo "Using http proxy $_HTTP_PROXY"
 fi
 
+# Let bootstrap-salt-loader.sh reuse this copy instead of downloading it again
+if [ "${_LOADER_CACHE_DIR}" != "" ] && [ "$_PLAN" -eq $BS_FALSE ]; then
+    __loader_cache_seed || echowarn "Failed to cache ${__ScriptFullName} in ${_LOADER_CACHE_DIR}"
+fi
+
+# Pick the fastest healthy mirror before anything is downloaded
+if [ "${_MIRRORS}" != "" ] && [ "$_PLAN" -eq $BS_FALSE ]; then
+    __select_mirror
+fi
+
 # Let users know what's going to be installed/configured
 if [ "$_INSTALL_MINION" -eq $BS_TRUE ]; then
     if [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
@@ -1849,6 +2361,12 @@ if [ "$(echo "${DISTRO_NAME_L}" | grep -E '(debian|ubuntu|centos|gentoo|red_hat|
     exit 1
 fi
 
+# The onedir tarball is only published for Linux
+if [ "${ITYPE}" = "onedir_tarball" ] && [ "${OS_NAME_L}" != "linux" ]; then
+    echoerror "${DISTRO_NAME} does not have onedir_tarball support"
+    exit 1
+fi
+
 # Only RedHat based distros have testing support
 if [ "${ITYPE}" = "testing" ]; then
     if [ "$(echo "${DISTRO_NAME_L}" | grep -E '(centos|red_hat|amazon|oracle|almalinux|rocky)')" = "" ]; then
@@ -1905,9 +2423,11 @@ if [ "$ITYPE" = "git" ]; then
     echowarn "at least v${_MINIMUM_PIP_VERSION}, and, in case the setuptools version is also"
     echowarn "too old, it will be upgraded to at least v${_MINIMUM_SETUPTOOLS_VERSION} and less than v${_MAXIMUM_SETUPTOOLS_VERSION}"
     echo
-    echowarn "You have 10 seconds to cancel and stop the bootstrap process..."
-    echo
-    sleep 10
+    if [ "$_PLAN" -eq $BS_FALSE ] && [ "$_NON_INTERACTIVE" -eq $BS_FALSE ]; then
+        echowarn "You have 10 seconds to cancel and stop the bootstrap process..."
+        echo
+        sleep 10
+    fi
     _PIP_ALLOWED=$BS_TRUE
 fi
 
@@ -1970,77 +2490,425 @@ __wait_for_apt(){
 }
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
-#          NAME:  __apt_get_install_noinput
-#   DESCRIPTION:  (DRY) apt-get install with noinput options
+#          NAME:  __lean_track_build_pkgs
+#   DESCRIPTION:  With the lean profile or the cleanup phase, remember which of the packages about to be installed are
+#                 only needed to build Salt and its dependencies, and are not installed yet, so they can be removed
+#                 afterwards
 #    PARAMETERS:  packages
 #----------------------------------------------------------------------------------------------------------------------
-__apt_get_install_noinput() {
+__lean_track_build_pkgs() {
 
-    __wait_for_apt apt-get install -y -o DPkg::Options::=--force-confold "${@}"; return $?
-}   # ----------  end of function __apt_get_install_noinput  ----------
+    [ "$_LEAN" -eq $BS_TRUE ] || [ "$_CLEANUP" -eq $BS_TRUE ] || return 0
+
+    for package in "${@}"; do
+        case "${package}" in
+            gcc|gcc-c++|g++|cpp|make|build-essential|*-dev|*-devel|*-devel.*|linux-headers*|cython* )
+                ;;
+            * )
+                continue
+                ;;
+        esac
+
+        # Packages asked for with -p are kept
+        case " ${_EXTRA_PACKAGES} " in
+            *" ${package} "* )
+                continue
+                ;;
+        esac
+
+        if __check_command_exists dpkg-query; then
+            dpkg-query -W -f='${Status}' "${package}" 2>/dev/null | grep -q "ok installed" && continue
+        elif __check_command_exists rpm; then
+            rpm -q --quiet "${package}" 2>/dev/null && continue
+        fi
+
+        case " ${_LEAN_BUILD_PKGS} " in
+            *" ${package} "* )
+                ;;
+            * )
+                _LEAN_BUILD_PKGS="${_LEAN_BUILD_PKGS:+${_LEAN_BUILD_PKGS} }${package}"
+                ;;
+        esac
+    done
 
+    return 0
+}   # ----------  end of function __lean_track_build_pkgs  ----------
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
-#          NAME:  __apt_get_upgrade_noinput
-#   DESCRIPTION:  (DRY) apt-get upgrade with noinput options
+#          NAME:  __lean_remove_build_pkgs
+#   DESCRIPTION:  Remove the build only packages recorded by __lean_track_build_pkgs
 #----------------------------------------------------------------------------------------------------------------------
-__apt_get_upgrade_noinput() {
+__lean_remove_build_pkgs() {
 
-    __wait_for_apt apt-get upgrade -y -o DPkg::Options::=--force-confold; return $?
-}   # ----------  end of function __apt_get_upgrade_noinput  ----------
+    if __check_command_exists apt-get; then
+        # Salt and its Python modules may link against runtime libraries the build packages pulled in, keep those
+        # shellcheck disable=SC2086
+        __LEAN_KEEP=$(apt-get -s purge --auto-remove ${_LEAN_BUILD_PKGS} 2>/dev/null | \
+            awk '/^Purg/ { print $2 }' | grep -E '^lib' | grep -v -E -- '-dev(:|$)')
+        if [ -n "${__LEAN_KEEP}" ]; then
+            # shellcheck disable=SC2086
+            apt-mark manual ${__LEAN_KEEP} >/dev/null || return 1
+        fi
+        # shellcheck disable=SC2086
+        __wait_for_apt apt-get purge -y --auto-remove ${_LEAN_BUILD_PKGS} || return 1
+    elif __check_command_exists dnf; then
+        # shellcheck disable=SC2086
+        dnf -y remove --setopt=clean_requirements_on_remove=False ${_LEAN_BUILD_PKGS} || return 1
+    elif __check_command_exists tdnf; then
+        # shellcheck disable=SC2086
+        tdnf -y remove ${_LEAN_BUILD_PKGS} || return 1
+    elif __check_command_exists yum; then
+        # shellcheck disable=SC2086
+        yum -y remove ${_LEAN_BUILD_PKGS} || return 1
+    elif __check_command_exists zypper; then
+        # shellcheck disable=SC2086
+        __zypper remove ${_LEAN_BUILD_PKGS} || return 1
+    fi
 
+    return 0
+}   # ----------  end of function __lean_remove_build_pkgs  ----------
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
-#          NAME:  __temp_gpg_pub
-#   DESCRIPTION:  Create a temporary file for downloading a GPG public key.
+#          NAME:  __lean_cleanup
+#   DESCRIPTION:  Remove the build only packages once Salt is installed, clean the package manager caches and report
+#                 how much disk space that reclaimed
 #----------------------------------------------------------------------------------------------------------------------
-__temp_gpg_pub() {
-    if __check_command_exists mktemp; then
-        tempfile="$(mktemp /tmp/salt-gpg-XXXXXXXX.pub 2>/dev/null)"
+__lean_cleanup() {
 
-        if [ -z "$tempfile" ]; then
-            echoerror "Failed to create temporary file in /tmp"
+    __LEAN_USED_BEFORE=$(df -Pk / | awk 'NR==2 { print $3 }')
+
+    if [ -n "${_LEAN_BUILD_PKGS}" ] && __phase_enabled install; then
+        echoinfo "Removing build only packages: ${_LEAN_BUILD_PKGS}"
+        if __lean_remove_build_pkgs; then
+            _LEAN_BUILD_PKGS=""
+        else
+            echowarn "Failed to remove the build only packages"
+        fi
+
+        if __check_command_exists salt-call && ! salt-call --version >/dev/null 2>&1; then
+            echoerror "salt-call no longer runs after removing the build only packages"
             return 1
         fi
-    else
-        tempfile="/tmp/salt-gpg-$$.pub"
     fi
 
-    echo $tempfile
-}   # ----------- end of function __temp_gpg_pub  -----------
+    echoinfo "Cleaning the package manager caches"
+    if __check_command_exists apt-get; then
+        apt-get clean
+    elif __check_command_exists dnf; then
+        dnf clean all >/dev/null
+    elif __check_command_exists tdnf; then
+        tdnf clean all >/dev/null
+    elif __check_command_exists yum; then
+        yum clean all >/dev/null
+    elif __check_command_exists zypper; then
+        __zypper clean --all >/dev/null
+    elif __check_command_exists pacman; then
+        pacman -Scc --noconfirm >/dev/null
+    elif __check_command_exists apk; then
+        rm -rf /var/cache/apk/*
+    fi
 
+    __LEAN_USED_AFTER=$(df -Pk / | awk 'NR==2 { print $3 }')
+    __LEAN_SAVED=$(( (__LEAN_USED_BEFORE - __LEAN_USED_AFTER) * 1024 ))
+    [ "${__LEAN_SAVED}" -lt 0 ] && __LEAN_SAVED=0
+    echoinfo "Lean profile reclaimed ${__LEAN_SAVED} bytes"
+
+    return 0
+}   # ----------  end of function __lean_cleanup  ----------
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
-#          NAME:  __apt_key_fetch
-#   DESCRIPTION:  Download and import GPG public key for "apt-secure"
-#    PARAMETERS:  url
+#          NAME:  __cleanup_track_path
+#   DESCRIPTION:  With the cleanup phase, remember the passed path when it does not exist yet, this script is about to
+#                 create it only to build Salt
+#    PARAMETERS:  path
 #----------------------------------------------------------------------------------------------------------------------
-__apt_key_fetch() {
-
-    url=$1
+__cleanup_track_path() {
 
-    tempfile="$(__temp_gpg_pub)"
-    __fetch_url "$tempfile" "$url" || return 1
-    mkdir -p /etc/apt/keyrings
-    cp -f "$tempfile" /etc/apt/keyrings/salt-archive-keyring.pgp && chmod 644 /etc/apt/keyrings/salt-archive-keyring.pgp || return 1
-    rm -f "$tempfile"
+    [ "$_CLEANUP" -eq $BS_TRUE ] || return 0
+    [ -n "$1" ] && [ "$1" != "/" ] && [ ! -e "$1" ] || return 0
 
+    case " ${_CLEANUP_PATHS} " in
+        *" $1 "* )
+            ;;
+        * )
+            _CLEANUP_PATHS="${_CLEANUP_PATHS:+${_CLEANUP_PATHS} }$1"
+            ;;
+    esac
     return 0
-}   # ----------  end of function __apt_key_fetch  ----------
-
+}   # ----------  end of function __cleanup_track_path  ----------
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
-#          NAME:  __rpm_import_gpg
-#   DESCRIPTION:  Download and import GPG public key to rpm database
-#    PARAMETERS:  url
+#          NAME:  __cleanup_track_pip_cache
+#   DESCRIPTION:  With the cleanup phase, remember pip's cache directory when pip is about to create it
 #----------------------------------------------------------------------------------------------------------------------
-__rpm_import_gpg() {
+__cleanup_track_pip_cache() {
 
-    url=$1
+    __cleanup_track_path "${PIP_CACHE_DIR:-${XDG_CACHE_HOME:-${HOME:-/root}/.cache}/pip}"
+}   # ----------  end of function __cleanup_track_pip_cache  ----------
 
-    tempfile="$(__temp_gpg_pub)"
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __cleanup_build_leftovers
+#   DESCRIPTION:  Remove the build only packages and paths recorded by __lean_track_build_pkgs and __cleanup_track_path,
+#                 make sure Salt still runs and report how much disk space that reclaimed
+#----------------------------------------------------------------------------------------------------------------------
+__cleanup_build_leftovers() {
 
-    __fetch_url "$tempfile" "$url" || return 1
+    if [ "$_VIRTUALENV_DIR" != "null" ]; then
+        __CLEANUP_SALT_CALL="${_VIRTUALENV_DIR}/bin/salt-call"
+    else
+        __CLEANUP_SALT_CALL="salt-call"
+    fi
+
+    __CLEANUP_PKGS_SAVED=0
+    if [ -n "${_LEAN_BUILD_PKGS}" ]; then
+        echoinfo "Removing build only packages: ${_LEAN_BUILD_PKGS}"
+        __CLEANUP_USED_BEFORE=$(df -Pk / | awk 'NR==2 { print $3 }')
+        if ! __lean_remove_build_pkgs; then
+            echoerror "Failed to remove the build only packages"
+            return 1
+        fi
+        _LEAN_BUILD_PKGS=""
+        __CLEANUP_USED_AFTER=$(df -Pk / | awk 'NR==2 { print $3 }')
+        __CLEANUP_PKGS_SAVED=$(( (__CLEANUP_USED_BEFORE - __CLEANUP_USED_AFTER) * 1024 ))
+        [ "${__CLEANUP_PKGS_SAVED}" -lt 0 ] && __CLEANUP_PKGS_SAVED=0
+    fi
+
+    __CLEANUP_PATHS_SAVED=0
+    if [ -n "${_CLEANUP_PATHS}" ]; then
+        # Do not stand in a directory which is about to be removed
+        cd / || return 1
+        for __CLEANUP_PATH in ${_CLEANUP_PATHS}; do
+            [ -e "${__CLEANUP_PATH}" ] || continue
+            __CLEANUP_PATH_KB=$(du -sk "${__CLEANUP_PATH}" 2>/dev/null | awk '{ print $1 }')
+            echoinfo "Removing ${__CLEANUP_PATH}"
+            if ! rm -rf "${__CLEANUP_PATH}"; then
+                echoerror "Failed to remove ${__CLEANUP_PATH}"
+                return 1
+            fi
+            __CLEANUP_PATHS_SAVED=$(( __CLEANUP_PATHS_SAVED + ${__CLEANUP_PATH_KB:-0} * 1024 ))
+        done
+        _CLEANUP_PATHS=""
+    fi
+
+    if __check_command_exists "${__CLEANUP_SALT_CALL}" && ! "${__CLEANUP_SALT_CALL}" --version >/dev/null 2>&1; then
+        echoerror "${__CLEANUP_SALT_CALL} no longer runs after the cleanup"
+        return 1
+    fi
+
+    __CLEANUP_SAVED=$(( __CLEANUP_PKGS_SAVED + __CLEANUP_PATHS_SAVED ))
+    echoinfo "Cleanup reclaimed ${__CLEANUP_SAVED} bytes, ${__CLEANUP_PKGS_SAVED} from packages and ${__CLEANUP_PATHS_SAVED} from build paths"
+
+    return 0
+}   # ----------  end of function __cleanup_build_leftovers  ----------
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __salt_service_enabled
+#   DESCRIPTION:  Check if the passed salt daemon is started at boot
+#    PARAMETERS:  daemon name, i.e. minion
+#----------------------------------------------------------------------------------------------------------------------
+__salt_service_enabled() {
+
+    if __check_command_exists systemctl; then
+        systemctl is-enabled --quiet "salt-$1.service" >/dev/null 2>&1
+    elif __check_command_exists rc-update; then
+        [ "$(ls /etc/runlevels/*/"salt-$1" 2>/dev/null)" != "" ]
+    else
+        [ "$(ls /etc/rc[2-5].d/S*"salt-$1" 2>/dev/null)" != "" ]
+    fi
+}
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __salt_service_boot
+#   DESCRIPTION:  Enable or disable starting the passed salt daemon at boot, with whichever init system is in use
+#    PARAMETERS:  daemon name, i.e. minion, and enable or disable
+#----------------------------------------------------------------------------------------------------------------------
+__salt_service_boot() {
+
+    if __check_command_exists systemctl; then
+        systemctl "$2" "salt-$1.service" >/dev/null 2>&1
+    elif __check_command_exists rc-update; then
+        if [ "$2" = "enable" ]; then
+            rc-update add "salt-$1" >/dev/null 2>&1
+        else
+            rc-update del "salt-$1" >/dev/null 2>&1
+        fi
+    elif __check_command_exists update-rc.d; then
+        update-rc.d "salt-$1" "$2" >/dev/null 2>&1
+    elif __check_command_exists chkconfig; then
+        if [ "$2" = "enable" ]; then
+            chkconfig "salt-$1" on >/dev/null 2>&1
+        else
+            chkconfig "salt-$1" off >/dev/null 2>&1
+        fi
+    else
+        echowarn "Unable to $2 salt-$1 at boot, no supported init system found"
+        return 1
+    fi
+}
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __bake_reset_identity
+#   DESCRIPTION:  Leave a baked image warm but without any host identity: stop the daemons the packages started and
+#                 disable them, so the image does not start them unconfigured at boot, load Salt once so its modules
+#                 are compiled in the image, then remove the minion id, the master address and the keys, which the
+#                 personalize phase sets at first boot
+#----------------------------------------------------------------------------------------------------------------------
+__bake_reset_identity() {
+
+    # Only the daemons enabled at boot are enabled again when personalizing, salt-api for one is opt-in
+    _BAKED_SERVICES=""
+    for fname in api syndic master minion; do
+        if __check_command_exists systemctl; then
+            systemctl stop "salt-$fname.service" >/dev/null 2>&1
+        elif [ -x "/etc/init.d/salt-$fname" ]; then
+            "/etc/init.d/salt-$fname" stop >/dev/null 2>&1
+        fi
+        __salt_service_enabled "$fname" || continue
+        echoinfo "Disabling salt-$fname at boot until the image is personalized"
+        __salt_service_boot "$fname" disable || return 1
+        _BAKED_SERVICES="${_BAKED_SERVICES:+${_BAKED_SERVICES} }${fname}"
+    done
+
+    if [ "$_VIRTUALENV_DIR" != "null" ]; then
+        __BAKE_SALT_CALL="${_VIRTUALENV_DIR}/bin/salt-call"
+    else
+        __BAKE_SALT_CALL="salt-call"
+    fi
+    if __check_command_exists "${__BAKE_SALT_CALL}"; then
+        echoinfo "Pre-warming ${__BAKE_SALT_CALL}"
+        "${__BAKE_SALT_CALL}" --local --log-level=quiet test.version >/dev/null 2>&1 || \
+            echowarn "Failed to pre-warm ${__BAKE_SALT_CALL}"
+    fi
+
+    # Whatever identifies this host, or the other hosts its master knew about
+    echoinfo "Removing the minion id, master address and keys from the image"
+    rm -f "$_SALT_ETC_DIR/minion_id" "$_SALT_ETC_DIR/minion.d/99-master-address.conf" \
+        "$_PKI_DIR/minion/minion.pem" "$_PKI_DIR/minion/minion.pub" "$_PKI_DIR/minion/minion_master.pub" \
+        "$_PKI_DIR/master/master.pem" "$_PKI_DIR/master/master.pub" || return 1
+    for __BAKE_KEYS_DIR in minions minions_pre minions_rejected minions_denied minions_autosign; do
+        if [ -d "$_PKI_DIR/master/${__BAKE_KEYS_DIR}" ]; then
+            find "$_PKI_DIR/master/${__BAKE_KEYS_DIR}" -type f -exec rm -f {} + || return 1
+        fi
+    done
+    rm -rf "$_SALT_CACHE_DIR/minion/proc" "$_SALT_CACHE_DIR/minion/grains.cache.p" || return 1
+
+    return 0
+}   # ----------  end of function __bake_reset_identity  ----------
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __personalize_enable_services
+#   DESCRIPTION:  Enable the daemons __bake_reset_identity disabled at boot again, once the image is personalized
+#----------------------------------------------------------------------------------------------------------------------
+__personalize_enable_services() {
+
+    for fname in ${_BAKED_SERVICES}; do
+        echoinfo "Enabling salt-$fname at boot"
+        __salt_service_boot "$fname" enable || return 1
+    done
+    _BAKED_SERVICES=""
+
+    return 0
+}   # ----------  end of function __personalize_enable_services  ----------
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __apt_get_install_noinput
+#   DESCRIPTION:  (DRY) apt-get install with noinput options
+#    PARAMETERS:  packages
+#----------------------------------------------------------------------------------------------------------------------
+__apt_get_install_noinput() {
+
+    __lean_track_build_pkgs "${@}"
+    # shellcheck disable=SC2086
+    __wait_for_apt apt-get install -y ${_APT_INSTALL_ARGS} -o DPkg::Options::=--force-confold "${@}"; return $?
+}   # ----------  end of function __apt_get_install_noinput  ----------
+
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __apt_get_upgrade_noinput
+#   DESCRIPTION:  (DRY) apt-get upgrade with noinput options
+#----------------------------------------------------------------------------------------------------------------------
+__apt_get_upgrade_noinput() {
+
+    __wait_for_apt apt-get upgrade -y -o DPkg::Options::=--force-confold; return $?
+}   # ----------  end of function __apt_get_upgrade_noinput  ----------
+
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __temp_gpg_pub
+#   DESCRIPTION:  Create a temporary file for downloading a GPG public key.
+#----------------------------------------------------------------------------------------------------------------------
+__temp_gpg_pub() {
+    if __check_command_exists mktemp; then
+        tempfile="$(mktemp /tmp/salt-gpg-XXXXXXXX.pub 2>/dev/null)"
+
+        if [ -z "$tempfile" ]; then
+            echoerror "Failed to create temporary file in /tmp"
+            return 1
+        fi
+    else
+        tempfile="/tmp/salt-gpg-$$.pub"
+    fi
+
+    echo $tempfile
+}   # ----------- end of function __temp_gpg_pub  -----------
+
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __apt_key_fetch
+#   DESCRIPTION:  Download and import GPG public key for "apt-secure"
+#    PARAMETERS:  url
+#----------------------------------------------------------------------------------------------------------------------
+__apt_key_fetch() {
+
+    url=$1
+
+    tempfile="$(__temp_gpg_pub)"
+    __fetch_url "$tempfile" "$url" || return 1
+    mkdir -p /etc/apt/keyrings
+    cp -f "$tempfile" /etc/apt/keyrings/salt-archive-keyring.pgp && chmod 644 /etc/apt/keyrings/salt-archive-keyring.pgp || return 1
+    rm -f "$tempfile"
+
+    return 0
+}   # ----------  end of function __apt_key_fetch  ----------
+
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __apt_salt_sources
+#   DESCRIPTION:  Write /etc/apt/sources.list.d/salt.sources. SaltStack's own definition is used with the default
+#                 repository, a custom repository or mirror gets the same definition pointing at it.
+#----------------------------------------------------------------------------------------------------------------------
+__apt_salt_sources() {
+
+    if [ "$_REPO_URL" = "packages.broadcom.com/artifactory" ]; then
+        __fetch_url "/etc/apt/sources.list.d/salt.sources" \
+            "https://github.com/saltstack/salt-install-guide/releases/latest/download/salt.sources"
+        return $?
+    fi
+
+    cat > /etc/apt/sources.list.d/salt.sources << _eof
+X-Repolib-Name: Salt Project
+Description: Salt has many possible uses, including configuration management.
+Types: deb
+URIs: ${HTTP_VAL}://${_REPO_URL}/saltproject-deb
+Signed-By: /etc/apt/keyrings/salt-archive-keyring.pgp
+Suites: stable
+Components: main
+_eof
+}   # ----------  end of function __apt_salt_sources  ----------
+
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __rpm_import_gpg
+#   DESCRIPTION:  Download and import GPG public key to rpm database
+#    PARAMETERS:  url
+#----------------------------------------------------------------------------------------------------------------------
+__rpm_import_gpg() {
+
+    url=$1
+
+    tempfile="$(__temp_gpg_pub)"
+
+    __fetch_url "$tempfile" "$url" || return 1
 
     # At least on CentOS 8, a missing newline at the end causes:
     #   error: /tmp/salt-gpg-n1gKUb1u.pub: key 1 not an armored public key.
@@ -2060,13 +2928,16 @@ __rpm_import_gpg() {
 #----------------------------------------------------------------------------------------------------------------------
 __yum_install_noinput() {
 
+    __lean_track_build_pkgs "${@}"
     if [ "$DISTRO_NAME_L" = "oracle_linux" ]; then
         # We need to install one package at a time because --enablerepo=X disables ALL OTHER REPOS!!!!
         for package in "${@}"; do
-            yum -y install "${package}" || yum -y install "${package}" || return $?
+            # shellcheck disable=SC2086
+            yum -y install ${_DNF_INSTALL_ARGS} "${package}" || yum -y install ${_DNF_INSTALL_ARGS} "${package}" || return $?
         done
     else
-        yum -y install "${@}" || return $?
+        # shellcheck disable=SC2086
+        yum -y install ${_DNF_INSTALL_ARGS} "${@}" || return $?
     fi
 }   # ----------  end of function __yum_install_noinput  ----------
 
@@ -2076,7 +2947,9 @@ __yum_install_noinput() {
 #----------------------------------------------------------------------------------------------------------------------
 __dnf_install_noinput() {
 
-    dnf -y install "${@}" || return $?
+    __lean_track_build_pkgs "${@}"
+    # shellcheck disable=SC2086
+    dnf -y install ${_DNF_INSTALL_ARGS} "${@}" || return $?
 }   # ----------  end of function __dnf_install_noinput  ----------
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
@@ -2085,7 +2958,9 @@ __dnf_install_noinput() {
 #----------------------------------------------------------------------------------------------------------------------
 __tdnf_install_noinput() {
 
-    tdnf -y install "${@}" || return $?
+    __lean_track_build_pkgs "${@}"
+    # shellcheck disable=SC2086
+    tdnf -y install ${_DNF_INSTALL_ARGS} "${@}" || return $?
 }   # ----------  end of function __tdnf_install_noinput  ----------
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
@@ -2112,6 +2987,8 @@ __git_clone_and_checkout() {
     __SALT_GIT_CHECKOUT_PARENT_DIR="${__SALT_GIT_CHECKOUT_PARENT_DIR:-/tmp/git}"
     __SALT_CHECKOUT_REPONAME="$(basename "${_SALT_GIT_CHECKOUT_DIR}" 2>/dev/null)"
     __SALT_CHECKOUT_REPONAME="${__SALT_CHECKOUT_REPONAME:-salt}"
+    __cleanup_track_path "${__SALT_GIT_CHECKOUT_PARENT_DIR}"
+    __cleanup_track_path "${_SALT_GIT_CHECKOUT_DIR}"
     [ -d "${__SALT_GIT_CHECKOUT_PARENT_DIR}" ] || mkdir "${__SALT_GIT_CHECKOUT_PARENT_DIR}"
     # shellcheck disable=SC2164
     cd "${__SALT_GIT_CHECKOUT_PARENT_DIR}"
@@ -2378,15 +3255,14 @@ __linkfile() {
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
 #          NAME:  __overwriteconfig()
-#   DESCRIPTION:  Simple function to overwrite master or minion config files.
+#   DESCRIPTION:  Overwrite master or minion config files with the YAML rendering of JSON strings. Every pair is
+#                 rendered by a single python process, and nothing is written unless all of them parse.
+#    PARAMETERS:  configfile jsonstring [configfile jsonstring ...]
 #----------------------------------------------------------------------------------------------------------------------
 __overwriteconfig() {
-    if [ $# -eq 2 ]; then
-        target=$1
-        json=$2
-    else
-        echoerror "Wrong number of arguments for __convert_json_to_yaml_str()"
-        echoinfo "USAGE: __convert_json_to_yaml_str <configfile> <jsonstring>"
+    if [ $# -eq 0 ] || [ $(( $# % 2 )) -ne 0 ]; then
+        echoerror "Wrong number of arguments for __overwriteconfig()"
+        echoinfo "USAGE: __overwriteconfig <configfile> <jsonstring> [<configfile> <jsonstring> ...]"
         exit 1
     fi
 
@@ -2402,8 +3278,11 @@ __overwriteconfig() {
         tempfile="/tmp/salt-config-$$"
     fi
 
-    if [ -n "$_PY_EXE" ]; then
+    # The -x python wins when it has yaml, otherwise the onedir python, which always ships it, when salt is installed
+    if [ -n "$_PY_EXE" ] && "$_PY_EXE" -c "import yaml" 2> /dev/null; then
         good_python="$_PY_EXE"
+    elif [ -x /opt/saltstack/salt/bin/python3 ]; then
+        good_python=/opt/saltstack/salt/bin/python3
     # If python does not have yaml installed we're on Arch and should use python2
     # but no more support, hence error out
     elif python -c "import yaml" 2> /dev/null; then
@@ -2413,9 +3292,31 @@ __overwriteconfig() {
         echoerror "Python 2 is no longer supported, only Python 3"
         return 1
     fi
-
-    # Convert json string to a yaml string and write it to config file. Output is dumped into tempfile.
-    "$good_python" -c "import json; import yaml; jsn=json.loads('$json'); yml=yaml.safe_dump(jsn, line_break='\\n', default_flow_style=False, sort_keys=False); config_file=open('$target', 'w'); config_file.write(yml); config_file.close();" 2>"$tempfile"
+    echodebug "Rendering $(( $# / 2 )) config file(s) using $good_python"
+
+    # Convert the json strings, passed as arguments, to yaml and replace every config file with a rename so nothing
+    # reading them sees a partial file. Output is dumped into tempfile.
+    "$good_python" -c "
+import json, os, sys, tempfile, yaml
+args = sys.argv[1:]
+rendered = [
+    (target, yaml.safe_dump(json.loads(jsn), line_break='\n', default_flow_style=False, sort_keys=False))
+    for target, jsn in zip(args[::2], args[1::2])
+]
+umask = os.umask(0)
+os.umask(umask)
+for target, yml in rendered:
+    mode = os.stat(target).st_mode & 0o7777 if os.path.exists(target) else 0o666 & ~umask
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.' + os.path.basename(target) + '.')
+    try:
+        with os.fdopen(fd, 'w') as config_file:
+            config_file.write(yml)
+        os.chmod(tmp, mode)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+" "$@" 2>"$tempfile"
 
     # No python errors output to the tempfile
     if [ ! -s "$tempfile" ]; then
@@ -2644,6 +3545,7 @@ __install_pip_pkgs() {
     fi
 
     __check_pip_allowed
+    __cleanup_track_pip_cache
 
     # Install pip and pip dependencies
     if ! __check_command_exists "${_pip_cmd} --version"; then
@@ -2668,6 +3570,8 @@ __install_pip_pkgs() {
     echoinfo "Installing pip packages: ${_pip_pkgs} using ${_py_exe}"
     # shellcheck disable=SC2086
     ${_pip_cmd} install ${_pip_pkgs} || return 1
+
+    __precompile_salt "${_py_exe}"
 }
 
 
@@ -2678,6 +3582,8 @@ __install_pip_pkgs() {
 #----------------------------------------------------------------------------------------------------------------------
 __install_pip_deps() {
 
+    __cleanup_track_pip_cache
+
     # Install virtualenv to system pip before activating virtualenv if thats going to be used
     # We assume pip pkg is installed since that is distro specific
     if [ "$_VIRTUALENV_DIR" != "null" ]; then
@@ -2704,7 +3610,10 @@ __install_pip_deps() {
     fi
 
     # shellcheck disable=SC2086,SC2090
-    pip install -U -r ${requirements_file} ${__PIP_PACKAGES}
+    pip install -U -r ${requirements_file} ${__PIP_PACKAGES} || return 1
+
+    # The virtualenv is active, its interpreter is the one the packages went into
+    __precompile_salt python
 }   # ----------  end of function __install_pip_deps  ----------
 
 #---  FUNCTION  -------------------------------------------------------------------------------------------------------
@@ -2722,6 +3631,7 @@ __install_salt_from_repo() {
     fi
 
     echodebug "__install_salt_from_repo py_exe=$_py_exe"
+    __cleanup_track_pip_cache
 
     _py_version=$(${_py_exe} -c "import sys; print('{0}.{1}'.format(*sys.version_info))")
     _pip_cmd="pip${_py_version}"
@@ -2762,6 +3672,7 @@ __install_salt_from_repo() {
     echoinfo "Installing salt using ${_py_exe}, $(${_py_exe} --version)"
     cd "${_SALT_GIT_CHECKOUT_DIR}" || return 1
 
+    __cleanup_track_path /tmp/git/deps
     mkdir -p /tmp/git/deps
     echodebug "Created directory /tmp/git/deps"
 
@@ -2842,9 +3753,57 @@ EOM
     if ! ${_py_exe} -c "$CHECK_SALT_SCRIPT"; then
         return 1
     fi
+
+    __precompile_salt "${_py_exe}"
     return 0
 }   # ----------  end of function __install_salt_from_repo  ----------
 
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __precompile_salt
+#   DESCRIPTION:  Compile the installed Salt tree and the dependencies installed next to it to bytecode, using all
+#                 cores, so the first daemon start does not have to. Without Salt installed yet, as after pip
+#                 installing its dependencies, only the interpreter's library directories are compiled. Failures are
+#                 not fatal, Python compiles whatever is left on import.
+#    PARAMETERS:  py_exe
+#----------------------------------------------------------------------------------------------------------------------
+__precompile_salt() {
+
+    _py_exe="$1"
+
+    if [ "$_PRECOMPILE" -eq $BS_FALSE ]; then
+        echodebug "Not precompiling Salt to bytecode on request"
+        return 0
+    fi
+
+    # The directory salt was installed into, plus the interpreter's own library directories
+    _precompile_dirs=$(${_py_exe} -c '
+import importlib.util, os, sysconfig
+spec = importlib.util.find_spec("salt")
+if spec is not None and spec.origin:
+    print(os.path.dirname(os.path.dirname(spec.origin)))
+print(sysconfig.get_path("purelib"))
+print(sysconfig.get_path("platlib"))
+' 2>/dev/null)
+    if [ -z "${_precompile_dirs}" ]; then
+        echowarn "Unable to find where ${_py_exe} installs packages, not precompiling them to bytecode"
+        return 0
+    fi
+
+    _precompile_start=$(date +%s)
+    # shellcheck disable=SC2086
+    for _precompile_dir in $(__strip_duplicates ${_precompile_dirs}); do
+        [ -d "${_precompile_dir}" ] || continue
+        echoinfo "Precompiling ${_precompile_dir} to bytecode"
+        # -j 0 uses all the available cores
+        if ! ${_py_exe} -m compileall -q -j 0 "${_precompile_dir}" >/dev/null 2>&1; then
+            echowarn "Some modules in ${_precompile_dir} failed to precompile, they will be compiled on first import"
+        fi
+    done
+    echodebug "Precompiling took $(( $(date +%s) - _precompile_start )) seconds"
+
+    return 0
+}   # ----------  end of function __precompile_salt  ----------
+
 
 # shellcheck disable=SC2268
 if [ "x${_PY_MAJOR_VERSION}" = "x" ]; then
@@ -2859,6 +3818,11 @@ fi
 #
 #   In order to install salt for a distribution you need to define:
 #
+#   The distribution agnostic onedir_tarball install type instead defines
+#   install_onedir_tarball_deps, install_onedir_tarball, install_onedir_tarball_post,
+#   install_onedir_tarball_restart_daemons and install_onedir_tarball_check_services,
+#   and uses daemons_running_onedir, which take precedence over all of the below.
+#
 #   To Install Dependencies, which is required, one of:
 #       1. install_<distro>_<major_version>_<install_type>_deps
 #       2. install_<distro>_<major_version>_<minor_version>_<install_type>_deps
@@ -2920,6 +3884,8 @@ fi
 #       6. daemons_running_<distro>
 #       7. daemons_running  [THIS ONE IS ALREADY DEFINED AS THE DEFAULT]
 #
+#       NOTE: daemons_running_<install_type> is looked up before all of the above.
+#
 #   Optionally, check enabled Services:
 #       1. install_<distro>_<major_version>_<install_type>_check_services
 #       2. install_<distro>_<major_version>_<minor_version>_<install_type>_check_services
@@ -2963,8 +3929,11 @@ __install_saltstack_ubuntu_repository() {
         echowarn "Non-LTS Ubuntu detected, but stable packages requested. Trying packages for previous LTS release. You may experience problems."
     fi
 
-    # Install downloader backend for GPG keys fetching
+    # Install downloader backend for GPG keys fetching, the lean profile makes do with curl
     __PACKAGES='wget'
+    if [ "$_LEAN" -eq $BS_TRUE ] && __check_command_exists curl; then
+        __PACKAGES=''
+    fi
 
     # Required as it is not installed by default on Ubuntu 18+
     if [ "$DISTRO_MAJOR_VERSION" -ge 18 ]; then
@@ -2990,7 +3959,7 @@ __install_saltstack_ubuntu_repository() {
     fi
 
     # SaltStack's stable Ubuntu repository:
-    __fetch_url "/etc/apt/sources.list.d/salt.sources" "https://github.com/saltstack/salt-install-guide/releases/latest/download/salt.sources"
+    __apt_salt_sources || return 1
     __apt_key_fetch "${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" || return 1
     __wait_for_apt apt-get update || return 1
 
@@ -3020,8 +3989,11 @@ __install_saltstack_ubuntu_onedir_repository() {
         echowarn "Non-LTS Ubuntu detected, but stable packages requested. Trying packages for previous LTS release. You may experience problems."
     fi
 
-    # Install downloader backend for GPG keys fetching
+    # Install downloader backend for GPG keys fetching, the lean profile makes do with curl
     __PACKAGES='wget'
+    if [ "$_LEAN" -eq $BS_TRUE ] && __check_command_exists curl; then
+        __PACKAGES=''
+    fi
 
     # Required as it is not installed by default on Ubuntu 18+
     if [ "$DISTRO_MAJOR_VERSION" -ge 18 ]; then
@@ -3042,7 +4014,7 @@ __install_saltstack_ubuntu_onedir_repository() {
     __apt_get_install_noinput ${__PACKAGES} || return 1
 
     # SaltStack's stable Ubuntu repository:
-    __fetch_url "/etc/apt/sources.list.d/salt.sources" "https://github.com/saltstack/salt-install-guide/releases/latest/download/salt.sources"
+    __apt_salt_sources || return 1
     __apt_key_fetch "${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" || return 1
     __wait_for_apt apt-get update || return 1
 
@@ -3477,8 +4449,11 @@ __install_saltstack_debian_repository() {
         return 1
     fi
 
-    # Install downloader backend for GPG keys fetching
+    # Install downloader backend for GPG keys fetching, the lean profile makes do with curl
     __PACKAGES='wget'
+    if [ "$_LEAN" -eq $BS_TRUE ] && __check_command_exists curl; then
+        __PACKAGES=''
+    fi
 
     # Required as it is not installed by default on Debian 9+
     if [ "$DISTRO_MAJOR_VERSION" -ge 9 ]; then
@@ -3493,7 +4468,7 @@ __install_saltstack_debian_repository() {
     # shellcheck disable=SC2086,SC2090
     __apt_get_install_noinput ${__PACKAGES} || return 1
 
-    __fetch_url "/etc/apt/sources.list.d/salt.sources" "https://github.com/saltstack/salt-install-guide/releases/latest/download/salt.sources"
+    __apt_salt_sources || return 1
     __apt_key_fetch "${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" || return 1
     __wait_for_apt apt-get update || return 1
 
@@ -3522,8 +4497,11 @@ __install_saltstack_debian_onedir_repository() {
         return 1
     fi
 
-    # Install downloader backend for GPG keys fetching
+    # Install downloader backend for GPG keys fetching, the lean profile makes do with curl
     __PACKAGES='wget'
+    if [ "$_LEAN" -eq $BS_TRUE ] && __check_command_exists curl; then
+        __PACKAGES=''
+    fi
 
     # Required as it is not installed by default on Debian 9+
     if [ "$DISTRO_MAJOR_VERSION" -ge 9 ]; then
@@ -3538,7 +4516,7 @@ __install_saltstack_debian_onedir_repository() {
     # shellcheck disable=SC2086,SC2090
     __apt_get_install_noinput ${__PACKAGES} || return 1
 
-    __fetch_url "/etc/apt/sources.list.d/salt.sources" "https://github.com/saltstack/salt-install-guide/releases/latest/download/salt.sources"
+    __apt_salt_sources || return 1
     __apt_key_fetch "${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" || return 1
     __wait_for_apt apt-get update || return 1
 
@@ -3894,13 +4872,13 @@ __install_saltstack_fedora_onedir_repository() {
                 echo "[salt-repo-${ONEDIR_REV_DOT}-lts]" > "${YUM_REPO_FILE}"
                 # shellcheck disable=SC2129
                 echo "name=Salt Repo for Salt v${ONEDIR_REV_DOT} LTS" >> "${YUM_REPO_FILE}"
-                echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                 echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                 echo "priority=10" >> "${YUM_REPO_FILE}"
                 echo "enabled=1" >> "${YUM_REPO_FILE}"
                 echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                 echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
-                echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
             fi
         else
             # Enable the Salt LATEST repo
@@ -4215,13 +5193,13 @@ __install_saltstack_rhel_onedir_repository() {
                 echo "[salt-repo-${ONEDIR_REV_DOT}-lts]" > "${YUM_REPO_FILE}"
                 # shellcheck disable=SC2129
                 echo "name=Salt Repo for Salt v${ONEDIR_REV_DOT} LTS" >> "${YUM_REPO_FILE}"
-                echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                 echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                 echo "priority=10" >> "${YUM_REPO_FILE}"
                 echo "enabled=1" >> "${YUM_REPO_FILE}"
                 echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                 echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
-                echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
             fi
         else
             # Enable the Salt LATEST repo
@@ -5629,51 +6607,51 @@ install_amazon_linux_ami_2_deps() {
                         # Enable the Salt 3007 STS repo
                         echo "[salt-repo-3007-sts]" > "${YUM_REPO_FILE}"
                         echo "name=Salt Repo for Salt v3007 STS" >> "${YUM_REPO_FILE}"
-                        echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                        echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                         echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                         echo "priority=10" >> "${YUM_REPO_FILE}"
                         echo "enabled=1" >> "${YUM_REPO_FILE}"
                         echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                         echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
                         echo "exclude=*3006* *3008* *3009* *3010*" >> "${YUM_REPO_FILE}"
-                        echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                        echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
                     else
                         # Salt 3006 repo
                         echo "[salt-repo-3006-lts]" > "${YUM_REPO_FILE}"
                         echo "name=Salt Repo for Salt v3006 LTS" >> "${YUM_REPO_FILE}"
-                        echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                        echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                         echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                         echo "priority=10" >> "${YUM_REPO_FILE}"
                         echo "enabled=1" >> "${YUM_REPO_FILE}"
                         echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                         echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
                         echo "exclude=*3007* *3008* *3009* *3010*" >> "${YUM_REPO_FILE}"
-                        echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                        echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
                     fi
                 elif [ "$(echo "$STABLE_REV" | grep -E '^([3-9][0-5]{2}[6-9](\.[0-9]*)?)')" != "" ]; then
                     # using minor version
                     STABLE_REV_DOT=$(echo "$STABLE_REV" | sed 's/-/\./')
                     echo "[salt-repo-${STABLE_REV_DOT}-lts]" > "${YUM_REPO_FILE}"
                     echo "name=Salt Repo for Salt v${STABLE_REV_DOT} LTS" >> "${YUM_REPO_FILE}"
-                    echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                    echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                     echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                     echo "priority=10" >> "${YUM_REPO_FILE}"
                     echo "enabled=1" >> "${YUM_REPO_FILE}"
                     echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                     echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
-                    echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                    echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
                 fi
             else
                 # Enable the Salt LATEST repo
                 echo "[salt-repo-latest]" > "${YUM_REPO_FILE}"
                 echo "name=Salt Repo for Salt LATEST release" >> "${YUM_REPO_FILE}"
-                echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                 echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                 echo "priority=10" >> "${YUM_REPO_FILE}"
                 echo "enabled=1" >> "${YUM_REPO_FILE}"
                 echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                 echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
-                echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
             fi
             yum clean expire-cache || return 1
             yum makecache || return 1
@@ -5719,51 +6697,51 @@ install_amazon_linux_ami_2_onedir_deps() {
                         # Enable the Salt 3007 STS repo
                         echo "[salt-repo-3007-sts]" > "${YUM_REPO_FILE}"
                         echo "name=Salt Repo for Salt v3007 STS" >> "${YUM_REPO_FILE}"
-                        echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                        echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                         echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                         echo "priority=10" >> "${YUM_REPO_FILE}"
                         echo "enabled=1" >> "${YUM_REPO_FILE}"
                         echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                         echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
                         echo "exclude=*3006* *3008* *3009* *3010*" >> "${YUM_REPO_FILE}"
-                        echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                        echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
                     else
                         # Salt 3006 repo
                         echo "[salt-repo-3006-lts]" > "${YUM_REPO_FILE}"
                         echo "name=Salt Repo for Salt v3006 LTS" >> "${YUM_REPO_FILE}"
-                        echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                        echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                         echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                         echo "priority=10" >> "${YUM_REPO_FILE}"
                         echo "enabled=1" >> "${YUM_REPO_FILE}"
                         echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                         echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
                         echo "exclude=*3007* *3008* *3009* *3010*" >> "${YUM_REPO_FILE}"
-                        echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                        echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
                     fi
                 elif [ "$(echo "$ONEDIR_REV" | grep -E '^([3-9][0-5]{2}[6-9](\.[0-9]*)?)')" != "" ]; then
                     # using minor version
                     ONEDIR_REV_DOT=$(echo "$ONEDIR_REV" | sed 's/-/\./')
                     echo "[salt-repo-${ONEDIR_REV_DOT}-lts]" > "${YUM_REPO_FILE}"
                     echo "name=Salt Repo for Salt v${ONEDIR_REV_DOT} LTS" >> "${YUM_REPO_FILE}"
-                    echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                    echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                     echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                     echo "priority=10" >> "${YUM_REPO_FILE}"
                     echo "enabled=1" >> "${YUM_REPO_FILE}"
                     echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                     echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
-                    echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                    echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
                 fi
             else
                 # Enable the Salt LATEST repo
                 echo "[salt-repo-latest]" > "${YUM_REPO_FILE}"
                 echo "name=Salt Repo for Salt LATEST release" >> "${YUM_REPO_FILE}"
-                echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                 echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                 echo "priority=10" >> "${YUM_REPO_FILE}"
                 echo "enabled=1" >> "${YUM_REPO_FILE}"
                 echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                 echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
-                echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
             fi
             yum clean expire-cache || return 1
             yum makecache || return 1
@@ -5901,51 +6879,51 @@ install_amazon_linux_ami_2023_onedir_deps() {
                         # Enable the Salt 3007 STS repo
                         echo "[salt-repo-3007-sts]" > "${YUM_REPO_FILE}"
                         echo "name=Salt Repo for Salt v3007 STS" >> "${YUM_REPO_FILE}"
-                        echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                        echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                         echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                         echo "priority=10" >> "${YUM_REPO_FILE}"
                         echo "enabled=1" >> "${YUM_REPO_FILE}"
                         echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                         echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
                         echo "exclude=*3006* *3008* *3009* *3010*" >> "${YUM_REPO_FILE}"
-                        echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                        echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
                     else
                         # Salt 3006 repo
                         echo "[salt-repo-3006-lts]" > "${YUM_REPO_FILE}"
                         echo "name=Salt Repo for Salt v3006 LTS" >> "${YUM_REPO_FILE}"
-                        echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                        echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                         echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                         echo "priority=10" >> "${YUM_REPO_FILE}"
                         echo "enabled=1" >> "${YUM_REPO_FILE}"
                         echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                         echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
                         echo "exclude=*3007* *3008* *3009* *3010*" >> "${YUM_REPO_FILE}"
-                        echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                        echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
                     fi
                 elif [ "$(echo "$ONEDIR_REV" | grep -E '^([3-9][0-5]{2}[6-9](\.[0-9]*)?)')" != "" ]; then
                     # using minor version
                     ONEDIR_REV_DOT=$(echo "$ONEDIR_REV" | sed 's/-/\./')
                     echo "[salt-repo-${ONEDIR_REV_DOT}-lts]" > "${YUM_REPO_FILE}"
                     echo "name=Salt Repo for Salt v${ONEDIR_REV_DOT} LTS" >> "${YUM_REPO_FILE}"
-                    echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                    echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                     echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                     echo "priority=10" >> "${YUM_REPO_FILE}"
                     echo "enabled=1" >> "${YUM_REPO_FILE}"
                     echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                     echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
-                    echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                    echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
                 fi
             else
                 # Enable the Salt LATEST repo
                 echo "[salt-repo-latest]" > "${YUM_REPO_FILE}"
                 echo "name=Salt Repo for Salt LATEST release" >> "${YUM_REPO_FILE}"
-                echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                 echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                 echo "priority=10" >> "${YUM_REPO_FILE}"
                 echo "enabled=1" >> "${YUM_REPO_FILE}"
                 echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                 echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
-                echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
             fi
             yum clean expire-cache || return 1
             yum makecache || return 1
@@ -6280,7 +7258,7 @@ __get_packagesite_onedir_latest() {
     cd  ${generic_versions_tmpdir} || return 1
 
     # leverage the windows directories since release Windows and Linux
-    wget -q -r -np -nH --exclude-directories=onedir,relenv,macos -x -l 1 "https://${_REPO_URL}/saltproject-generic/windows/"
+    wget -q -r -np -nH --exclude-directories=onedir,relenv,macos -x -l 1 "${HTTP_VAL}://${_REPO_URL}/saltproject-generic/windows/"
     if [ "$#" -gt 0 ] && [ -n "$1" ]; then
         MAJOR_VER="$1"
         # shellcheck disable=SC2010
@@ -6321,39 +7299,39 @@ __install_saltstack_photon_onedir_repository() {
                     ## tdnf config-manager --set-enabled salt-repo-3007-sts
                     echo "[salt-repo-3007-sts]" > "${YUM_REPO_FILE}"
                     echo "name=Salt Repo for Salt v3007 STS" >> "${YUM_REPO_FILE}"
-                    echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                    echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                     echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                     echo "priority=10" >> "${YUM_REPO_FILE}"
                     echo "enabled=1" >> "${YUM_REPO_FILE}"
                     echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                     echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
                     echo "exclude=*3006* *3008* *3009* *3010*" >> "${YUM_REPO_FILE}"
-                    echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                    echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
                 else
                     # Salt 3006 repo
                     echo "[salt-repo-3006-lts]" > "${YUM_REPO_FILE}"
                     echo "name=Salt Repo for Salt v3006 LTS" >> "${YUM_REPO_FILE}"
-                    echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                    echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                     echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                     echo "priority=10" >> "${YUM_REPO_FILE}"
                     echo "enabled=1" >> "${YUM_REPO_FILE}"
                     echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                     echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
                     echo "exclude=*3007* *3008* *3009* *3010*" >> "${YUM_REPO_FILE}"
-                    echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                    echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
                 fi
             elif [ "$(echo "$ONEDIR_REV" | grep -E '^([3-9][0-5]{2}[6-9](\.[0-9]*)?)')" != "" ]; then
                 # using minor version
                 ONEDIR_REV_DOT=$(echo "$ONEDIR_REV" | sed 's/-/\./')
                 echo "[salt-repo-${ONEDIR_REV_DOT}-lts]" > "${YUM_REPO_FILE}"
                 echo "name=Salt Repo for Salt v${ONEDIR_REV_DOT} LTS" >> "${YUM_REPO_FILE}"
-                echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+                echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
                 echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
                 echo "priority=10" >> "${YUM_REPO_FILE}"
                 echo "enabled=1" >> "${YUM_REPO_FILE}"
                 echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
                 echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
-                echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+                echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
             fi
         else
             # Enable the Salt LATEST repo
@@ -6361,13 +7339,13 @@ __install_saltstack_photon_onedir_repository() {
             ## tdnf config-manager --set-enabled salt-repo-latest
             echo "[salt-repo-latest]" > "${YUM_REPO_FILE}"
             echo "name=Salt Repo for Salt LATEST release" >> "${YUM_REPO_FILE}"
-            echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
+            echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${YUM_REPO_FILE}"
             echo "skip_if_unavailable=True" >> "${YUM_REPO_FILE}"
             echo "priority=10" >> "${YUM_REPO_FILE}"
             echo "enabled=1" >> "${YUM_REPO_FILE}"
             echo "enabled_metadata=1" >> "${YUM_REPO_FILE}"
             echo "gpgcheck=1" >> "${YUM_REPO_FILE}"
-            echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
+            echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${YUM_REPO_FILE}"
         fi
         tdnf makecache || return 1
     elif [ "$ONEDIR_REV" != "latest" ]; then
@@ -6711,27 +7689,27 @@ __check_and_refresh_suse_pkg_repo() {
                     # Enable the Salt 3007 STS repo
                     echo "[salt-repo-3007-sts]" > "${ZYPPER_REPO_FILE}"
                     echo "name=Salt Repo for Salt v3007 STS" >> "${ZYPPER_REPO_FILE}"
-                    echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${ZYPPER_REPO_FILE}"
+                    echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${ZYPPER_REPO_FILE}"
                     echo "skip_if_unavailable=True" >> "${ZYPPER_REPO_FILE}"
                     echo "priority=10" >> "${ZYPPER_REPO_FILE}"
                     echo "enabled=1" >> "${ZYPPER_REPO_FILE}"
                     echo "enabled_metadata=1" >> "${ZYPPER_REPO_FILE}"
                     echo "exclude=*3006* *3008* *3009* *3010*" >> "${ZYPPER_REPO_FILE}"
                     echo "gpgcheck=1" >> "${ZYPPER_REPO_FILE}"
-                    echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${ZYPPER_REPO_FILE}"
+                    echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${ZYPPER_REPO_FILE}"
                     zypper addlock "salt-* < 3007" && zypper addlock "salt-* >= 3008"
                 else
                     # Salt 3006 repo
                     echo "[salt-repo-3006-lts]" > "${ZYPPER_REPO_FILE}"
                     echo "name=Salt Repo for Salt v3006 LTS" >> "${ZYPPER_REPO_FILE}"
-                    echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${ZYPPER_REPO_FILE}"
+                    echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${ZYPPER_REPO_FILE}"
                     echo "skip_if_unavailable=True" >> "${ZYPPER_REPO_FILE}"
                     echo "priority=10" >> "${ZYPPER_REPO_FILE}"
                     echo "enabled=1" >> "${ZYPPER_REPO_FILE}"
                     echo "enabled_metadata=1" >> "${ZYPPER_REPO_FILE}"
                     echo "exclude=*3007* *3008* *3009* *3010*" >> "${ZYPPER_REPO_FILE}"
                     echo "gpgcheck=1" >> "${ZYPPER_REPO_FILE}"
-                    echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${ZYPPER_REPO_FILE}"
+                    echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${ZYPPER_REPO_FILE}"
                     zypper addlock "salt-* < 3006" && zypper addlock "salt-* >= 3007"
                 fi
             elif [ "$(echo "$ONEDIR_REV" | grep -E '^([3-9][0-5]{2}[6-9](\.[0-9]*)?)')" != "" ]; then
@@ -6739,13 +7717,13 @@ __check_and_refresh_suse_pkg_repo() {
                 ONEDIR_REV_DOT=$(echo "$ONEDIR_REV" | sed 's/-/\./')
                 echo "[salt-repo-${ONEDIR_REV_DOT}-lts]" > "${ZYPPER_REPO_FILE}"
                 echo "name=Salt Repo for Salt v${ONEDIR_REV_DOT} LTS" >> "${ZYPPER_REPO_FILE}"
-                echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${ZYPPER_REPO_FILE}"
+                echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${ZYPPER_REPO_FILE}"
                 echo "skip_if_unavailable=True" >> "${ZYPPER_REPO_FILE}"
                 echo "priority=10" >> "${ZYPPER_REPO_FILE}"
                 echo "enabled=1" >> "${ZYPPER_REPO_FILE}"
                 echo "enabled_metadata=1" >> "${ZYPPER_REPO_FILE}"
                 echo "gpgcheck=1" >> "${ZYPPER_REPO_FILE}"
-                echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${ZYPPER_REPO_FILE}"a
+                echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${ZYPPER_REPO_FILE}"a
                 ONEDIR_MAJ_VER=$(echo "${ONEDIR_REV_DOT}" | awk -F '.' '{print $1}')
                 # shellcheck disable=SC2004
                 ONEDIR_MAJ_VER_PLUS=$((${ONEDIR_MAJ_VER} + 1))
@@ -6755,13 +7733,13 @@ __check_and_refresh_suse_pkg_repo() {
             # Enable the Salt LATEST repo
             echo "[salt-repo-latest]" > "${ZYPPER_REPO_FILE}"
             echo "name=Salt Repo for Salt LATEST release" >> "${ZYPPER_REPO_FILE}"
-            echo "baseurl=https://${_REPO_URL}/saltproject-rpm/" >> "${ZYPPER_REPO_FILE}"
+            echo "baseurl=${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/" >> "${ZYPPER_REPO_FILE}"
             echo "skip_if_unavailable=True" >> "${ZYPPER_REPO_FILE}"
             echo "priority=10" >> "${ZYPPER_REPO_FILE}"
             echo "enabled=1" >> "${ZYPPER_REPO_FILE}"
             echo "enabled_metadata=1" >> "${ZYPPER_REPO_FILE}"
             echo "gpgcheck=1" >> "${ZYPPER_REPO_FILE}"
-            echo "gpgkey=https://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${ZYPPER_REPO_FILE}"
+            echo "gpgkey=${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public" >> "${ZYPPER_REPO_FILE}"
         fi
         __zypper addrepo --refresh "${ZYPPER_REPO_FILE}" || return 1
     fi
@@ -6798,6 +7776,7 @@ __zypper() {
 }
 
 __zypper_install() {
+    __lean_track_build_pkgs "${@}"
     if [ "${__ZYPPER_REQUIRES_REPLACE_FILES}" = "-1" ]; then
         __version_lte "1.10.4" "$(zypper --version | awk '{ print $2 }')"
     fi
@@ -6805,9 +7784,11 @@ __zypper_install() {
         # In case of file conflicts replace old files.
         # Option present in zypper 1.10.4 and newer:
         # https://github.com/openSUSE/zypper/blob/95655728d26d6d5aef7796b675f4cc69bc0c05c0/package/zypper.changes#L253
-        __zypper install --auto-agree-with-licenses --replacefiles "${@}"; return $?
+        # shellcheck disable=SC2086
+        __zypper install --auto-agree-with-licenses --replacefiles ${_ZYPPER_INSTALL_ARGS} "${@}"; return $?
     else
-        __zypper install --auto-agree-with-licenses "${@}"; return $?
+        # shellcheck disable=SC2086
+        __zypper install --auto-agree-with-licenses ${_ZYPPER_INSTALL_ARGS} "${@}"; return $?
     fi
 }
 
@@ -7753,7 +8734,7 @@ __macosx_get_packagesite_onedir() {
     _PKG_VERSION=""
 
     _ONEDIR_TYPE="saltproject-generic"
-    SALT_MACOS_PKGDIR_URL="https://${_REPO_URL}/${_ONEDIR_TYPE}/macos"
+    SALT_MACOS_PKGDIR_URL="${HTTP_VAL}://${_REPO_URL}/${_ONEDIR_TYPE}/macos"
     if [ "$(echo "$_ONEDIR_REV" | grep -E '^(latest)$')" != "" ]; then
         __macosx_get_packagesite_onedir_latest
     elif [ "$(echo "$_ONEDIR_REV" | grep -E '^(3006|3007)$')" != "" ]; then
@@ -7904,81 +8885,445 @@ install_macosx_restart_daemons() {
 
 #######################################################################################################################
 #
-#   Default minion configuration function. Matches ANY distribution as long as
-#   the -c options is passed.
+#   Onedir Tarball Install Functions. Matches ANY Linux distribution, the system package
+#   manager is never used.
 #
-config_salt() {
 
-    # If the configuration directory is not passed, return
-    [ "$_TEMP_CONFIG_DIR" = "null" ] && return
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __onedir_tarball_details
+#   DESCRIPTION:  Set _ONEDIR_TARBALL_URL and _ONEDIR_TARBALL_SHA256 for the requested version and architecture
+#----------------------------------------------------------------------------------------------------------------------
+__onedir_tarball_details() {
 
-    if [ "$_CONFIG_ONLY" -eq $BS_TRUE ]; then
-        echowarn "Passing -C (config only) option implies -F (forced overwrite)."
+    case "${CPU_ARCH_L}" in
+        amd64|x86_64 )
+            _ONEDIR_TARBALL_ARCH="x86_64"
+            ;;
+        arm64|aarch64 )
+            _ONEDIR_TARBALL_ARCH="aarch64"
+            ;;
+        * )
+            echoerror "There is no onedir tarball for the ${CPU_ARCH_L} architecture"
+            return 1
+            ;;
+    esac
 
-        if [ "$_FORCE_OVERWRITE" -ne $BS_TRUE ]; then
-            echowarn "Overwriting configs in 11 seconds!"
-            sleep 11
-            _FORCE_OVERWRITE=$BS_TRUE
-        fi
+    if [ "$(echo "$ONEDIR_REV" | grep -E '^(latest|3006|3007)$')" != "" ] && ! __check_command_exists wget; then
+        echoerror "Resolving the latest onedir version requires 'wget', pass a full version instead, i.e. 3007.1"
+        return 1
     fi
 
-    # Let's create the necessary directories
-    [ -d "$_SALT_ETC_DIR" ] || mkdir "$_SALT_ETC_DIR" || return 1
-    [ -d "$_PKI_DIR" ] || (mkdir -p "$_PKI_DIR" && chmod 700 "$_PKI_DIR") || return 1
+    if [ "$(echo "$ONEDIR_REV" | grep -E '^(latest)$')" != "" ]; then
+        __get_packagesite_onedir_latest || return 1
+    elif [ "$(echo "$ONEDIR_REV" | grep -E '^(3006|3007)$')" != "" ]; then
+        # need to get latest for major version
+        __get_packagesite_onedir_latest "$ONEDIR_REV" || return 1
+    else
+        _GENERIC_PKG_VERSION="$ONEDIR_REV"
+    fi
 
-    # If -C or -F was passed, we don't need a .bak file for the config we're updating
-    # This is used in the custom master/minion config file checks below
-    CREATE_BAK=$BS_TRUE
-    if [ "$_FORCE_OVERWRITE" -eq $BS_TRUE ]; then
-        CREATE_BAK=$BS_FALSE
+    if [ -z "${_GENERIC_PKG_VERSION}" ]; then
+        echoerror "Unable to determine the onedir version to install for ${ONEDIR_REV}"
+        return 1
     fi
 
-    CONFIGURED_ANYTHING=$BS_FALSE
+    _ONEDIR_TARBALL_FILE="salt-${_GENERIC_PKG_VERSION}-onedir-linux-${_ONEDIR_TARBALL_ARCH}.tar.xz"
 
-    # Copy the grains file if found
-    if [ -f "$_TEMP_CONFIG_DIR/grains" ]; then
-        echodebug "Moving provided grains file from $_TEMP_CONFIG_DIR/grains to $_SALT_ETC_DIR/grains"
-        __movefile "$_TEMP_CONFIG_DIR/grains" "$_SALT_ETC_DIR/grains" || return 1
-        CONFIGURED_ANYTHING=$BS_TRUE
+    # Artifactory's storage API returns the checksums of the stored artifact
+    __TARBALL_STORAGE=$(mktemp) || return 1
+    __fetch_url "${__TARBALL_STORAGE}" "${HTTP_VAL}://${_REPO_URL}/api/storage/saltproject-generic/onedir/${_GENERIC_PKG_VERSION}/${_ONEDIR_TARBALL_FILE}"
+    _ONEDIR_TARBALL_SHA256=$(sed -n 's/.*"sha256"[[:space:]]*:[[:space:]]*"\([0-9a-f]\{64\}\)".*/\1/p' "${__TARBALL_STORAGE}" | head -n 1)
+    rm -f "${__TARBALL_STORAGE}"
+
+    # Built once the checksum was fetched, in case that failed over to another mirror
+    _ONEDIR_TARBALL_URL="${HTTP_VAL}://${_REPO_URL}/saltproject-generic/onedir/${_GENERIC_PKG_VERSION}/${_ONEDIR_TARBALL_FILE}"
+
+    if [ -z "${_ONEDIR_TARBALL_SHA256}" ]; then
+        echoerror "Unable to retrieve the sha256 sum of ${_ONEDIR_TARBALL_FILE}"
+        return 1
     fi
 
-    if [ "$_INSTALL_MINION" -eq $BS_TRUE ] || \
-        [ "$_CONFIG_ONLY" -eq $BS_TRUE ] || [ "$_CUSTOM_MINION_CONFIG" != "null" ]; then
-        # Create the PKI directory
-        [ -d "$_PKI_DIR/minion" ] || (mkdir -p "$_PKI_DIR/minion" && chmod 700 "$_PKI_DIR/minion") || return 1
+    echodebug "Onedir tarball ${_ONEDIR_TARBALL_URL} sha256 ${_ONEDIR_TARBALL_SHA256}"
+    return 0
+}
 
-        # Check to see if a custom minion config json dict was provided
-        if [ "$_CUSTOM_MINION_CONFIG" != "null" ]; then
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __onedir_tarball_extract
+#   DESCRIPTION:  Download and verify the onedir tarball, then extract it into the passed directory
+#    PARAMETERS:  destination directory
+#----------------------------------------------------------------------------------------------------------------------
+__onedir_tarball_extract() {
 
-            # Check if a minion config file already exists and move to .bak if needed
-            if [ -f "$_SALT_ETC_DIR/minion" ] && [ "$CREATE_BAK" -eq "$BS_TRUE" ]; then
-                __movefile "$_SALT_ETC_DIR/minion" "$_SALT_ETC_DIR/minion.bak" "$BS_TRUE" || return 1
-                CONFIGURED_ANYTHING=$BS_TRUE
-            fi
+    tarball_dest="$1"
+    tarball_tmpdir=$(mktemp -d /tmp/salt-onedir-XXXXXXXX) || return 1
 
-            # Overwrite/create the config file with the yaml string
-            __overwriteconfig "$_SALT_ETC_DIR/minion" "$_CUSTOM_MINION_CONFIG" || return 1
-            CONFIGURED_ANYTHING=$BS_TRUE
+    if xz --help 2>/dev/null | grep -q -- '--threads'; then
+        tarball_xz="xz -d -c -T0"
+    else
+        tarball_xz="xz -d -c"
+    fi
 
-        # Copy the minions configuration if found
-        # Explicitly check for custom master config to avoid moving the minion config
-        elif [ -f "$_TEMP_CONFIG_DIR/minion" ] && [ "$_CUSTOM_MASTER_CONFIG" = "null" ]; then
-            __movefile "$_TEMP_CONFIG_DIR/minion" "$_SALT_ETC_DIR" "$_FORCE_OVERWRITE" || return 1
-            CONFIGURED_ANYTHING=$BS_TRUE
-        fi
+    # Downloaded in the current shell, so a mirror failover sticks, and verified before anything is extracted
+    if ! __fetch_url "${tarball_tmpdir}/${_ONEDIR_TARBALL_FILE}" "${_ONEDIR_TARBALL_URL}"; then
+        rm -fR "${tarball_tmpdir}"
+        return 1
+    fi
 
-        # Copy the minion's keys if found
-        if [ -f "$_TEMP_CONFIG_DIR/minion.pem" ]; then
-            __movefile "$_TEMP_CONFIG_DIR/minion.pem" "$_PKI_DIR/minion/" "$_FORCE_OVERWRITE" || return 1
-            chmod 400 "$_PKI_DIR/minion/minion.pem" || return 1
-            CONFIGURED_ANYTHING=$BS_TRUE
-        fi
-        if [ -f "$_TEMP_CONFIG_DIR/minion.pub" ]; then
-            __movefile "$_TEMP_CONFIG_DIR/minion.pub" "$_PKI_DIR/minion/" "$_FORCE_OVERWRITE" || return 1
-            chmod 664 "$_PKI_DIR/minion/minion.pub" || return 1
-            CONFIGURED_ANYTHING=$BS_TRUE
-        fi
-        # For multi-master-pki, copy the master_sign public key if found
+    tarball_sum=$(__sha256 "${tarball_tmpdir}/${_ONEDIR_TARBALL_FILE}")
+    if [ "${tarball_sum}" != "${_ONEDIR_TARBALL_SHA256}" ]; then
+        echoerror "Checksum mismatch for ${_ONEDIR_TARBALL_FILE}: expected ${_ONEDIR_TARBALL_SHA256}, got ${tarball_sum}"
+        rm -fR "${tarball_tmpdir}"
+        return 1
+    fi
+
+    # Extract into a staging directory so a failed extraction never leaves a partial install behind
+    mkdir -p "${tarball_tmpdir}/extract"
+    # shellcheck disable=SC2086
+    ${tarball_xz} < "${tarball_tmpdir}/${_ONEDIR_TARBALL_FILE}" | tar -xf - -C "${tarball_tmpdir}/extract"
+    if [ $? -ne 0 ] || [ ! -d "${tarball_tmpdir}/extract/salt" ]; then
+        echoerror "Failed to extract ${_ONEDIR_TARBALL_FILE}"
+        rm -fR "${tarball_tmpdir}"
+        return 1
+    fi
+
+    mkdir -p "$(dirname "${tarball_dest}")" || return 1
+    rm -fR "${tarball_dest}"
+    mv "${tarball_tmpdir}/extract/salt" "${tarball_dest}" || return 1
+    rm -fR "${tarball_tmpdir}"
+
+    return 0
+}
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __onedir_tarball_systemd_unit
+#   DESCRIPTION:  Write the systemd unit for the passed salt daemon
+#    PARAMETERS:  daemon name, one of api, master, minion or syndic
+#----------------------------------------------------------------------------------------------------------------------
+__onedir_tarball_systemd_unit() {
+
+    fname="$1"
+
+    case "$fname" in
+        master )
+            unit_after="network.target"
+            unit_type="notify"
+            unit_nofile="100000"
+            ;;
+        minion )
+            unit_after="network.target salt-master.service"
+            unit_type="notify"
+            unit_nofile="8192"
+            ;;
+        * )
+            unit_after="network.target"
+            unit_type="simple"
+            unit_nofile="8192"
+            ;;
+    esac
+
+    [ -f "/etc/systemd/system/salt-${fname}.service" ] && [ "$_FORCE_OVERWRITE" -ne $BS_TRUE ] && return 0
+    [ -d /etc/systemd/system ] || mkdir -p /etc/systemd/system || return 1
+
+    cat <<_eof > "/etc/systemd/system/salt-${fname}.service"
+[Unit]
+Description=The Salt ${fname}
+Documentation=man:salt-${fname}(1) https://docs.saltproject.io/en/latest/contents.html
+After=${unit_after}
+
+[Service]
+KillMode=process
+Type=${unit_type}
+NotifyAccess=all
+LimitNOFILE=${unit_nofile}
+ExecStart=/usr/bin/salt-${fname}
+
+[Install]
+WantedBy=multi-user.target
+_eof
+}
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __onedir_tarball_sysvinit_script
+#   DESCRIPTION:  Write the sysvinit script for the passed salt daemon
+#    PARAMETERS:  daemon name, one of api, master, minion or syndic
+#----------------------------------------------------------------------------------------------------------------------
+__onedir_tarball_sysvinit_script() {
+
+    fname="$1"
+
+    [ -f "/etc/init.d/salt-${fname}" ] && [ "$_FORCE_OVERWRITE" -ne $BS_TRUE ] && return 0
+
+    cat <<_eof > "/etc/init.d/salt-${fname}"
+#!/bin/sh
+### BEGIN INIT INFO
+# Provides:          salt-${fname}
+# Required-Start:    \$remote_fs \$network
+# Required-Stop:     \$remote_fs \$network
+# Default-Start:     2 3 4 5
+# Default-Stop:      0 1 6
+# Short-Description: The Salt ${fname}
+### END INIT INFO
+
+PIDFILE="/var/run/salt-${fname}.pid"
+
+case "\$1" in
+    start)
+        /usr/bin/salt-${fname} -d
+        ;;
+    stop)
+        [ -f "\$PIDFILE" ] && kill "\$(cat "\$PIDFILE")"
+        rm -f "\$PIDFILE"
+        ;;
+    restart)
+        "\$0" stop
+        sleep 1
+        "\$0" start
+        ;;
+    status)
+        [ -f "\$PIDFILE" ] && kill -0 "\$(cat "\$PIDFILE")" 2>/dev/null
+        ;;
+    *)
+        echo "Usage: \$0 {start|stop|restart|status}"
+        exit 1
+        ;;
+esac
+_eof
+    chmod +x "/etc/init.d/salt-${fname}"
+}
+
+install_onedir_tarball_deps() {
+
+    # Never install anything, only make sure the tools needed to fetch and extract the tarball are present
+    for tool in tar xz; do
+        if ! __check_command_exists "$tool"; then
+            echoerror "The onedir_tarball install type requires '$tool' to be installed"
+            return 1
+        fi
+    done
+
+    if ! __check_command_exists curl && ! __check_command_exists wget; then
+        echoerror "The onedir_tarball install type requires either 'curl' or 'wget' to be installed"
+        return 1
+    fi
+
+    if [ "${_UPGRADE_SYS}" -eq $BS_TRUE ]; then
+        echowarn "The onedir_tarball install type never uses the system package manager, ignoring -U"
+    fi
+
+    if [ "${_EXTRA_PACKAGES}" != "" ]; then
+        echowarn "The onedir_tarball install type never uses the system package manager, ignoring -p ${_EXTRA_PACKAGES}"
+    fi
+
+    return 0
+}
+
+install_onedir_tarball() {
+
+    __onedir_tarball_details || return 1
+
+    echoinfo "Installing ${_ONEDIR_TARBALL_FILE} into /opt/saltstack/salt"
+    __onedir_tarball_extract /opt/saltstack/salt || return 1
+
+    for fname in call api cloud cp key master minion run ssh syndic; do
+        # Only link the entry points of what is being installed
+        [ $fname = "api" ] && [ "$_INSTALL_SALT_API" -eq $BS_FALSE ] && continue
+        [ $fname = "cloud" ] && [ "$_INSTALL_CLOUD" -eq $BS_FALSE ] && continue
+        [ $fname = "minion" ] && [ "$_INSTALL_MINION" -eq $BS_FALSE ] && continue
+        [ $fname = "syndic" ] && [ "$_INSTALL_SYNDIC" -eq $BS_FALSE ] && continue
+        if [ $fname = "master" ] || [ $fname = "key" ] || [ $fname = "run" ] || [ $fname = "cp" ] || [ $fname = "ssh" ]; then
+            [ "$_INSTALL_MASTER" -eq $BS_FALSE ] && continue
+        fi
+
+        [ -f "/opt/saltstack/salt/salt-${fname}" ] || continue
+        __linkfile "/opt/saltstack/salt/salt-${fname}" "/usr/bin/salt-${fname}" "$BS_TRUE" || return 1
+    done
+
+    if [ "$_INSTALL_MASTER" -eq $BS_TRUE ] && [ -f /opt/saltstack/salt/salt ]; then
+        __linkfile /opt/saltstack/salt/salt /usr/bin/salt "$BS_TRUE" || return 1
+    fi
+
+    return 0
+}
+
+install_onedir_tarball_post() {
+
+    [ -d "$_SALT_ETC_DIR/minion.d" ] || mkdir -p "$_SALT_ETC_DIR/minion.d" || return 1
+    [ -d "$_SALT_ETC_DIR/master.d" ] || mkdir -p "$_SALT_ETC_DIR/master.d" || return 1
+    [ -d "$_PKI_DIR" ] || (mkdir -p "$_PKI_DIR" && chmod 700 "$_PKI_DIR") || return 1
+    [ -d "$_SALT_CACHE_DIR" ] || mkdir -p "$_SALT_CACHE_DIR" || return 1
+    [ -d /var/log/salt ] || mkdir -p /var/log/salt || return 1
+
+    for fname in api master minion syndic; do
+        # Skip if not meant to be installed
+        [ $fname = "api" ] && [ "$_INSTALL_SALT_API" -eq $BS_FALSE ] && continue
+        [ $fname = "master" ] && [ "$_INSTALL_MASTER" -eq $BS_FALSE ] && continue
+        [ $fname = "minion" ] && [ "$_INSTALL_MINION" -eq $BS_FALSE ] && continue
+        [ $fname = "syndic" ] && [ "$_INSTALL_SYNDIC" -eq $BS_FALSE ] && continue
+
+        if [ "$_SYSTEMD_FUNCTIONAL" -eq $BS_TRUE ]; then
+            __onedir_tarball_systemd_unit "$fname" || return 1
+
+            # Skip salt-api since the service should be opt-in and not necessarily started on boot
+            [ $fname = "api" ] && continue
+
+            # systemd may not be running while baking an image, enabling the unit still works then
+            systemctl daemon-reload > /dev/null 2>&1
+            systemctl is-enabled salt-$fname.service > /dev/null 2>&1 || systemctl enable salt-$fname.service > /dev/null 2>&1
+        elif [ -d /etc/init.d ]; then
+            __onedir_tarball_sysvinit_script "$fname" || return 1
+
+            # Skip salt-api since the service should be opt-in and not necessarily started on boot
+            [ $fname = "api" ] && continue
+
+            if __check_command_exists update-rc.d; then
+                update-rc.d salt-$fname defaults
+            elif __check_command_exists chkconfig; then
+                chkconfig --add salt-$fname
+            fi
+        fi
+    done
+
+    return 0
+}
+
+install_onedir_tarball_restart_daemons() {
+
+    [ "$_START_DAEMONS" -eq $BS_FALSE ] && return
+
+    for fname in api master minion syndic; do
+        # Skip salt-api since the service should be opt-in and not necessarily started on boot
+        [ $fname = "api" ] && continue
+
+        # Skip if not meant to be installed
+        [ $fname = "master" ] && [ "$_INSTALL_MASTER" -eq $BS_FALSE ] && continue
+        [ $fname = "minion" ] && [ "$_INSTALL_MINION" -eq $BS_FALSE ] && continue
+        [ $fname = "syndic" ] && [ "$_INSTALL_SYNDIC" -eq $BS_FALSE ] && continue
+
+        if [ "$_SYSTEMD_FUNCTIONAL" -eq $BS_TRUE ]; then
+            systemctl stop salt-$fname > /dev/null 2>&1
+            systemctl start salt-$fname.service && continue
+            echodebug "Failed to start salt-$fname using systemd"
+        fi
+
+        if [ -x /etc/init.d/salt-$fname ]; then
+            /etc/init.d/salt-$fname stop > /dev/null 2>&1
+            /etc/init.d/salt-$fname start && continue
+        fi
+
+        # Containers usually have no init system at all, daemonize directly
+        echodebug "Starting salt-$fname directly"
+        /usr/bin/salt-$fname -d || return 1
+    done
+
+    return 0
+}
+
+install_onedir_tarball_check_services() {
+
+    for fname in api master minion syndic; do
+        # Skip salt-api since the service should be opt-in and not necessarily started on boot
+        [ $fname = "api" ] && continue
+
+        # Skip if not meant to be installed
+        [ $fname = "minion" ] && [ "$_INSTALL_MINION" -eq $BS_FALSE ] && continue
+        [ $fname = "master" ] && [ "$_INSTALL_MASTER" -eq $BS_FALSE ] && continue
+        [ $fname = "syndic" ] && [ "$_INSTALL_SYNDIC" -eq $BS_FALSE ] && continue
+
+        if [ "$_SYSTEMD_FUNCTIONAL" -eq $BS_TRUE ]; then
+            __check_services_systemd salt-$fname || return 1
+        fi
+    done
+
+    return 0
+}
+
+#
+#   Ended Onedir Tarball Install Functions
+#
+#######################################################################################################################
+
+#######################################################################################################################
+#
+#   Default minion configuration function. Matches ANY distribution as long as
+#   the -c options is passed.
+#
+config_salt() {
+
+    # If the configuration directory is not passed, return
+    [ "$_TEMP_CONFIG_DIR" = "null" ] && return
+
+    if [ "$_CONFIG_ONLY" -eq $BS_TRUE ]; then
+        echowarn "Passing -C (config only) option implies -F (forced overwrite)."
+
+        if [ "$_FORCE_OVERWRITE" -ne $BS_TRUE ]; then
+            if [ "$_NON_INTERACTIVE" -eq $BS_FALSE ]; then
+                echowarn "Overwriting configs in 11 seconds!"
+                sleep 11
+            fi
+            _FORCE_OVERWRITE=$BS_TRUE
+        fi
+    fi
+
+    # Let's create the necessary directories
+    [ -d "$_SALT_ETC_DIR" ] || mkdir "$_SALT_ETC_DIR" || return 1
+    [ -d "$_PKI_DIR" ] || (mkdir -p "$_PKI_DIR" && chmod 700 "$_PKI_DIR") || return 1
+
+    # If -C or -F was passed, we don't need a .bak file for the config we're updating
+    # This is used in the custom master/minion config file checks below
+    CREATE_BAK=$BS_TRUE
+    if [ "$_FORCE_OVERWRITE" -eq $BS_TRUE ]; then
+        CREATE_BAK=$BS_FALSE
+    fi
+
+    CONFIGURED_ANYTHING=$BS_FALSE
+
+    # The -j and -J configs to render, all at once after the keys and the other configs are in place
+    set --
+
+    # Copy the grains file if found
+    if [ -f "$_TEMP_CONFIG_DIR/grains" ]; then
+        echodebug "Moving provided grains file from $_TEMP_CONFIG_DIR/grains to $_SALT_ETC_DIR/grains"
+        __movefile "$_TEMP_CONFIG_DIR/grains" "$_SALT_ETC_DIR/grains" || return 1
+        CONFIGURED_ANYTHING=$BS_TRUE
+    fi
+
+    if [ "$_INSTALL_MINION" -eq $BS_TRUE ] || \
+        [ "$_CONFIG_ONLY" -eq $BS_TRUE ] || [ "$_CUSTOM_MINION_CONFIG" != "null" ]; then
+        # Create the PKI directory
+        [ -d "$_PKI_DIR/minion" ] || (mkdir -p "$_PKI_DIR/minion" && chmod 700 "$_PKI_DIR/minion") || return 1
+
+        # Check to see if a custom minion config json dict was provided
+        if [ "$_CUSTOM_MINION_CONFIG" != "null" ]; then
+
+            # Check if a minion config file already exists and move to .bak if needed
+            if [ -f "$_SALT_ETC_DIR/minion" ] && [ "$CREATE_BAK" -eq "$BS_TRUE" ]; then
+                __movefile "$_SALT_ETC_DIR/minion" "$_SALT_ETC_DIR/minion.bak" "$BS_TRUE" || return 1
+                CONFIGURED_ANYTHING=$BS_TRUE
+            fi
+
+            # Overwrite/create the config file with the yaml string
+            set -- "$@" "$_SALT_ETC_DIR/minion" "$_CUSTOM_MINION_CONFIG"
+            CONFIGURED_ANYTHING=$BS_TRUE
+
+        # Copy the minions configuration if found
+        # Explicitly check for custom master config to avoid moving the minion config
+        elif [ -f "$_TEMP_CONFIG_DIR/minion" ] && [ "$_CUSTOM_MASTER_CONFIG" = "null" ]; then
+            __movefile "$_TEMP_CONFIG_DIR/minion" "$_SALT_ETC_DIR" "$_FORCE_OVERWRITE" || return 1
+            CONFIGURED_ANYTHING=$BS_TRUE
+        fi
+
+        # Copy the minion's keys if found
+        if [ -f "$_TEMP_CONFIG_DIR/minion.pem" ]; then
+            __movefile "$_TEMP_CONFIG_DIR/minion.pem" "$_PKI_DIR/minion/" "$_FORCE_OVERWRITE" || return 1
+            chmod 400 "$_PKI_DIR/minion/minion.pem" || return 1
+            CONFIGURED_ANYTHING=$BS_TRUE
+        fi
+        if [ -f "$_TEMP_CONFIG_DIR/minion.pub" ]; then
+            __movefile "$_TEMP_CONFIG_DIR/minion.pub" "$_PKI_DIR/minion/" "$_FORCE_OVERWRITE" || return 1
+            chmod 664 "$_PKI_DIR/minion/minion.pub" || return 1
+            CONFIGURED_ANYTHING=$BS_TRUE
+        fi
+        # For multi-master-pki, copy the master_sign public key if found
         if [ -f "$_TEMP_CONFIG_DIR/master_sign.pub" ]; then
             __movefile "$_TEMP_CONFIG_DIR/master_sign.pub" "$_PKI_DIR/minion/" || return 1
             chmod 664 "$_PKI_DIR/minion/master_sign.pub" || return 1
@@ -8013,7 +9358,7 @@ config_salt() {
             fi
 
             # Overwrite/create the config file with the yaml string
-            __overwriteconfig "$_SALT_ETC_DIR/master" "$_CUSTOM_MASTER_CONFIG" || return 1
+            set -- "$@" "$_SALT_ETC_DIR/master" "$_CUSTOM_MASTER_CONFIG"
             CONFIGURED_ANYTHING=$BS_TRUE
 
         # Copy the masters configuration if found
@@ -8035,6 +9380,10 @@ config_salt() {
         fi
     fi
 
+    if [ $# -gt 0 ]; then
+        __overwriteconfig "$@" || return 1
+    fi
+
     if [ "$_INSTALL_CLOUD" -eq $BS_TRUE ]; then
         # Recursively copy salt-cloud configs with overwriting if necessary
         for file in "$_TEMP_CONFIG_DIR"/cloud*; do
@@ -8049,129 +9398,972 @@ config_salt() {
                     fi
                 done
             fi
-        done
-    fi
-
-    if [ "$_CONFIG_ONLY" -eq $BS_TRUE ] && [ "$CONFIGURED_ANYTHING" -eq $BS_FALSE ]; then
-        echowarn "No configuration or keys were copied over. No configuration was done!"
-        exit 0
+        done
+    fi
+
+    if [ "$_CONFIG_ONLY" -eq $BS_TRUE ] && [ "$CONFIGURED_ANYTHING" -eq $BS_FALSE ]; then
+        echowarn "No configuration or keys were copied over. No configuration was done!"
+        exit 0
+    fi
+
+    return 0
+}
+#
+#  Ended Default Configuration function
+#
+#######################################################################################################################
+
+#######################################################################################################################
+#
+#   Auto-tuning functions, used when -t is passed
+#
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __auto_tune_write
+#   DESCRIPTION:  Write the passed settings to a daemon's tuning drop-in, leaving out those the configuration already
+#                 sets so that the user's own settings always win
+#    PARAMETERS:  daemon (master or minion), "key: value" settings, one per line
+#----------------------------------------------------------------------------------------------------------------------
+__auto_tune_write() {
+
+    __TUNE_DAEMON="$1"
+    __TUNE_FILE="$_SALT_ETC_DIR/${__TUNE_DAEMON}.d/00-bootstrap-tuning.conf"
+
+    if [ -f "${__TUNE_FILE}" ] && [ "$_FORCE_OVERWRITE" -eq $BS_FALSE ]; then
+        echowarn "${__TUNE_FILE} already exists, not tuning salt-${__TUNE_DAEMON}. Use -F to overwrite it."
+        return 0
+    fi
+
+    [ -d "$_SALT_ETC_DIR/${__TUNE_DAEMON}.d" ] || mkdir -p "$_SALT_ETC_DIR/${__TUNE_DAEMON}.d" || return 1
+
+    __TUNE_SETTINGS=$(echo "$2" | while IFS= read -r __TUNE_LINE; do
+        [ -n "${__TUNE_LINE}" ] || continue
+        # shellcheck disable=SC2046
+        if grep -qs "^${__TUNE_LINE%%:*}:" "$_SALT_ETC_DIR/${__TUNE_DAEMON}" \
+                $(ls "$_SALT_ETC_DIR/${__TUNE_DAEMON}.d/"*.conf 2>/dev/null | grep -v "/00-bootstrap-tuning.conf$"); then
+            continue
+        fi
+        echo "${__TUNE_LINE}"
+    done)
+
+    {
+        echo "# Written by ${__ScriptName} -t for ${CPU_CORES} CPU cores and ${MEM_TOTAL_MB} MB of memory."
+        echo "# Settings made in the ${__TUNE_DAEMON} file or in other drop-ins take precedence, set them there."
+        echo "${__TUNE_SETTINGS}"
+    } > "${__TUNE_FILE}.tmp" && mv -f "${__TUNE_FILE}.tmp" "${__TUNE_FILE}" || return 1
+
+    echoinfo "Tuned salt-${__TUNE_DAEMON} in ${__TUNE_FILE}: $(echo "${__TUNE_SETTINGS}" | sed 's/:.*//' | tr '\n' ' ' | sed 's/ $//')"
+    return 0
+}   # ----------  end of function __auto_tune_write  ----------
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __auto_tune_configs
+#   DESCRIPTION:  Derive the master and minion settings from the host's CPU cores and memory
+#----------------------------------------------------------------------------------------------------------------------
+__auto_tune_configs() {
+
+    if [ "$_INSTALL_MASTER" -eq $BS_TRUE ] || [ "$_INSTALL_SYNDIC" -eq $BS_TRUE ]; then
+        # Two workers per core, as long as each of them has 256MB of memory, and never less than Salt's default
+        __TUNE_WORKERS=$(( CPU_CORES * 2 ))
+        if [ "${MEM_TOTAL_MB}" -gt 0 ] && [ "${__TUNE_WORKERS}" -gt $(( MEM_TOTAL_MB / 256 )) ]; then
+            __TUNE_WORKERS=$(( MEM_TOTAL_MB / 256 ))
+        fi
+        [ "${__TUNE_WORKERS}" -lt 5 ] && __TUNE_WORKERS=5
+        [ "${__TUNE_WORKERS}" -gt 64 ] && __TUNE_WORKERS=64
+
+        __TUNE_SOCK_POOL=$(( CPU_CORES / 2 ))
+        [ "${__TUNE_SOCK_POOL}" -lt 1 ] && __TUNE_SOCK_POOL=1
+        [ "${__TUNE_SOCK_POOL}" -gt 8 ] && __TUNE_SOCK_POOL=8
+
+        # Let the listen queue hold a burst of minions authenticating at once
+        __TUNE_BACKLOG=$(( __TUNE_WORKERS * 200 ))
+        [ "${__TUNE_BACKLOG}" -lt 1000 ] && __TUNE_BACKLOG=1000
+
+        __auto_tune_write master "worker_threads: ${__TUNE_WORKERS}
+sock_pool_size: ${__TUNE_SOCK_POOL}
+zmq_backlog: ${__TUNE_BACKLOG}
+key_cache: sched
+con_cache: True
+fileserver_list_cache_time: 60
+gather_job_timeout: 30" || return 1
+    fi
+
+    if [ "$_INSTALL_MINION" -eq $BS_TRUE ]; then
+        # Spread the minions out when they reconnect and re-authenticate after a master restart
+        __auto_tune_write minion "recon_default: 1000
+recon_max: 60000
+recon_randomize: True
+random_reauth_delay: 60
+acceptance_wait_time: 10
+acceptance_wait_time_max: 60
+auth_tries: 10
+auth_timeout: 60
+tcp_keepalive: True" || return 1
+    fi
+
+    return 0
+}   # ----------  end of function __auto_tune_configs  ----------
+#
+#  Ended Auto-tuning functions
+#
+#######################################################################################################################
+
+#######################################################################################################################
+#
+#   Default salt master minion keys pre-seed function. Matches ANY distribution
+#   as long as the -k option is passed.
+#
+preseed_master() {
+
+    # Create the PKI directory
+
+    if [ "$(find "$_TEMP_KEYS_DIR" -maxdepth 1 -type f | wc -l)" -lt 1 ]; then
+        echoerror "No minion keys were uploaded. Unable to pre-seed master"
+        return 1
+    fi
+
+    SEED_DEST="$_PKI_DIR/master/minions"
+    [ -d "$SEED_DEST" ] || (mkdir -p "$SEED_DEST" && chmod 700 "$SEED_DEST") || return 1
+
+    for keyfile in "$_TEMP_KEYS_DIR"/*; do
+        keyfile=$(basename "${keyfile}")
+        src_keyfile="${_TEMP_KEYS_DIR}/${keyfile}"
+        dst_keyfile="${SEED_DEST}/${keyfile}"
+
+        # If it's not a file, skip to the next
+        [ ! -f "$src_keyfile" ] && continue
+
+        __movefile "$src_keyfile" "$dst_keyfile" || return 1
+        chmod 664 "$dst_keyfile" || return 1
+    done
+
+    return 0
+}
+#
+#  Ended Default Salt Master Pre-Seed minion keys function
+#
+#######################################################################################################################
+
+#######################################################################################################################
+#
+#   This function checks if all of the installed daemons are running or not.
+#
+daemons_running_onedir() {
+
+    [ "$_START_DAEMONS" -eq $BS_FALSE ] && return 0
+
+    FAILED_DAEMONS=0
+    for fname in api master minion syndic; do
+        # Skip salt-api since the service should be opt-in and not necessarily started on boot
+        [ $fname = "api" ] && continue
+
+        # Skip if not meant to be installed
+        [ $fname = "minion" ] && [ "$_INSTALL_MINION" -eq $BS_FALSE ] && continue
+        [ $fname = "master" ] && [ "$_INSTALL_MASTER" -eq $BS_FALSE ] && continue
+        [ $fname = "syndic" ] && [ "$_INSTALL_SYNDIC" -eq $BS_FALSE ] && continue
+
+        if [ -f "/opt/saltstack/salt/run/run" ]; then
+            salt_path="/opt/saltstack/salt/run/run ${fname}"
+        else
+            salt_path="salt-${fname}"
+        fi
+        process_running=$(pgrep -f "${salt_path}")
+        if [ "${process_running}" = "" ]; then
+            echoerror "${salt_path} was not found running"
+            FAILED_DAEMONS=$((FAILED_DAEMONS + 1))
+        fi
+    done
+
+    return $FAILED_DAEMONS
+}
+
+#
+#  Ended daemons running check function
+#
+#######################################################################################################################
+
+#######################################################################################################################
+#
+#   This function checks if all of the installed daemons are running or not.
+#
+daemons_running() {
+
+    [ "$_START_DAEMONS" -eq $BS_FALSE ] && return 0
+
+    FAILED_DAEMONS=0
+    for fname in api master minion syndic; do
+        # Skip salt-api since the service should be opt-in and not necessarily started on boot
+        [ $fname = "api" ] && continue
+
+        # Skip if not meant to be installed
+        [ $fname = "minion" ] && [ "$_INSTALL_MINION" -eq $BS_FALSE ] && continue
+        [ $fname = "master" ] && [ "$_INSTALL_MASTER" -eq $BS_FALSE ] && continue
+        [ $fname = "syndic" ] && [ "$_INSTALL_SYNDIC" -eq $BS_FALSE ] && continue
+
+        # shellcheck disable=SC2009
+        if [ "${DISTRO_NAME}" = "SmartOS" ]; then
+            if [ "$(svcs -Ho STA "salt-$fname")" != "ON" ]; then
+                echoerror "salt-$fname was not found running"
+                FAILED_DAEMONS=$((FAILED_DAEMONS + 1))
+            fi
+        elif [ "$(ps wwwaux | grep -v grep | grep salt-$fname)" = "" ]; then
+            echoerror "salt-$fname was not found running"
+            FAILED_DAEMONS=$((FAILED_DAEMONS + 1))
+        fi
+    done
+
+    return ${FAILED_DAEMONS}
+}
+#
+#  Ended daemons running check function
+#
+#######################################################################################################################
+
+#######################################################################################################################
+#
+#   Deferred Start Functions
+#
+#   When -w is passed the salt-minion is held back while installing and while the other daemons start, and started
+#   later in its own slot of the window, so a fleet bootstrapped at once does not authenticate against the master all
+#   at once.
+#
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __start_jitter_delay
+#   DESCRIPTION:  Print the number of seconds to defer the salt-minion start by
+#----------------------------------------------------------------------------------------------------------------------
+__start_jitter_delay() {
+
+    __JITTER_WINDOW="${_START_JITTER#*:}"
+    [ "${__JITTER_WINDOW}" -gt 0 ] || { echo 0; return 0; }
+
+    if [ "${_START_JITTER%%:*}" = "hash" ]; then
+        # The same minion always gets the same slot, salt defaults the minion id to the FQDN
+        __JITTER_ID="$_SALT_MINION_ID"
+        if [ "${__JITTER_ID}" = "null" ]; then
+            __JITTER_ID=$(hostname -f 2>/dev/null || hostname)
+        fi
+        __JITTER_SEED=$(printf '%s' "${__JITTER_ID}" | cksum | awk '{ print $1 }')
+    else
+        # Seeding from the clock would give every node started in the same second the same delay
+        __JITTER_SEED=$(od -An -N4 -tu4 /dev/urandom 2>/dev/null | tr -d ' ')
+        [ -n "${__JITTER_SEED}" ] || __JITTER_SEED=$(awk -v pid=$$ 'BEGIN { srand(); print int(rand() * 2147483647) + pid }')
+    fi
+
+    echo $(( __JITTER_SEED % __JITTER_WINDOW ))
+}   # ----------  end of function __start_jitter_delay  ----------
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __hold_minion_start
+#   DESCRIPTION:  Keep the packages from starting salt-minion while installing them, it would connect to the master
+#                 before its slot
+#----------------------------------------------------------------------------------------------------------------------
+__hold_minion_start() {
+
+    if __check_command_exists dpkg; then
+        # invoke-rc.d and deb-systemd-invoke ask policy-rc.d before starting a service from a maintainer script
+        if [ -f /usr/sbin/policy-rc.d ]; then
+            mv -f /usr/sbin/policy-rc.d /usr/sbin/policy-rc.d.bootstrap-salt || return 1
+        fi
+        cat <<_eof > /usr/sbin/policy-rc.d
+#!/bin/sh
+# Written by bootstrap-salt.sh to hold back the deferred salt-minion start, removed once installed
+for arg in "\$@"; do
+    case "\$arg" in
+        -* ) continue ;;
+        salt-minion|salt-minion.service ) exit 101 ;;
+    esac
+    break
+done
+[ -x /usr/sbin/policy-rc.d.bootstrap-salt ] && exec /usr/sbin/policy-rc.d.bootstrap-salt "\$@"
+exit 0
+_eof
+        chmod 755 /usr/sbin/policy-rc.d || return 1
+        __MINION_START_HELD="policy-rc.d"
+    elif [ "$_SYSTEMD_FUNCTIONAL" -eq $BS_TRUE ]; then
+        if ! systemctl mask --runtime salt-minion.service >/dev/null 2>&1; then
+            echowarn "Failed to mask salt-minion.service, the packages may start it before its slot"
+            return 0
+        fi
+        __MINION_START_HELD="mask"
+    fi
+    return 0
+}   # ----------  end of function __hold_minion_start  ----------
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __release_minion_start
+#   DESCRIPTION:  Undo __hold_minion_start. A masked unit cannot be enabled, so this runs as soon as the packages are
+#                 installed, nothing else starts salt-minion before its slot
+#----------------------------------------------------------------------------------------------------------------------
+__release_minion_start() {
+
+    case "${__MINION_START_HELD:-}" in
+        policy-rc.d )
+            rm -f /usr/sbin/policy-rc.d || return 1
+            if [ -f /usr/sbin/policy-rc.d.bootstrap-salt ]; then
+                mv -f /usr/sbin/policy-rc.d.bootstrap-salt /usr/sbin/policy-rc.d || return 1
+            fi
+            ;;
+        mask )
+            systemctl unmask --runtime salt-minion.service >/dev/null 2>&1 || return 1
+            ;;
+    esac
+    __MINION_START_HELD=""
+    return 0
+}   # ----------  end of function __release_minion_start  ----------
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __defer_minion_start
+#   DESCRIPTION:  Schedule the salt-minion start in the passed number of seconds, without waiting for it
+#    PARAMETERS:  delay in seconds
+#----------------------------------------------------------------------------------------------------------------------
+__defer_minion_start() {
+
+    __JITTER_DELAY="$1"
+    __DEFER_MINION_TIMER=$BS_FALSE
+
+    if [ "$_SYSTEMD_FUNCTIONAL" -eq $BS_TRUE ] && __check_command_exists systemd-run; then
+        # The package may have started it already, hold it back until its slot
+        systemctl stop salt-minion.service >/dev/null 2>&1
+        systemctl stop salt-minion-deferred-start.timer >/dev/null 2>&1
+        # A failed start from an earlier run keeps the transient unit loaded, and systemd-run would refuse the name
+        systemctl reset-failed salt-minion-deferred-start.service salt-minion-deferred-start.timer >/dev/null 2>&1
+        if systemd-run --unit=salt-minion-deferred-start --on-active="${__JITTER_DELAY}s" \
+                --timer-property=AccuracySec=1s systemctl start salt-minion.service >/dev/null 2>&1; then
+            __DEFER_MINION_TIMER=$BS_TRUE
+        else
+            echowarn "Failed to schedule the salt-minion start using systemd, deferring it from a background process"
+        fi
+    fi
+
+    if [ "$__DEFER_MINION_TIMER" -eq $BS_FALSE ]; then
+        # Start it with the same function as the other daemons, only for the minion
+        (
+            sleep "${__JITTER_DELAY}"
+            _INSTALL_MASTER=$BS_FALSE
+            _INSTALL_SYNDIC=$BS_FALSE
+            _INSTALL_MINION=$BS_TRUE
+            ${STARTDAEMONS_INSTALL_FUNC}
+        ) </dev/null >/dev/null 2>&1 &
+        echo $! > /var/run/salt-minion-deferred-start.pid
+    fi
+
+    echoinfo "salt-minion start deferred by ${__JITTER_DELAY} seconds"
+    return 0
+}   # ----------  end of function __defer_minion_start  ----------
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __minion_start_deferred
+#   DESCRIPTION:  Check that the deferred salt-minion start is still pending, or has already started it
+#----------------------------------------------------------------------------------------------------------------------
+__minion_start_deferred() {
+
+    if [ "$__DEFER_MINION_TIMER" -eq $BS_TRUE ]; then
+        systemctl is-active --quiet salt-minion-deferred-start.timer && return 0
+        systemctl is-active --quiet salt-minion.service && return 0
+    else
+        [ -f /var/run/salt-minion-deferred-start.pid ] && \
+            kill -0 "$(cat /var/run/salt-minion-deferred-start.pid)" 2>/dev/null && return 0
+        # shellcheck disable=SC2009
+        [ "$(ps wwwaux | grep -v grep | grep salt-minion)" != "" ] && return 0
+    fi
+
+    echoerror "The deferred salt-minion start is neither pending nor has it started salt-minion"
+    return 1
+}   # ----------  end of function __minion_start_deferred  ----------
+#
+#  Ended Deferred Start Functions
+#
+#######################################################################################################################
+
+#######################################################################################################################
+#
+#   Diagnostics Functions
+#
+#   Gathered when the daemons fail to start. Every step is bounded, in time or size, so a misconfigured host cannot
+#   hang the bootstrap or flood its log.
+#
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __run_with_timeout
+#   DESCRIPTION:  Run a command, terminating it and the processes it forked when it is still running after the passed
+#                 number of seconds, and killing them 5 seconds later
+#    PARAMETERS:  seconds command [arguments]
+#----------------------------------------------------------------------------------------------------------------------
+__run_with_timeout() {
+
+    __TIMEOUT_SECS="$1"
+    shift
+
+    # timeout runs the command in a process group of its own, and signals all of it
+    if timeout --help 2>&1 | grep -q -- '--kill-after'; then
+        timeout --kill-after=5 "${__TIMEOUT_SECS}" "$@"
+        return $?
+    fi
+
+    if __check_command_exists setsid; then
+        # Not a process group leader, so setsid runs the command in place, as the leader of a new group
+        setsid "$@" &
+        __TIMEOUT_PID=$!
+        __TIMEOUT_TARGET="-${__TIMEOUT_PID}"
+    else
+        "$@" &
+        __TIMEOUT_PID=$!
+        __TIMEOUT_TARGET="${__TIMEOUT_PID}"
+    fi
+    (
+        # Take the sleep down too when the command finished in time and this watchdog is killed
+        trap 'kill "${__TIMEOUT_SLEEP}" 2>/dev/null; exit 0' TERM
+        sleep "${__TIMEOUT_SECS}" &
+        __TIMEOUT_SLEEP=$!
+        wait "${__TIMEOUT_SLEEP}"
+        kill -TERM "${__TIMEOUT_TARGET}" 2>/dev/null && sleep 5 && kill -KILL "${__TIMEOUT_TARGET}" 2>/dev/null
+    ) </dev/null >/dev/null 2>&1 &
+    __TIMEOUT_WATCHDOG=$!
+    wait "${__TIMEOUT_PID}"
+    __TIMEOUT_RET=$?
+    kill "${__TIMEOUT_WATCHDOG}" 2>/dev/null
+    return ${__TIMEOUT_RET}
+}   # ----------  end of function __run_with_timeout  ----------
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __gather_daemon_diagnostics
+#   DESCRIPTION:  Gather what is known about the daemons which should be running, all of them at once, and pack it in
+#                 ${_DIAG_BUNDLE}. The daemons are also run in the foreground, for at most ${_DIAG_TIMEOUT} seconds,
+#                 with -D.
+#    PARAMETERS:  daemons, i.e. master minion
+#----------------------------------------------------------------------------------------------------------------------
+__gather_daemon_diagnostics() {
+
+    __DIAG_DIR=""
+    if __check_command_exists mktemp; then
+        __DIAG_DIR=$(mktemp -d /tmp/bootstrap-salt-diagnostics-XXXXXXXX 2>/dev/null)
+    fi
+    if [ -z "${__DIAG_DIR}" ]; then
+        __DIAG_DIR="/tmp/bootstrap-salt-diagnostics-$$"
+        if ! mkdir -m 700 "${__DIAG_DIR}" 2>/dev/null; then
+            echoerror "Failed to create a directory in /tmp to gather the diagnostics of the daemons in"
+            return 1
+        fi
+    fi
+
+    for fname in "$@"; do
+        (
+            {
+                echo "$_SALT_ETC_DIR/$fname exists: $([ -f "$_SALT_ETC_DIR/$fname" ] && echo yes || echo no)"
+                if __check_command_exists systemctl; then
+                    __run_with_timeout 10 systemctl status --no-pager "salt-$fname.service" 2>&1
+                fi
+            } > "${__DIAG_DIR}/salt-$fname.status"
+
+            if __check_command_exists journalctl; then
+                __run_with_timeout 10 journalctl --no-pager -n "${_DIAG_LOG_LINES}" -u "salt-$fname.service" \
+                    > "${__DIAG_DIR}/salt-$fname.journal" 2>&1
+            fi
+
+            if [ -f "/var/log/salt/$fname" ]; then
+                tail -n "${_DIAG_LOG_LINES}" "/var/log/salt/$fname" > "${__DIAG_DIR}/salt-$fname.log" 2>&1
+            fi
+
+            if [ "$_ECHO_DEBUG" -eq $BS_TRUE ]; then
+                # Written to a file rather than piped, a process the daemon forked and which outlived the timeout
+                # would keep a pipe open. Only the tail is kept, a daemon stuck in a retry loop writes a lot.
+                __run_with_timeout "${_DIAG_TIMEOUT}" "salt-$fname" -l debug </dev/null \
+                    > "${__DIAG_DIR}/salt-$fname.foreground.full" 2>&1
+                tail -n "${_DIAG_LOG_LINES}" "${__DIAG_DIR}/salt-$fname.foreground.full" \
+                    > "${__DIAG_DIR}/salt-$fname.foreground"
+                rm -f "${__DIAG_DIR}/salt-$fname.foreground.full"
+            fi
+        ) &
+    done
+
+    ps auxwww > "${__DIAG_DIR}/processes" 2>&1
+    wait
+
+    if [ "$_ECHO_DEBUG" -eq $BS_TRUE ]; then
+        for __DIAG_FILE in "${__DIAG_DIR}"/salt-*.foreground "${__DIAG_DIR}"/salt-*.log; do
+            [ -s "${__DIAG_FILE}" ] || continue
+            echodebug "Last lines of $(basename "${__DIAG_FILE}"):"
+            echodebug "$(cat "${__DIAG_FILE}")"
+        done
+    fi
+
+    if tar -czf "${_DIAG_BUNDLE}" -C "${__DIAG_DIR}" . 2>/dev/null; then
+        rm -rf "${__DIAG_DIR}"
+        echoerror "The diagnostics of the daemons which failed to start are in ${_DIAG_BUNDLE}"
+    else
+        echoerror "The diagnostics of the daemons which failed to start are in ${__DIAG_DIR}"
+    fi
+    return 0
+}   # ----------  end of function __gather_daemon_diagnostics  ----------
+#
+#  Ended Diagnostics Functions
+#
+#######################################################################################################################
+
+#######################################################################################################################
+#
+#   Phased Run Functions
+#
+#   When -o is passed only the selected bootstrap phases run. What the earlier phases resolved is kept in
+#   ${_STATE_FILE} so that a later run, for example in the next container image layer, picks up where the
+#   previous one stopped.
+#
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __installed_package_versions
+#  DESCRIPTION:  Print the installed packages and their versions, one per line and sorted
+#----------------------------------------------------------------------------------------------------------------------
+__installed_package_versions() {
+
+    if __check_command_exists dpkg-query; then
+        dpkg-query -W -f='${Package} ${Version}\n' 2>/dev/null | sort
+    elif __check_command_exists rpm; then
+        rpm -qa --qf '%{NAME} %{VERSION}-%{RELEASE}\n' 2>/dev/null | sort
+    elif __check_command_exists pacman; then
+        pacman -Q 2>/dev/null | sort
+    elif __check_command_exists apk; then
+        apk info -v 2>/dev/null | sort
+    elif __check_command_exists xbps-query; then
+        xbps-query -l 2>/dev/null | awk '{ print $2 }' | sort
+    fi
+}
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __upgrade_seed_packages
+#  DESCRIPTION:  Print the installed packages the bootstrap relies on, whose dependency closure the deps upgrade mode
+#                upgrades
+#----------------------------------------------------------------------------------------------------------------------
+__upgrade_seed_packages() {
+
+    __UPGRADE_SEEDS="ca-certificates curl wget gnupg gnupg2 python3 ${_EXTRA_PACKAGES}"
+    if [ "$ITYPE" = "git" ]; then
+        __UPGRADE_SEEDS="${__UPGRADE_SEEDS} git"
+    fi
+    # Salt packages from an earlier install
+    __UPGRADE_SEEDS="${__UPGRADE_SEEDS} salt salt-common salt-minion salt-master salt-syndic salt-api salt-cloud"
+
+    for package in ${__UPGRADE_SEEDS}; do
+        if __check_command_exists dpkg-query; then
+            dpkg-query -W -f='${Status}' "${package}" 2>/dev/null | grep -q "ok installed" && echo "${package}"
+        elif __check_command_exists rpm; then
+            rpm -q --quiet "${package}" 2>/dev/null && echo "${package}"
+        elif __check_command_exists apk; then
+            apk info -e "${package}" >/dev/null 2>&1 && echo "${package}"
+        fi
+    done
+}
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __upgrade_system
+#  DESCRIPTION:  Upgrade the system packages using whichever package manager is available. _UPGRADE_MODE limits the
+#                upgrade to security updates (security), to the dependency closure of the packages the bootstrap
+#                relies on (deps) or upgrades everything (full). Reports the packages upgraded and the time taken.
+#----------------------------------------------------------------------------------------------------------------------
+__upgrade_system() {
+
+    __UPGRADE_START=$(date +%s)
+    __UPGRADE_BEFORE=$(mktemp) || return 1
+    __installed_package_versions > "${__UPGRADE_BEFORE}"
+
+    if [ "$_UPGRADE_MODE" = "deps" ]; then
+        __UPGRADE_SEEDS=$(__upgrade_seed_packages | tr '\n' ' ')
+        __UPGRADE_SEEDS="${__UPGRADE_SEEDS% }"
+        echoinfo "Upgrading the dependency closure of: ${__UPGRADE_SEEDS}"
+    else
+        echoinfo "Running a ${_UPGRADE_MODE} system upgrade"
+    fi
+
+    __upgrade_system_packages
+    __UPGRADE_RET=$?
+
+    __UPGRADE_AFTER=$(mktemp) || return 1
+    __installed_package_versions > "${__UPGRADE_AFTER}"
+    __UPGRADED=$(grep -vxF -f "${__UPGRADE_BEFORE}" "${__UPGRADE_AFTER}")
+    rm -f "${__UPGRADE_BEFORE}" "${__UPGRADE_AFTER}"
+
+    if [ -n "${__UPGRADED}" ]; then
+        echoinfo "Upgraded $(echo "${__UPGRADED}" | wc -l | awk '{ print $1 }') packages in $(( $(date +%s) - __UPGRADE_START )) seconds:"
+        echo "${__UPGRADED}" | while read -r __UPGRADED_PKG; do
+            echoinfo "  ${__UPGRADED_PKG}"
+        done
+    else
+        echoinfo "No packages upgraded, took $(( $(date +%s) - __UPGRADE_START )) seconds"
+    fi
+
+    return ${__UPGRADE_RET}
+}
+
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __upgrade_system_packages
+#  DESCRIPTION:  Run the upgrade for __upgrade_system
+#----------------------------------------------------------------------------------------------------------------------
+__upgrade_system_packages() {
+
+    if __check_command_exists apt-get; then
+        # No user interaction, libc6 restart services for example
+        export DEBIAN_FRONTEND=noninteractive
+        __wait_for_apt apt-get update || return 1
+
+        if [ "$_UPGRADE_MODE" = "full" ]; then
+            __apt_get_upgrade_noinput || return 1
+            return 0
+        fi
+
+        if [ "$_UPGRADE_MODE" = "security" ]; then
+            # Simulated upgrades name the suite of the candidate version, i.e. bookworm-security or jammy-security
+            __UPGRADE_PKGS=$(apt-get -s dist-upgrade 2>/dev/null | awk '/^Inst/ && /-security/ { print $2 }')
+        else
+            # shellcheck disable=SC2086
+            __UPGRADE_CLOSURE=$(apt-cache depends --recurse --no-recommends --no-suggests --no-conflicts \
+                --no-breaks --no-replaces --no-enhances ${__UPGRADE_SEEDS} 2>/dev/null | grep -v '^ ' | sed 's/:.*//' | sort -u)
+            __UPGRADE_PKGS=$(apt-get -s dist-upgrade 2>/dev/null | awk '/^Inst/ { print $2 }' | grep -xF "${__UPGRADE_CLOSURE}")
+        fi
+
+        if [ -n "${__UPGRADE_PKGS}" ]; then
+            # shellcheck disable=SC2086
+            __wait_for_apt apt-get install -y --only-upgrade -o DPkg::Options::=--force-confold ${__UPGRADE_PKGS} || return 1
+        fi
+    elif __check_command_exists tdnf; then
+        if [ "$_UPGRADE_MODE" = "security" ]; then
+            tdnf -y update --security || return 1
+        elif [ "$_UPGRADE_MODE" = "deps" ]; then
+            # shellcheck disable=SC2086
+            tdnf -y update ${__UPGRADE_SEEDS} || return 1
+        else
+            tdnf -y update || return 1
+        fi
+    elif __check_command_exists dnf; then
+        if [ "$_UPGRADE_MODE" = "security" ]; then
+            dnf -y upgrade --security || return 1
+        elif [ "$_UPGRADE_MODE" = "deps" ]; then
+            # shellcheck disable=SC2086
+            __UPGRADE_CLOSURE=$(dnf -q repoquery --installed --requires --resolve --recursive --qf '%{name}' \
+                ${__UPGRADE_SEEDS} 2>/dev/null | sort -u | tr '\n' ' ')
+            # shellcheck disable=SC2086
+            dnf -y upgrade ${__UPGRADE_SEEDS} ${__UPGRADE_CLOSURE} || return 1
+        else
+            dnf -y update || return 1
+        fi
+    elif __check_command_exists yum; then
+        if [ "$_UPGRADE_MODE" = "security" ]; then
+            yum -y update --security || return 1
+        elif [ "$_UPGRADE_MODE" = "deps" ]; then
+            # yum pulls in the dependency updates the named packages need
+            # shellcheck disable=SC2086
+            yum -y update ${__UPGRADE_SEEDS} || return 1
+        else
+            yum -y update || return 1
+        fi
+    elif __check_command_exists zypper; then
+        if [ "$_UPGRADE_MODE" = "security" ]; then
+            __zypper --gpg-auto-import-keys patch --category security || return 1
+        elif [ "$_UPGRADE_MODE" = "deps" ]; then
+            # shellcheck disable=SC2086
+            __zypper --gpg-auto-import-keys update ${__UPGRADE_SEEDS} || return 1
+        else
+            __zypper --gpg-auto-import-keys update || return 1
+        fi
+    elif __check_command_exists pacman; then
+        if [ "$_UPGRADE_MODE" != "full" ]; then
+            echowarn "Partial upgrades are not supported on ${DISTRO_NAME}, running a full upgrade"
+        fi
+        pacman -Syu --noconfirm --needed || return 1
+    elif __check_command_exists apk; then
+        apk update || return 1
+        if [ "$_UPGRADE_MODE" = "deps" ]; then
+            # shellcheck disable=SC2086
+            apk upgrade ${__UPGRADE_SEEDS} || return 1
+        else
+            if [ "$_UPGRADE_MODE" = "security" ]; then
+                echowarn "No security update metadata on ${DISTRO_NAME}, running a full upgrade"
+            fi
+            apk upgrade || return 1
+        fi
+    elif __check_command_exists xbps-install; then
+        if [ "$_UPGRADE_MODE" != "full" ]; then
+            echowarn "Partial upgrades are not supported on ${DISTRO_NAME}, running a full upgrade"
+        fi
+        xbps-install -Suy || return 1
+    else
+        echowarn "No known package manager found, not upgrading the system"
     fi
 
     return 0
 }
-#
-#  Ended Default Configuration function
-#
-#######################################################################################################################
 
-#######################################################################################################################
-#
-#   Default salt master minion keys pre-seed function. Matches ANY distribution
-#   as long as the -k option is passed.
-#
-preseed_master() {
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __save_state
+#  DESCRIPTION:  Save the resolved install type, functions and the state later phases depend on
+#----------------------------------------------------------------------------------------------------------------------
+__save_state() {
+
+    __STATE_DIR=$(dirname "${_STATE_FILE}")
+    [ -d "${__STATE_DIR}" ] || mkdir -p "${__STATE_DIR}" || return 1
+
+    echodebug "Saving the bootstrap state to ${_STATE_FILE}"
+    {
+        echo "# Written by ${__ScriptName} ${__ScriptVersion}, do not edit"
+        for __STATE_VAR in ITYPE DISTRO_NAME_L DEPS_INSTALL_FUNC REPO_FUNC CONFIG_SALT_FUNC PRESEED_MASTER_FUNC \
+                INSTALL_FUNC POST_INSTALL_FUNC STARTDAEMONS_INSTALL_FUNC DAEMONS_RUNNING_FUNC CHECK_SERVICES_FUNC \
+                _TEMP_CONFIG_DIR __SALT_GIT_CHECKOUT_PARENT_DIR _EPEL_REPOS_INSTALLED _LEAN_BUILD_PKGS _CLEANUP_PATHS \
+                _BAKED_SERVICES; do
+            eval "__STATE_VALUE=\${${__STATE_VAR}:-}"
+            # Stored as is, one NAME=value line each, and never evaluated when read back
+            printf '%s=%s\n' "${__STATE_VAR}" "${__STATE_VALUE}"
+        done
+    } > "${_STATE_FILE}.tmp" && mv -f "${_STATE_FILE}.tmp" "${_STATE_FILE}"
+}
 
-    # Create the PKI directory
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __state_value
+#  DESCRIPTION:  Print the value __save_state saved for the passed variable name
+#----------------------------------------------------------------------------------------------------------------------
+__state_value() {
 
-    if [ "$(find "$_TEMP_KEYS_DIR" -maxdepth 1 -type f | wc -l)" -lt 1 ]; then
-        echoerror "No minion keys were uploaded. Unable to pre-seed master"
-        return 1
-    fi
+    sed -n "s/^$1=//p" "${_STATE_FILE}" | head -n 1
+}
 
-    SEED_DEST="$_PKI_DIR/master/minions"
-    [ -d "$SEED_DEST" ] || (mkdir -p "$SEED_DEST" && chmod 700 "$SEED_DEST") || return 1
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#         NAME:  __load_state
+#  DESCRIPTION:  Restore the state saved by an earlier phased run. The state file is ignored when it was written for
+#                a different install type, distribution or install function.
+#----------------------------------------------------------------------------------------------------------------------
+__load_state() {
 
-    for keyfile in "$_TEMP_KEYS_DIR"/*; do
-        keyfile=$(basename "${keyfile}")
-        src_keyfile="${_TEMP_KEYS_DIR}/${keyfile}"
-        dst_keyfile="${SEED_DEST}/${keyfile}"
+    if [ ! -f "${_STATE_FILE}" ]; then
+        echodebug "No bootstrap state found at ${_STATE_FILE}"
+        return 0
+    fi
 
-        # If it's not a file, skip to the next
-        [ ! -f "$src_keyfile" ] && continue
+    for __STATE_VAR in ITYPE DISTRO_NAME_L INSTALL_FUNC; do
+        eval "__STATE_CURRENT=\${${__STATE_VAR}}"
+        __STATE_SAVED=$(__state_value "${__STATE_VAR}")
+        if [ "${__STATE_SAVED}" != "${__STATE_CURRENT}" ]; then
+            echowarn "Ignoring ${_STATE_FILE}: it was saved with ${__STATE_VAR}=${__STATE_SAVED}, this run resolved ${__STATE_CURRENT}"
+            return 0
+        fi
+    done
 
-        __movefile "$src_keyfile" "$dst_keyfile" || return 1
-        chmod 664 "$dst_keyfile" || return 1
+    echodebug "Loading the bootstrap state from ${_STATE_FILE}"
+    for __STATE_VAR in _TEMP_CONFIG_DIR __SALT_GIT_CHECKOUT_PARENT_DIR _EPEL_REPOS_INSTALLED _LEAN_BUILD_PKGS _CLEANUP_PATHS \
+            _BAKED_SERVICES; do
+        # A -c passed on this run takes precedence over the saved state
+        if [ "${__STATE_VAR}" = "_TEMP_CONFIG_DIR" ] && [ "${_TEMP_CONFIG_DIR}" != "null" ]; then
+            continue
+        fi
+        __STATE_SAVED=$(__state_value "${__STATE_VAR}")
+        # Only the variable name is expanded by eval, the value is assigned from __STATE_SAVED
+        [ -n "${__STATE_SAVED}" ] && eval "${__STATE_VAR}=\${__STATE_SAVED}"
     done
 
+    if [ "$ITYPE" = "git" ] && [ -d "${_SALT_GIT_CHECKOUT_DIR}" ]; then
+        # The install functions expect to run from within the checked out repository
+        # shellcheck disable=SC2164
+        cd "${_SALT_GIT_CHECKOUT_DIR}"
+    fi
+
     return 0
 }
 #
-#  Ended Default Salt Master Pre-Seed minion keys function
+#  Ended Phased Run Functions
 #
 #######################################################################################################################
 
 #######################################################################################################################
 #
-#   This function checks if all of the installed daemons are running or not.
+#   Plan Functions
+#
+#   When -O is passed the resolved plan is printed as JSON instead of being run, so that the artifacts a run needs
+#   can be staged ahead of time and option combinations can be validated in bulk.
 #
-daemons_running_onedir() {
-
-    [ "$_START_DAEMONS" -eq $BS_FALSE ] && return 0
 
-    FAILED_DAEMONS=0
-    for fname in api master minion syndic; do
-        # Skip salt-api since the service should be opt-in and not necessarily started on boot
-        [ $fname = "api" ] && continue
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __json_string
+#   DESCRIPTION:  Print the passed value as a JSON string, or null when the value is "null" or empty
+#    PARAMETERS:  value
+#----------------------------------------------------------------------------------------------------------------------
+__json_string() {
 
-        # Skip if not meant to be installed
-        [ $fname = "minion" ] && [ "$_INSTALL_MINION" -eq $BS_FALSE ] && continue
-        [ $fname = "master" ] && [ "$_INSTALL_MASTER" -eq $BS_FALSE ] && continue
-        [ $fname = "syndic" ] && [ "$_INSTALL_SYNDIC" -eq $BS_FALSE ] && continue
+    if [ "$1" = "null" ] || [ "$1" = "" ]; then
+        printf 'null'
+        return 0
+    fi
+    printf '"%s"' "$(printf '%s' "$1" | tr -d '\n\t\r' | sed -e 's/\\/\\\\/g' -e 's/"/\\"/g')"
+}
 
-        if [ -f "/opt/saltstack/salt/run/run" ]; then
-            salt_path="/opt/saltstack/salt/run/run ${fname}"
-        else
-            salt_path="salt-${fname}"
-        fi
-        process_running=$(pgrep -f "${salt_path}")
-        if [ "${process_running}" = "" ]; then
-            echoerror "${salt_path} was not found running"
-            FAILED_DAEMONS=$((FAILED_DAEMONS + 1))
-        fi
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __json_list
+#   DESCRIPTION:  Print the passed values as a JSON list of strings
+#    PARAMETERS:  values
+#----------------------------------------------------------------------------------------------------------------------
+__json_list() {
+
+    __JSON_SEP=""
+    printf '['
+    for __JSON_ITEM in "$@"; do
+        printf '%s' "${__JSON_SEP}"
+        __json_string "${__JSON_ITEM}"
+        __JSON_SEP=", "
     done
-
-    return $FAILED_DAEMONS
+    printf ']'
 }
 
-#
-#  Ended daemons running check function
-#
-#######################################################################################################################
-
-#######################################################################################################################
-#
-#   This function checks if all of the installed daemons are running or not.
-#
-daemons_running() {
-
-    [ "$_START_DAEMONS" -eq $BS_FALSE ] && return 0
+#---  FUNCTION  -------------------------------------------------------------------------------------------------------
+#          NAME:  __print_plan
+#   DESCRIPTION:  Print what this run would do as JSON, without running any of it
+#----------------------------------------------------------------------------------------------------------------------
+__print_plan() {
 
-    FAILED_DAEMONS=0
-    for fname in api master minion syndic; do
-        # Skip salt-api since the service should be opt-in and not necessarily started on boot
-        [ $fname = "api" ] && continue
+    case "$ITYPE" in
+        git )
+            __PLAN_REV="$GIT_REV"
+            ;;
+        stable )
+            __PLAN_REV="$STABLE_REV"
+            ;;
+        * )
+            __PLAN_REV="$ONEDIR_REV"
+            ;;
+    esac
 
-        # Skip if not meant to be installed
-        [ $fname = "minion" ] && [ "$_INSTALL_MINION" -eq $BS_FALSE ] && continue
-        [ $fname = "master" ] && [ "$_INSTALL_MASTER" -eq $BS_FALSE ] && continue
-        [ $fname = "syndic" ] && [ "$_INSTALL_SYNDIC" -eq $BS_FALSE ] && continue
+    # When asked to, resolve latest and the major versions to the release they would install, the same way the
+    # onedir_tarball install does. The package manager installs resolve them against their repository metadata,
+    # which carries the same releases. It is opt-in, plans are otherwise printed offline. Git references are
+    # shown as passed.
+    __PLAN_VERSION="$__PLAN_REV"
+    if [ "$_PLAN_RESOLVE" -eq $BS_TRUE ] && [ "$ITYPE" != "git" ] && \
+            [ "$(echo "$__PLAN_REV" | grep -E '^(latest|3006|3007)$')" != "" ]; then
+        _GENERIC_PKG_VERSION=""
+        if ! __check_command_exists wget; then
+            echowarn "Resolving the ${__PLAN_REV} version requires 'wget'"
+        elif [ "$__PLAN_REV" = "latest" ]; then
+            __get_packagesite_onedir_latest
+        else
+            __get_packagesite_onedir_latest "$__PLAN_REV"
+        fi
+        if [ -n "$_GENERIC_PKG_VERSION" ]; then
+            __PLAN_VERSION="$_GENERIC_PKG_VERSION"
+        else
+            echowarn "Unable to resolve the ${__PLAN_REV} version, the plan shows it as passed"
+        fi
+    fi
 
-        # shellcheck disable=SC2009
-        if [ "${DISTRO_NAME}" = "SmartOS" ]; then
-            if [ "$(svcs -Ho STA "salt-$fname")" != "ON" ]; then
-                echoerror "salt-$fname was not found running"
-                FAILED_DAEMONS=$((FAILED_DAEMONS + 1))
-            fi
-        elif [ "$(ps wwwaux | grep -v grep | grep salt-$fname)" = "" ]; then
-            echoerror "salt-$fname was not found running"
-            FAILED_DAEMONS=$((FAILED_DAEMONS + 1))
+    # The phases which would run, gated the same way as the main body below
+    __PLAN_PHASES=""
+    if [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
+        if __upgrade_enabled; then
+            __PLAN_PHASES="upgrade"
         fi
-    done
+        if [ "$_NO_DEPS" -eq $BS_FALSE ] && __phase_enabled deps; then
+            __PLAN_PHASES="${__PLAN_PHASES} deps"
+        fi
+        if [ "$_PHASES" != "all" ] && [ "$REPO_FUNC" != "null" ] && __phase_enabled repo && \
+                { [ "$_DISABLE_REPOS" -eq "$BS_FALSE" ] || [ "$_CUSTOM_REPO_URL" != "null" ]; }; then
+            __PLAN_PHASES="${__PLAN_PHASES} repo"
+        fi
+    elif [ "$_NO_DEPS" -eq $BS_FALSE ] && __phase_enabled deps && \
+            { [ "$_CUSTOM_MASTER_CONFIG" != "null" ] || [ "$_CUSTOM_MINION_CONFIG" != "null" ]; }; then
+        __PLAN_PHASES="deps"
+    fi
+    if [ "$CONFIG_SALT_FUNC" != "null" ] && __phase_enabled config && \
+            { [ "$_TEMP_CONFIG_DIR" != "null" ] || [ "$_CUSTOM_MASTER_CONFIG" != "null" ] || \
+              [ "$_CUSTOM_MINION_CONFIG" != "null" ]; }; then
+        __PLAN_PHASES="${__PLAN_PHASES} config"
+    fi
+    if [ "$PRESEED_MASTER_FUNC" != "null" ] && [ "$_TEMP_KEYS_DIR" != "null" ] && __phase_enabled preseed; then
+        __PLAN_PHASES="${__PLAN_PHASES} preseed"
+    fi
+    if [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
+        __phase_enabled install && __PLAN_PHASES="${__PLAN_PHASES} install"
+        [ "$POST_INSTALL_FUNC" != "null" ] && __phase_enabled post && __PLAN_PHASES="${__PLAN_PHASES} post"
+        [ "$_CLEANUP" -eq $BS_TRUE ] && __phase_enabled cleanup && __PLAN_PHASES="${__PLAN_PHASES} cleanup"
+    fi
+    if [ "$STARTDAEMONS_INSTALL_FUNC" != "null" ] && [ "$_START_DAEMONS" -eq $BS_TRUE ] && __phase_enabled start; then
+        __PLAN_PHASES="${__PLAN_PHASES} start"
+    fi
+
+    __PLAN_PACKAGES=""
+    [ "$_INSTALL_MINION" -eq $BS_TRUE ] && __PLAN_PACKAGES="salt-minion"
+    [ "$_INSTALL_MASTER" -eq $BS_TRUE ] && __PLAN_PACKAGES="${__PLAN_PACKAGES} salt-master"
+    [ "$_INSTALL_SYNDIC" -eq $BS_TRUE ] && __PLAN_PACKAGES="${__PLAN_PACKAGES} salt-syndic"
+    [ "$_INSTALL_SALT_API" -eq $BS_TRUE ] && __PLAN_PACKAGES="${__PLAN_PACKAGES} salt-api"
+    [ "$_INSTALL_CLOUD" -eq $BS_TRUE ] && __PLAN_PACKAGES="${__PLAN_PACKAGES} salt-cloud"
+    [ "$_CONFIG_ONLY" -eq $BS_TRUE ] && __PLAN_PACKAGES=""
+
+    # What the repository, install and key functions download
+    __PLAN_URLS=""
+    __PLAN_KEYS=""
+    case "$ITYPE" in
+        git )
+            __PLAN_URLS="${_SALT_REPO_URL}"
+            ;;
+        onedir_tarball )
+            if [ "$(echo "$__PLAN_VERSION" | grep -E '^(latest|3006|3007)$')" != "" ]; then
+                __PLAN_URLS="${HTTP_VAL}://${_REPO_URL}/saltproject-generic/windows/"
+            else
+                case "$CPU_ARCH_L" in
+                    arm64|aarch64 ) __PLAN_FILE="salt-${__PLAN_VERSION}-onedir-linux-aarch64.tar.xz" ;;
+                    * )             __PLAN_FILE="salt-${__PLAN_VERSION}-onedir-linux-x86_64.tar.xz"  ;;
+                esac
+                __PLAN_URLS="${HTTP_VAL}://${_REPO_URL}/api/storage/saltproject-generic/onedir/${__PLAN_VERSION}/${__PLAN_FILE}"
+                __PLAN_URLS="${__PLAN_URLS} ${HTTP_VAL}://${_REPO_URL}/saltproject-generic/onedir/${__PLAN_VERSION}/${__PLAN_FILE}"
+            fi
+            ;;
+        * )
+            if [ "$_DISABLE_REPOS" -eq $BS_FALSE ] || [ "$_CUSTOM_REPO_URL" != "null" ]; then
+                __PLAN_KEYS="${HTTP_VAL}://${_REPO_URL}/api/security/keypair/SaltProjectKey/public"
+                if __check_command_exists apt-get && [ "$_REPO_URL" = "packages.broadcom.com/artifactory" ]; then
+                    __PLAN_URLS="https://github.com/saltstack/salt-install-guide/releases/latest/download/salt.sources"
+                elif __check_command_exists apt-get; then
+                    __PLAN_URLS="${HTTP_VAL}://${_REPO_URL}/saltproject-deb"
+                elif __check_command_exists dnf || __check_command_exists yum || __check_command_exists tdnf; then
+                    __PLAN_URLS="https://github.com/saltstack/salt-install-guide/releases/latest/download/salt.repo"
+                    __PLAN_URLS="${__PLAN_URLS} ${HTTP_VAL}://${_REPO_URL}/saltproject-rpm/"
+                elif [ "$OS_NAME_L" = "darwin" ]; then
+                    __PLAN_URLS="${HTTP_VAL}://${_REPO_URL}/saltproject-generic/macos/"
+                fi
+            fi
+            ;;
+    esac
 
-    return ${FAILED_DAEMONS}
+    # Only the JSON goes to the plan output, the messages above stay on stderr
+    # shellcheck disable=SC2086
+    {
+        printf '{\n'
+        printf '  "version": %s,\n' "$(__json_string "$__ScriptVersion")"
+        printf '  "install_type": %s,\n' "$(__json_string "$ITYPE")"
+        printf '  "revision": %s,\n' "$(__json_string "$__PLAN_VERSION")"
+        printf '  "requested_revision": %s,\n' "$(__json_string "$__PLAN_REV")"
+        printf '  "distro": {"name": %s, "version": %s, "os": %s, "arch": %s},\n' \
+            "$(__json_string "$DISTRO_NAME_L")" "$(__json_string "$DISTRO_VERSION")" \
+            "$(__json_string "$OS_NAME_L")" "$(__json_string "$CPU_ARCH_L")"
+        printf '  "phases": %s,\n' "$(__json_list $__PLAN_PHASES)"
+        printf '  "functions": {\n'
+        printf '    "deps": %s,\n' "$(__json_string "$DEPS_INSTALL_FUNC")"
+        printf '    "repo": %s,\n' "$(__json_string "$REPO_FUNC")"
+        printf '    "config": %s,\n' "$(__json_string "$CONFIG_SALT_FUNC")"
+        printf '    "preseed": %s,\n' "$(__json_string "$PRESEED_MASTER_FUNC")"
+        printf '    "install": %s,\n' "$(__json_string "$INSTALL_FUNC")"
+        printf '    "post": %s,\n' "$(__json_string "$POST_INSTALL_FUNC")"
+        printf '    "check_services": %s,\n' "$(__json_string "$CHECK_SERVICES_FUNC")"
+        printf '    "start": %s,\n' "$(__json_string "$STARTDAEMONS_INSTALL_FUNC")"
+        printf '    "daemons_running": %s\n' "$(__json_string "$DAEMONS_RUNNING_FUNC")"
+        printf '  },\n'
+        printf '  "repo_url": %s,\n' "$(__json_string "${HTTP_VAL}://${_REPO_URL}")"
+        printf '  "mirrors": %s,\n' "$(__json_list $(echo "$_MIRRORS" | tr ',' ' '))"
+        printf '  "download_urls": %s,\n' "$(__json_list $__PLAN_URLS)"
+        printf '  "gpg_key_urls": %s,\n' "$(__json_list $__PLAN_KEYS)"
+        printf '  "packages": %s,\n' "$(__json_list $__PLAN_PACKAGES)"
+        printf '  "extra_packages": %s,\n' "$(__json_list $_EXTRA_PACKAGES)"
+        printf '  "config_dir": %s,\n' "$(__json_string "$_TEMP_CONFIG_DIR")"
+        printf '  "keys_dir": %s,\n' "$(__json_string "$_TEMP_KEYS_DIR")"
+        printf '  "start_jitter": %s\n' "$(__json_string "$_START_JITTER")"
+        printf '}\n'
+    } 1>&3
 }
 #
-#  Ended daemons running check function
+#  Ended Plan Functions
 #
 #######################################################################################################################
 
@@ -8188,6 +10380,10 @@ if [ ${_NO_DEPS} -eq $BS_FALSE ]; then
     DEP_FUNC_NAMES="$DEP_FUNC_NAMES install_${DISTRO_NAME_L}${PREFIXED_DISTRO_MAJOR_VERSION}${PREFIXED_DISTRO_MINOR_VERSION}_deps"
     DEP_FUNC_NAMES="$DEP_FUNC_NAMES install_${DISTRO_NAME_L}_${ITYPE}_deps"
     DEP_FUNC_NAMES="$DEP_FUNC_NAMES install_${DISTRO_NAME_L}_deps"
+    # The distribution agnostic onedir_tarball install type takes precedence over the distributions' functions
+    if [ "$ITYPE" = "onedir_tarball" ]; then
+        DEP_FUNC_NAMES="install_onedir_tarball_deps $DEP_FUNC_NAMES"
+    fi
 fi
 
 DEPS_INSTALL_FUNC="null"
@@ -8240,6 +10436,10 @@ echodebug "PRESEED_MASTER_FUNC=${PRESEED_MASTER_FUNC}"
 INSTALL_FUNC_NAMES="install_${DISTRO_NAME_L}${PREFIXED_DISTRO_MAJOR_VERSION}_${ITYPE}"
 INSTALL_FUNC_NAMES="$INSTALL_FUNC_NAMES install_${DISTRO_NAME_L}${PREFIXED_DISTRO_MAJOR_VERSION}${PREFIXED_DISTRO_MINOR_VERSION}_${ITYPE}"
 INSTALL_FUNC_NAMES="$INSTALL_FUNC_NAMES install_${DISTRO_NAME_L}_${ITYPE}"
+# The distribution agnostic onedir_tarball install type takes precedence over the distributions' functions
+if [ "$ITYPE" = "onedir_tarball" ]; then
+    INSTALL_FUNC_NAMES="install_onedir_tarball $INSTALL_FUNC_NAMES"
+fi
 echodebug "INSTALL_FUNC_NAMES=${INSTALL_FUNC_NAMES}"
 
 INSTALL_FUNC="null"
@@ -8258,6 +10458,10 @@ POST_FUNC_NAMES="$POST_FUNC_NAMES install_${DISTRO_NAME_L}${PREFIXED_DISTRO_MAJO
 POST_FUNC_NAMES="$POST_FUNC_NAMES install_${DISTRO_NAME_L}${PREFIXED_DISTRO_MAJOR_VERSION}${PREFIXED_DISTRO_MINOR_VERSION}_post"
 POST_FUNC_NAMES="$POST_FUNC_NAMES install_${DISTRO_NAME_L}_${ITYPE}_post"
 POST_FUNC_NAMES="$POST_FUNC_NAMES install_${DISTRO_NAME_L}_post"
+# The distribution agnostic onedir_tarball install type takes precedence over the distributions' functions
+if [ "$ITYPE" = "onedir_tarball" ]; then
+    POST_FUNC_NAMES="install_onedir_tarball_post $POST_FUNC_NAMES"
+fi
 
 POST_INSTALL_FUNC="null"
 for FUNC_NAME in $(__strip_duplicates "$POST_FUNC_NAMES"); do
@@ -8275,6 +10479,10 @@ STARTDAEMONS_FUNC_NAMES="$STARTDAEMONS_FUNC_NAMES install_${DISTRO_NAME_L}${PREF
 STARTDAEMONS_FUNC_NAMES="$STARTDAEMONS_FUNC_NAMES install_${DISTRO_NAME_L}${PREFIXED_DISTRO_MAJOR_VERSION}${PREFIXED_DISTRO_MINOR_VERSION}_restart_daemons"
 STARTDAEMONS_FUNC_NAMES="$STARTDAEMONS_FUNC_NAMES install_${DISTRO_NAME_L}_${ITYPE}_restart_daemons"
 STARTDAEMONS_FUNC_NAMES="$STARTDAEMONS_FUNC_NAMES install_${DISTRO_NAME_L}_restart_daemons"
+# The distribution agnostic onedir_tarball install type takes precedence over the distributions' functions
+if [ "$ITYPE" = "onedir_tarball" ]; then
+    STARTDAEMONS_FUNC_NAMES="install_onedir_tarball_restart_daemons $STARTDAEMONS_FUNC_NAMES"
+fi
 
 STARTDAEMONS_INSTALL_FUNC="null"
 for FUNC_NAME in $(__strip_duplicates "$STARTDAEMONS_FUNC_NAMES"); do
@@ -8294,6 +10502,10 @@ DAEMONS_RUNNING_FUNC_NAMES="$DAEMONS_RUNNING_FUNC_NAMES daemons_running_${DISTRO
 DAEMONS_RUNNING_FUNC_NAMES="$DAEMONS_RUNNING_FUNC_NAMES daemons_running_${DISTRO_NAME_L}"
 DAEMONS_RUNNING_FUNC_NAMES="$DAEMONS_RUNNING_FUNC_NAMES daemons_running_${ITYPE}"
 DAEMONS_RUNNING_FUNC_NAMES="$DAEMONS_RUNNING_FUNC_NAMES daemons_running"
+# The distribution agnostic onedir_tarball install type takes precedence over the distributions' functions
+if [ "$ITYPE" = "onedir_tarball" ]; then
+    DAEMONS_RUNNING_FUNC_NAMES="daemons_running_onedir $DAEMONS_RUNNING_FUNC_NAMES"
+fi
 
 DAEMONS_RUNNING_FUNC="null"
 for FUNC_NAME in $(__strip_duplicates "$DAEMONS_RUNNING_FUNC_NAMES"); do
@@ -8312,6 +10524,10 @@ if [ ${_DISABLE_SALT_CHECKS} -eq $BS_FALSE ]; then
     CHECK_SERVICES_FUNC_NAMES="$CHECK_SERVICES_FUNC_NAMES install_${DISTRO_NAME_L}${PREFIXED_DISTRO_MAJOR_VERSION}${PREFIXED_DISTRO_MINOR_VERSION}_check_services"
     CHECK_SERVICES_FUNC_NAMES="$CHECK_SERVICES_FUNC_NAMES install_${DISTRO_NAME_L}_${ITYPE}_check_services"
     CHECK_SERVICES_FUNC_NAMES="$CHECK_SERVICES_FUNC_NAMES install_${DISTRO_NAME_L}_check_services"
+    # The distribution agnostic onedir_tarball install type takes precedence over the distributions' functions
+    if [ "$ITYPE" = "onedir_tarball" ]; then
+        CHECK_SERVICES_FUNC_NAMES="install_onedir_tarball_check_services $CHECK_SERVICES_FUNC_NAMES"
+    fi
 else
     CHECK_SERVICES_FUNC_NAMES=""
 fi
@@ -8325,6 +10541,33 @@ for FUNC_NAME in $(__strip_duplicates "$CHECK_SERVICES_FUNC_NAMES"); do
 done
 echodebug "CHECK_SERVICES_FUNC=${CHECK_SERVICES_FUNC}"
 
+# Let's get the repository setup function, only used when running phases separately or printing the plan
+REPO_FUNC="null"
+if [ "$_PHASES" != "all" ] || [ "$_PLAN" -eq $BS_TRUE ]; then
+    case "$DISTRO_NAME_L" in
+        centos|red_hat*|oracle_linux|almalinux|rocky_linux|scientific_linux|cloud_linux )
+            __REPO_DISTRO_NAME_L="rhel"
+            ;;
+        * )
+            __REPO_DISTRO_NAME_L="$DISTRO_NAME_L"
+            ;;
+    esac
+
+    REPO_FUNC_NAMES="__install_saltstack_${__REPO_DISTRO_NAME_L}_${ITYPE}_repository"
+    if [ "$ITYPE" = "stable" ]; then
+        REPO_FUNC_NAMES="$REPO_FUNC_NAMES __install_saltstack_${__REPO_DISTRO_NAME_L}_repository"
+        REPO_FUNC_NAMES="$REPO_FUNC_NAMES __install_saltstack_${__REPO_DISTRO_NAME_L}_onedir_repository"
+    fi
+
+    for FUNC_NAME in $(__strip_duplicates "$REPO_FUNC_NAMES"); do
+        if __function_defined "$FUNC_NAME"; then
+            REPO_FUNC="$FUNC_NAME"
+            break
+        fi
+    done
+fi
+echodebug "REPO_FUNC=${REPO_FUNC}"
+
 if [ ${_NO_DEPS} -eq $BS_FALSE ] && [ "$DEPS_INSTALL_FUNC" = "null" ]; then
     echoerror "No dependencies installation function found. Exiting..."
     exit 1
@@ -8335,9 +10578,45 @@ if [ "$INSTALL_FUNC" = "null" ]; then
     exit 1
 fi
 
+if [ "$_PLAN" -eq $BS_TRUE ]; then
+    __print_plan
+    exit 0
+fi
+
+if [ "$_PHASES" != "all" ]; then
+    echoinfo "Running bootstrap phases: ${_PHASES}"
+    if ! __phase_enabled deps; then
+        __load_state
+    fi
+fi
+
+
+# Upgrade the system on its own when running phases or only upgrading part of it, so that the deps functions do not
+# repeat it
+__RUN_UPGRADE=$BS_FALSE
+if [ "$_PHASES" != "all" ] || [ "$_UPGRADE_MODE" != "full" ]; then
+    __upgrade_enabled && __RUN_UPGRADE=$BS_TRUE
+    _UPGRADE_SYS=$BS_FALSE
+fi
+
+if [ "$__RUN_UPGRADE" -eq $BS_TRUE ]; then
+    echoinfo "Running __upgrade_system()"
+    if ! __upgrade_system; then
+        echoerror "Failed to run __upgrade_system()!!!"
+        exit 1
+    fi
+fi
 
 # Install dependencies
-if [ "${_NO_DEPS}" -eq $BS_FALSE ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
+if [ "$_PHASES" != "all" ] && [ "$REPO_FUNC" != "null" ]; then
+    # The repository is set up in its own phase
+    __REPO_DISABLE_REPOS=$_DISABLE_REPOS
+    __REPO_CUSTOM_REPO_URL=$_CUSTOM_REPO_URL
+    _DISABLE_REPOS=$BS_TRUE
+    _CUSTOM_REPO_URL="null"
+fi
+
+if [ "${_NO_DEPS}" -eq $BS_FALSE ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ] && __phase_enabled deps; then
     # Only execute function is not in config mode only
     echoinfo "Running ${DEPS_INSTALL_FUNC}()"
     if ! ${DEPS_INSTALL_FUNC}; then
@@ -8346,8 +10625,29 @@ if [ "${_NO_DEPS}" -eq $BS_FALSE ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
     fi
 fi
 
+if [ "$_PHASES" != "all" ] && [ "$REPO_FUNC" != "null" ]; then
+    _DISABLE_REPOS=$__REPO_DISABLE_REPOS
+    _CUSTOM_REPO_URL=$__REPO_CUSTOM_REPO_URL
+fi
+
+# Set up the Salt package repository
+if [ "$_PHASES" != "all" ] && __phase_enabled repo && [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
+    if [ "$REPO_FUNC" = "null" ]; then
+        echoinfo "No Salt repository to set up for ${ITYPE} installs on ${DISTRO_NAME}"
+    elif [ "$_DISABLE_REPOS" -eq "$BS_FALSE" ] || [ "$_CUSTOM_REPO_URL" != "null" ]; then
+        if __check_command_exists dpkg && ! __check_dpkg_architecture; then
+            exit 1
+        fi
+        echoinfo "Running ${REPO_FUNC}()"
+        if ! ${REPO_FUNC}; then
+            echoerror "Failed to run ${REPO_FUNC}()!!!"
+            exit 1
+        fi
+    fi
+fi
+
 
-if [ "${ITYPE}" = "git" ] && [ ${_NO_DEPS} -eq ${BS_TRUE} ]; then
+if [ "${ITYPE}" = "git" ] && [ ${_NO_DEPS} -eq ${BS_TRUE} ] && { __phase_enabled deps || __phase_enabled install; }; then
     # shellcheck disable=SC2119
     if ! __git_clone_and_checkout; then
         echo "Failed to clone and checkout git repository."
@@ -8362,7 +10662,7 @@ if [ "$_CUSTOM_MASTER_CONFIG" != "null" ] || [ "$_CUSTOM_MINION_CONFIG" != "null
         _TEMP_CONFIG_DIR="$_SALT_ETC_DIR"
     fi
 
-    if [ "${_NO_DEPS}" -eq $BS_FALSE ] && [ "$_CONFIG_ONLY" -eq $BS_TRUE ]; then
+    if [ "${_NO_DEPS}" -eq $BS_FALSE ] && [ "$_CONFIG_ONLY" -eq $BS_TRUE ] && __phase_enabled deps; then
         # Execute function to satisfy dependencies for configuration step
         echoinfo "Running ${DEPS_INSTALL_FUNC}()"
         if ! ${DEPS_INSTALL_FUNC}; then
@@ -8373,7 +10673,7 @@ if [ "$_CUSTOM_MASTER_CONFIG" != "null" ] || [ "$_CUSTOM_MINION_CONFIG" != "null
 fi
 
 # Configure Salt
-if [ "$CONFIG_SALT_FUNC" != "null" ] && [ "$_TEMP_CONFIG_DIR" != "null" ]; then
+if [ "$CONFIG_SALT_FUNC" != "null" ] && [ "$_TEMP_CONFIG_DIR" != "null" ] && __phase_enabled config; then
     echoinfo "Running ${CONFIG_SALT_FUNC}()"
     if ! ${CONFIG_SALT_FUNC}; then
         echoerror "Failed to run ${CONFIG_SALT_FUNC}()!!!"
@@ -8382,21 +10682,30 @@ if [ "$CONFIG_SALT_FUNC" != "null" ] && [ "$_TEMP_CONFIG_DIR" != "null" ]; then
 fi
 
 # Drop the master address if passed
-if [ "$_SALT_MASTER_ADDRESS" != "null" ]; then
+if [ "$_SALT_MASTER_ADDRESS" != "null" ] && __phase_enabled config; then
     [ ! -d "$_SALT_ETC_DIR/minion.d" ] && mkdir -p "$_SALT_ETC_DIR/minion.d"
     cat <<_eof > "$_SALT_ETC_DIR/minion.d/99-master-address.conf"
 master: $_SALT_MASTER_ADDRESS
 _eof
 fi
 
+# Tune the master and minion to this host
+if [ "$_AUTO_TUNE" -eq $BS_TRUE ] && __phase_enabled config; then
+    echoinfo "Running __auto_tune_configs()"
+    if ! __auto_tune_configs; then
+        echoerror "Failed to run __auto_tune_configs()!!!"
+        exit 1
+    fi
+fi
+
 # Drop the minion id if passed
-if [ "$_SALT_MINION_ID" != "null" ]; then
+if [ "$_SALT_MINION_ID" != "null" ] && __phase_enabled config; then
     [ ! -d "$_SALT_ETC_DIR" ] && mkdir -p "$_SALT_ETC_DIR"
     echo "$_SALT_MINION_ID" > "$_SALT_ETC_DIR/minion_id"
 fi
 
 # Pre-seed master keys
-if [ "$PRESEED_MASTER_FUNC" != "null" ] && [ "$_TEMP_KEYS_DIR" != "null" ]; then
+if [ "$PRESEED_MASTER_FUNC" != "null" ] && [ "$_TEMP_KEYS_DIR" != "null" ] && __phase_enabled preseed; then
     echoinfo "Running ${PRESEED_MASTER_FUNC}()"
     if ! ${PRESEED_MASTER_FUNC}; then
         echoerror "Failed to run ${PRESEED_MASTER_FUNC}()!!!"
@@ -8404,8 +10713,27 @@ if [ "$PRESEED_MASTER_FUNC" != "null" ] && [ "$_TEMP_KEYS_DIR" != "null" ]; then
     fi
 fi
 
+# Defer the minion start, the packages must not start it while installing either
+__DEFER_MINION=$BS_FALSE
+__MINION_START_HELD=""
+if [ -n "$_START_JITTER" ] && [ "$_INSTALL_MINION" -eq $BS_TRUE ] && [ "$STARTDAEMONS_INSTALL_FUNC" != "null" ] && \
+        [ ${_START_DAEMONS} -eq $BS_TRUE ] && __phase_enabled start; then
+    __JITTER_DELAY=$(__start_jitter_delay)
+    if [ "${__JITTER_DELAY}" -gt 0 ]; then
+        __DEFER_MINION=$BS_TRUE
+    fi
+fi
+
+if [ "$__DEFER_MINION" -eq $BS_TRUE ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ] && __phase_enabled install; then
+    echoinfo "Running __hold_minion_start()"
+    if ! __hold_minion_start; then
+        echoerror "Failed to run __hold_minion_start()!!!"
+        exit 1
+    fi
+fi
+
 # Install Salt
-if [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
+if [ "$_CONFIG_ONLY" -eq $BS_FALSE ] && __phase_enabled install; then
     # Only execute function is not in config mode only
     echoinfo "Running ${INSTALL_FUNC}()"
     if ! ${INSTALL_FUNC}; then
@@ -8414,8 +10742,16 @@ if [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
     fi
 fi
 
+if [ -n "$__MINION_START_HELD" ]; then
+    echoinfo "Running __release_minion_start()"
+    if ! __release_minion_start; then
+        echoerror "Failed to run __release_minion_start()!!!"
+        exit 1
+    fi
+fi
+
 # Run any post install function. Only execute function if not in config mode only
-if [ "$POST_INSTALL_FUNC" != "null" ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
+if [ "$POST_INSTALL_FUNC" != "null" ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ] && __phase_enabled post; then
     echoinfo "Running ${POST_INSTALL_FUNC}()"
     if ! ${POST_INSTALL_FUNC}; then
         echoerror "Failed to run ${POST_INSTALL_FUNC}()!!!"
@@ -8424,7 +10760,7 @@ if [ "$POST_INSTALL_FUNC" != "null" ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
 fi
 
 # Run any check services function, Only execute function if not in config mode only
-if [ "$CHECK_SERVICES_FUNC" != "null" ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
+if [ "$CHECK_SERVICES_FUNC" != "null" ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ] && __phase_enabled post; then
     echoinfo "Running ${CHECK_SERVICES_FUNC}()"
     if ! ${CHECK_SERVICES_FUNC}; then
         echoerror "Failed to run ${CHECK_SERVICES_FUNC}()!!!"
@@ -8432,20 +10768,72 @@ if [ "$CHECK_SERVICES_FUNC" != "null" ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; th
     fi
 fi
 
+# Remove what was only needed to build Salt
+if [ "$_CLEANUP" -eq $BS_TRUE ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ] && __phase_enabled cleanup; then
+    echoinfo "Running __cleanup_build_leftovers()"
+    if ! __cleanup_build_leftovers; then
+        echoerror "Failed to run __cleanup_build_leftovers()!!!"
+        exit 1
+    fi
+fi
+
+# Trim what the lean profile does not need at runtime
+if [ "$_LEAN" -eq $BS_TRUE ] && [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
+    echoinfo "Running __lean_cleanup()"
+    if ! __lean_cleanup; then
+        echoerror "Failed to run __lean_cleanup()!!!"
+        exit 1
+    fi
+fi
+
+# Leave the baked image without any host identity, personalize sets it at first boot
+if [ "$_BAKE" -eq $BS_TRUE ]; then
+    echoinfo "Running __bake_reset_identity()"
+    if ! __bake_reset_identity; then
+        echoerror "Failed to run __bake_reset_identity()!!!"
+        exit 1
+    fi
+fi
+
+# Hold the minion back while the other daemons start when its start is deferred
+if [ "$__DEFER_MINION" -eq $BS_TRUE ]; then
+    _INSTALL_MINION=$BS_FALSE
+fi
+
+# Enable the daemons a baked image disabled, before starting them
+if [ -n "$_BAKED_SERVICES" ] && [ "$_BAKE" -eq $BS_FALSE ] && __phase_enabled start; then
+    echoinfo "Running __personalize_enable_services()"
+    if ! __personalize_enable_services; then
+        echoerror "Failed to run __personalize_enable_services()!!!"
+        exit 1
+    fi
+fi
+
 # Run any start daemons function
-if [ "$STARTDAEMONS_INSTALL_FUNC" != "null" ] && [ ${_START_DAEMONS} -eq $BS_TRUE ]; then
+if [ "$STARTDAEMONS_INSTALL_FUNC" != "null" ] && [ ${_START_DAEMONS} -eq $BS_TRUE ] && __phase_enabled start; then
     echoinfo "Running ${STARTDAEMONS_INSTALL_FUNC}()"
-    echodebug "Waiting ${_SLEEP} seconds for processes to settle before checking for them"
-    # shellcheck disable=SC2086
-    sleep ${_SLEEP}
+    # Nothing was installed to settle when only starting, i.e. when personalizing an image
+    if __phase_enabled install || __phase_enabled post; then
+        echodebug "Waiting ${_SLEEP} seconds for processes to settle before checking for them"
+        # shellcheck disable=SC2086
+        sleep ${_SLEEP}
+    fi
     if ! ${STARTDAEMONS_INSTALL_FUNC}; then
         echoerror "Failed to run ${STARTDAEMONS_INSTALL_FUNC}()!!!"
         exit 1
     fi
 fi
 
+if [ "$__DEFER_MINION" -eq $BS_TRUE ]; then
+    echoinfo "Running __defer_minion_start()"
+    if ! __defer_minion_start "${__JITTER_DELAY}"; then
+        echoerror "Failed to run __defer_minion_start()!!!"
+        exit 1
+    fi
+fi
+
 # Check if the installed daemons are running or not
-if [ "$DAEMONS_RUNNING_FUNC" != "null" ] && [ ${_START_DAEMONS} -eq $BS_TRUE ]; then
+if [ "$DAEMONS_RUNNING_FUNC" != "null" ] && [ ${_START_DAEMONS} -eq $BS_TRUE ] && __phase_enabled start; then
     echoinfo "Running ${DAEMONS_RUNNING_FUNC}()"
     echodebug "Waiting ${_SLEEP} seconds for processes to settle before checking for them"
     # shellcheck disable=SC2086
@@ -8453,6 +10841,7 @@ if [ "$DAEMONS_RUNNING_FUNC" != "null" ] && [ ${_START_DAEMONS} -eq $BS_TRUE ];
     if ! ${DAEMONS_RUNNING_FUNC}; then
         echoerror "Failed to run ${DAEMONS_RUNNING_FUNC}()!!!"
 
+        __DIAG_DAEMONS=""
         for fname in api master minion syndic; do
             # Skip salt-api since the service should be opt-in and not necessarily started on boot
             [ $fname = "api" ] && continue
@@ -8464,34 +10853,38 @@ if [ "$DAEMONS_RUNNING_FUNC" != "null" ] && [ ${_START_DAEMONS} -eq $BS_TRUE ];
 
             if [ "$_ECHO_DEBUG" -eq $BS_FALSE ]; then
                 echoerror "salt-$fname was not found running. Pass '-D' to ${__ScriptName} when bootstrapping for additional debugging information..."
-                continue
             fi
-
-            [ ! -f "$_SALT_ETC_DIR/$fname" ] && [ $fname != "syndic" ] && echodebug "$_SALT_ETC_DIR/$fname does not exist"
-
-            echodebug "Running salt-$fname by hand outputs: $(nohup salt-$fname -l debug)"
-
-            [ ! -f "/var/log/salt/$fname" ] && echodebug "/var/log/salt/$fname does not exist. Can't cat its contents!" && continue
-
-            echodebug "DAEMON LOGS for $fname:"
-            echodebug "$(cat /var/log/salt/$fname)"
-            echo
+            __DIAG_DAEMONS="${__DIAG_DAEMONS} $fname"
         done
 
-        echodebug "Running Processes:"
-        echodebug "$(ps auxwww)"
+        # shellcheck disable=SC2086
+        __gather_daemon_diagnostics ${__DIAG_DAEMONS}
+
+        exit 1
+    fi
+fi
 
+# The minion was left out of the checks above, make sure its start is on its way instead
+if [ "$__DEFER_MINION" -eq $BS_TRUE ]; then
+    _INSTALL_MINION=$BS_TRUE
+    if ! __minion_start_deferred; then
         exit 1
     fi
 fi
 
-if [ "$_AUTO_ACCEPT_MINION_KEYS" -eq "$BS_TRUE" ]; then
+if [ "$_AUTO_ACCEPT_MINION_KEYS" -eq "$BS_TRUE" ] && __phase_enabled start; then
   echoinfo "Accepting the Salt Minion Keys"
   salt-key -yA
 fi
 
 # Done!
-if [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
+if [ "$_PHASES" != "all" ]; then
+    if ! __save_state; then
+        echoerror "Failed to save the bootstrap state to ${_STATE_FILE}"
+        exit 1
+    fi
+    echoinfo "Bootstrap phases completed: ${_PHASES}"
+elif [ "$_CONFIG_ONLY" -eq $BS_FALSE ]; then
     echoinfo "Salt installed!"
 else
     echoinfo "Salt configured!"
@@ -1,12 +1,20 @@
 #!/bin/sh
 
 __ScriptName="salt-quick-start.sh"
-SALT_REPO_URL="https://packages.broadcom.com/artifactory/salt-project-generic/onedir"
+# The downloads and their checksums must come from the same repository
+SALT_ARTIFACTORY_URL="https://packages.broadcom.com/artifactory"
+SALT_REPO_NAME="saltproject-generic"
+SALT_REPO_URL="${SALT_ARTIFACTORY_URL}/${SALT_REPO_NAME}/onedir"
+SALT_STORAGE_URL="${SALT_ARTIFACTORY_URL}/api/storage/${SALT_REPO_NAME}/onedir"
 _COLORS=${QS_COLORS:-$(tput colors 2>/dev/null || echo 0)}
+_CACHE_DIR=${QS_CACHE_DIR:-${XDG_CACHE_HOME:-$HOME/.cache}/salt-quick-start}
 
 _LOCAL=0
 _FULL=0
 _STOP=0
+_NO_CACHE=0
+_REUSE_TREE=0
+_NO_VERIFY=0
 
 PWD="$(pwd)"
 _PATH=${PWD}/salt
@@ -19,10 +27,20 @@ __usage() {
 
   Options:
     -h  Show usage.
+    -c  Do not use the download cache, always download the onedir tarball.
+    -e  Reuse a previously extracted onedir tree from the cache instead of
+        extracting the cached tarball again.
     -f  Full setup with a Salt minion and Salt master running.
     -l  Local setup, no Salt minion or Salt master running.
+    -n  Do not fail when the sha256 sum of the onedir tarball cannot be
+        retrieved, and use it unverified. Not recommended.
     -s  Attempt to stop a running Salt minion and Salt master.
 
+  Environment variables:
+    QS_CACHE_DIR  Directory holding downloaded onedir tarballs and extracted
+                  trees, keyed by version, os and arch.
+                  Default: ${_CACHE_DIR}
+
 EOT
 }   # ----------  end of function __usage  ----------
 
@@ -54,12 +72,15 @@ __detect_color_support() {
 
 __detect_color_support
 
-while getopts ':fhls' opt
+while getopts ':cefhlns' opt
 do
   case "${opt}" in
 
     h )  __usage; exit 0  ;;
+    c )  _NO_CACHE=1      ;;
+    e )  _REUSE_TREE=1    ;;
     l )  _LOCAL=1         ;;
+    n )  _NO_VERIFY=1     ;;
     f )  _FULL=1          ;;
     s )  _STOP=1          ;;
 
@@ -94,12 +115,12 @@ __parse_repo_json_jq() {
     # $2 is ARCH
 
     # get dir listing from url, sort and pick highest
-    onedir_versions_tmpf=$(mktemp)
+    onedir_versions_tmpf=$(mktemp -d)
     curr_pwd=$(pwd)
     cd  ${onedir_versions_tmpf} || return 1
     wget -r -np -nH --exclude-directories=onedir,relenv,windows -x -l 1 "$SALT_REPO_URL/"
     # shellcheck disable=SC2010
-    LATEST_VERSION=$(ls artifactory/saltproject-generic/onedir/ | grep -v 'index.html' | sort -V -u | tail -n 1)
+    LATEST_VERSION=$(ls "artifactory/${SALT_REPO_NAME}/onedir/" | grep -v 'index.html' | sort -V -u | tail -n 1)
     cd ${curr_pwd} || return "${LATEST_VERSION}"
     rm -fR ${onedir_versions_tmpf}
     _JSON_VERSION="${LATEST_VERSION}"
@@ -115,6 +136,104 @@ __fetch_url() {
                         (echoerror "$2 failed to download to $1"; exit 1)
 }
 
+__fetch_url_stdout() {
+    # Only one downloader, falling back to another one after a partial download would corrupt the stream
+    if command -v curl >/dev/null 2>&1; then
+        # shellcheck disable=SC2086
+        curl $_CURL_ARGS -L -s -f "$1" 2>/dev/null || (echoerror "$1 failed to download"; exit 1)
+    else
+        # shellcheck disable=SC2086
+        wget $_WGET_ARGS -q -O - "$1" 2>/dev/null || (echoerror "$1 failed to download"; exit 1)
+    fi
+}
+
+__sha256() {
+    # $1 is the file to checksum, read from stdin if not passed
+    if command -v sha256sum >/dev/null 2>&1; then
+        sha256sum ${1+"$1"} | awk '{ print $1 }'
+    else
+        shasum -a 256 ${1+"$1"} | awk '{ print $1 }'
+    fi
+}
+
+__xz_decompress() {
+    # Use all cores when the installed xz supports multi-threaded decompression
+    if xz --help 2>/dev/null | grep -q -- '--threads'; then
+        xz -d -c -T0
+    else
+        xz -d -c
+    fi
+}
+
+__get_onedir_sha256() {
+
+    # $1 is the version
+    # $2 is the file name
+
+    # Artifactory's storage API returns the checksums of the stored artifact
+    __fetch_url_stdout "${SALT_STORAGE_URL}/$1/$2" | \
+        sed -n 's/.*"sha256"[[:space:]]*:[[:space:]]*"\([0-9a-f]\{64\}\)".*/\1/p' | head -n 1
+}
+
+__download_onedir() {
+
+    # $1 is the tarball URL
+    # $2 is the file to keep the tarball in
+    # $3 is the expected sha256 sum, if known
+    # $4 is the directory to extract into
+
+    # A single pass over the download: it is kept, hashed and extracted as it arrives. The extracted tree and the
+    # tarball are only moved in place once the sum matched.
+    stage_dir="$4/.salt-download.$$"
+    rm -rf "${stage_dir}" "${stage_dir}.fifo" "${stage_dir}.sum" "$2.part"
+    mkdir -p "${stage_dir}" && mkfifo "${stage_dir}.fifo" || return 1
+
+    __sha256 < "${stage_dir}.fifo" > "${stage_dir}.sum" &
+    sum_pid=$!
+    __fetch_url_stdout "$1" | tee "${stage_dir}.fifo" "$2.part" | __xz_decompress | tar -xf - -C "${stage_dir}"
+    extract_ret=$?
+    wait "${sum_pid}"
+    download_sum=$(cat "${stage_dir}.sum")
+    rm -f "${stage_dir}.fifo" "${stage_dir}.sum"
+
+    if [[ "${extract_ret}" -ne 0 ]]; then
+        echoerror "Failed to download and extract $1"
+    elif [[ -n "$3" && "${download_sum}" != "$3" ]]; then
+        echoerror "Checksum mismatch for $1: expected $3, got ${download_sum}"
+        extract_ret=1
+    fi
+    if [[ "${extract_ret}" -ne 0 ]]; then
+        rm -rf "${stage_dir}" "$2.part"
+        return 1
+    fi
+
+    mv "${stage_dir}/salt" "$4/salt" && rmdir "${stage_dir}" && mv -f "$2.part" "$2"
+}
+
+__cached_onedir_valid() {
+
+    # $1 is the cached tarball
+
+    # Only verified downloads are cached, along with the digest they were verified against
+    [[ -f "$1" && -s "$1.sha256" ]]
+}
+
+__extract_onedir() {
+
+    # $1 is the tarball
+    # $2 is the directory to extract into
+
+    # Into a staging directory first, so a failed extraction does not leave a partial tree behind
+    stage_dir="$2/.salt-extract.$$"
+    rm -rf "${stage_dir}"
+    mkdir -p "${stage_dir}" || return 1
+    if ! __xz_decompress < "$1" | tar -xf - -C "${stage_dir}"; then
+        rm -rf "${stage_dir}"
+        return 1
+    fi
+    mv "${stage_dir}/salt" "$2/salt" && rmdir "${stage_dir}"
+}
+
 __gather_os_info() {
     OS_NAME=$(uname -s 2>/dev/null)
     OS_NAME_L=$( echo "$OS_NAME" | tr '[:upper:]' '[:lower:]' )
@@ -159,15 +278,53 @@ __parse_repo_json_jq ${OS_NAME} ${CPU_ARCH_L}
 
 FILE="salt-${_JSON_VERSION}-onedir-${OS_NAME_L}-${CPU_ARCH_L}.tar.xz"
 URL="${SALT_REPO_URL}/${_JSON_VERSION}/${FILE}"
-
-if [[ ! -f ${FILE} ]]; then
-  echoinfo "Downloading Salt"
-  __fetch_url "${FILE}" "${URL}"
-fi
+_CACHE_PATH="${_CACHE_DIR}/${_JSON_VERSION}/${OS_NAME_L}-${CPU_ARCH_L}"
+_CACHE_FILE="${_CACHE_PATH}/${FILE}"
+_CACHE_TREE="${_CACHE_PATH}/tree"
 
 if [[ ! -d "salt" ]]; then
-  echoinfo "Extracting Salt"
-  tar xf ${FILE}
+  # Only a tree extracted from a verified tarball is kept in the cache
+  _SEED_TREE=0
+  if [[ "${_REUSE_TREE}" == "1" && "${_NO_CACHE}" == "0" && -d "${_CACHE_TREE}/salt" ]]; then
+    echoinfo "Reusing the extracted Salt tree from ${_CACHE_TREE}"
+    # A copy, configuration is written into the working tree
+    cp -a "${_CACHE_TREE}/salt" salt || exit 1
+  elif [[ -f ${FILE} ]]; then
+    echoinfo "Extracting Salt from the local ${FILE}, which is not verified"
+    __extract_onedir "${FILE}" . || exit 1
+  elif [[ "${_NO_CACHE}" == "0" ]] && __cached_onedir_valid "${_CACHE_FILE}"; then
+    echoinfo "Extracting Salt from the cached ${_CACHE_FILE}"
+    __extract_onedir "${_CACHE_FILE}" . || exit 1
+    _SEED_TREE=1
+  else
+    _EXPECTED_SHA256=$(__get_onedir_sha256 "${_JSON_VERSION}" "${FILE}")
+    if [[ -z "${_EXPECTED_SHA256}" ]]; then
+      if [[ "${_NO_VERIFY}" == "0" ]]; then
+        echoerror "Unable to retrieve the sha256 sum of ${FILE}, pass -n to use it unverified"
+        exit 1
+      fi
+      echoerror "Unable to retrieve the sha256 sum of ${FILE}, not verifying the download"
+    fi
+    # Unverified downloads are not cached
+    if [[ "${_NO_CACHE}" == "1" || -z "${_EXPECTED_SHA256}" ]]; then
+      _DOWNLOAD_FILE="${FILE}"
+    else
+      mkdir -p "${_CACHE_PATH}"
+      _DOWNLOAD_FILE="${_CACHE_FILE}"
+    fi
+    echoinfo "Downloading and extracting Salt"
+    __download_onedir "${URL}" "${_DOWNLOAD_FILE}" "${_EXPECTED_SHA256}" . || exit 1
+    if [[ "${_DOWNLOAD_FILE}" == "${_CACHE_FILE}" ]]; then
+      echo "${_EXPECTED_SHA256}" > "${_CACHE_FILE}.sha256"
+      _SEED_TREE=1
+    fi
+  fi
+
+  if [[ "${_SEED_TREE}" == "1" && ! -d "${_CACHE_TREE}/salt" ]]; then
+    # Keep a pristine copy of the extracted tree, before any configuration is written into it
+    mkdir -p "${_CACHE_TREE}"
+    cp -a salt "${_CACHE_TREE}/salt"
+  fi
 
   # very very hacky, remove ASAP
   if [[ "${_DARWIN_ARM}" == "1" ]]; then
@@ -1,5 +1,19 @@
+import email.utils
+import functools
+import gzip
+import hashlib
+import http.server
+import io
 import json
 import os
+import pathlib
+import platform
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+import urllib.parse
 
 import pytest
 import requests
@@ -8,6 +22,434 @@ API_URL = (
     "https://packages.broadcom.com/artifactory/api/storage/saltproject-generic/windows"
 )
 
+# The local stand-in for packages.broadcom.com is configured from the environment:
+#   BS_TEST_LOCAL_REPO      Resolve the target salt version against the local repo, and
+#                           run the tests/local_repo tests which bootstrap against it.
+#                           These install salt, run them as root in a throwaway system
+#   BS_TEST_REPO_SEED       Directory laid out like packages.broadcom.com/artifactory,
+#                           i.e. .deb/.rpm packages, onedir tarballs and the GPG key at
+#                           api/security/keypair/SaltProjectKey/public, copied as is
+#   BS_TEST_REPO_VERSIONS   Comma separated versions to add stand-in onedir tarballs,
+#                           .deb and .rpm packages for
+#   BS_TEST_REPO_LATENCY    Milliseconds added before every response
+#   BS_TEST_REPO_BANDWIDTH  Bytes per second each response body is throttled to
+#
+# Unless the seed has one, a throwaway GPG key is generated to sign the apt repository
+# with, which needs gpg. The stand-in .deb packages need dpkg-deb, and the apt index
+# dpkg-scanpackages. The stand-in .rpm packages need rpmbuild, signing them rpmsign, and
+# the rpm index createrepo_c or createrepo.
+LOCAL_REPO_VERSIONS = "3006.9,3007.1"
+LOCAL_REPO_CHUNK_SIZE = 64 * 1024
+LOCAL_REPO_SUITE = "stable"
+LOCAL_REPO_COMPONENT = "main"
+LOCAL_REPO_KEY_UID = "Salt Bootstrap Test Repository <salt-bootstrap@localhost>"
+# The stand-in .deb packages and the commands each one ships
+LOCAL_REPO_DEB_PACKAGES = {
+    "salt-common": ("salt-call",),
+    "salt-minion": ("salt-minion",),
+    "salt-master": ("salt-master", "salt", "salt-key", "salt-run"),
+    "salt-syndic": ("salt-syndic",),
+    "salt-api": ("salt-api",),
+    "salt-cloud": ("salt-cloud",),
+    "salt-ssh": ("salt-ssh",),
+}
+# The rpm packages ship the same commands, salt-common is named salt
+LOCAL_REPO_RPM_PACKAGES = {
+    ("salt" if package == "salt-common" else package): commands
+    for package, commands in LOCAL_REPO_DEB_PACKAGES.items()
+}
+
+
+class LocalRepoHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Serve a directory laid out like packages.broadcom.com/artifactory, including
+    the Artifactory storage JSON API, with optional latency and bandwidth limits.
+    """
+
+    latency = 0.0
+    bandwidth = 0
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def translate_path(self, path):
+        path = urllib.parse.urlsplit(path).path
+        if path.startswith("/artifactory/"):
+            path = path[len("/artifactory") :]
+        return super().translate_path(path)
+
+    def send_head(self):
+        if self.latency:
+            time.sleep(self.latency)
+        path = urllib.parse.urlsplit(self.path).path
+        if path.startswith("/artifactory/api/storage/"):
+            return self.send_storage_api(path[len("/artifactory/api/storage/") :])
+        return super().send_head()
+
+    def send_storage_api(self, storage_path):
+        repo, _, rpath = storage_path.strip("/").partition("/")
+        local_path = pathlib.Path(self.directory, repo, rpath).resolve()
+        if not local_path.is_relative_to(pathlib.Path(self.directory).resolve()):
+            self.send_error(403)
+            return None
+        if local_path.is_dir():
+            info = {
+                "repo": repo,
+                "path": f"/{rpath}",
+                "children": [
+                    {"uri": f"/{child.name}", "folder": child.is_dir()}
+                    for child in sorted(local_path.iterdir())
+                ],
+            }
+        elif local_path.is_file():
+            info = {
+                "repo": repo,
+                "path": f"/{rpath}",
+                "downloadUri": f"http://{self.headers['Host']}/artifactory/{repo}/{rpath}",
+                "size": str(local_path.stat().st_size),
+                "checksums": _local_repo_checksums(local_path),
+            }
+        else:
+            self.send_error(404)
+            return None
+        body = json.dumps(info, indent=2).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        return io.BytesIO(body)
+
+    def copyfile(self, source, outputfile):
+        if not self.bandwidth:
+            return super().copyfile(source, outputfile)
+        chunk_size = min(LOCAL_REPO_CHUNK_SIZE, self.bandwidth)
+        while chunk := source.read(chunk_size):
+            started = time.monotonic()
+            outputfile.write(chunk)
+            elapsed = time.monotonic() - started
+            time.sleep(max(0, len(chunk) / self.bandwidth - elapsed))
+
+
+@functools.lru_cache(maxsize=None)
+def _local_repo_checksums(path):
+    sums = {name: hashlib.new(name) for name in ("md5", "sha1", "sha256")}
+    with open(path, "rb") as rfh:
+        while chunk := rfh.read(LOCAL_REPO_CHUNK_SIZE):
+            for digest in sums.values():
+                digest.update(chunk)
+    return {name: digest.hexdigest() for name, digest in sums.items()}
+
+
+def _local_repo_versions():
+    versions = os.environ.get("BS_TEST_REPO_VERSIONS", LOCAL_REPO_VERSIONS)
+    return [version for version in map(str.strip, versions.split(",")) if version]
+
+
+def _build_local_repo(root, gnupghome):
+    """
+    Lay out the stand-in repository in ``root``: the seed directory, if any,
+    plus stand-in onedir tarballs, .deb and .rpm packages and the
+    saltproject-generic listings for every version that was not seeded, the GPG key, and the apt
+    and rpm indexes.
+    """
+    seed = os.environ.get("BS_TEST_REPO_SEED")
+    if seed:
+        shutil.copytree(seed, root, dirs_exist_ok=True)
+
+    # Signing needs the private key, which only a generated key has
+    keyfile = root / "api" / "security" / "keypair" / "SaltProjectKey" / "public"
+    signing = not keyfile.exists() and shutil.which("gpg") is not None
+    if signing:
+        keyfile.parent.mkdir(parents=True, exist_ok=True)
+        keyfile.write_bytes(_generate_repo_key(gnupghome))
+
+    deb_arch = _deb_architecture()
+    deb_repo = root / "saltproject-deb"
+    pool = deb_repo / "pool" / LOCAL_REPO_COMPONENT
+    rpm_repo = root / "saltproject-rpm"
+    for version in _local_repo_versions():
+        for platform_dir in ("windows", "macos"):
+            (root / "saltproject-generic" / platform_dir / version).mkdir(
+                parents=True, exist_ok=True
+            )
+        onedir = root / "saltproject-generic" / "onedir" / version
+        onedir.mkdir(parents=True, exist_ok=True)
+        for arch in ("x86_64", "aarch64"):
+            tarball = onedir / f"salt-{version}-onedir-linux-{arch}.tar.xz"
+            if not tarball.exists():
+                _write_onedir_tarball(tarball, version)
+        if shutil.which("dpkg-deb"):
+            for package, commands in LOCAL_REPO_DEB_PACKAGES.items():
+                deb = pool / f"{package}_{version}_{deb_arch}.deb"
+                if not any(pool.glob(f"{package}_{version}_*.deb")):
+                    _write_deb(deb, package, commands, version, deb_arch)
+        if shutil.which("rpmbuild"):
+            for package, commands in LOCAL_REPO_RPM_PACKAGES.items():
+                if not any(rpm_repo.rglob(f"{package}-{version}-*.rpm")):
+                    _write_rpm(
+                        rpm_repo,
+                        package,
+                        commands,
+                        version,
+                        gnupghome if signing else None,
+                    )
+
+    if any(deb_repo.rglob("*.deb")) and shutil.which("dpkg-scanpackages"):
+        _write_apt_index(deb_repo, deb_arch, gnupghome if signing else None)
+
+    createrepo = shutil.which("createrepo_c") or shutil.which("createrepo")
+    if any(rpm_repo.rglob("*.rpm")) and createrepo:
+        subprocess.run([createrepo, "--quiet", str(rpm_repo)], check=True)
+
+
+def _gpg(gnupghome, *args, stdin=None):
+    return subprocess.run(
+        ["gpg", "--homedir", str(gnupghome), "--batch", "--quiet", *args],
+        input=stdin,
+        check=True,
+        capture_output=True,
+    ).stdout
+
+
+def _generate_repo_key(gnupghome):
+    """
+    Generate a throwaway signing key and return its armored public key.
+    """
+    gnupghome.chmod(0o700)
+    _gpg(
+        gnupghome,
+        "--passphrase",
+        "",
+        "--quick-generate-key",
+        LOCAL_REPO_KEY_UID,
+        "rsa3072",
+        "sign",
+        "never",
+    )
+    return _gpg(gnupghome, "--armor", "--export")
+
+
+def _deb_architecture():
+    if shutil.which("dpkg"):
+        return subprocess.run(
+            ["dpkg", "--print-architecture"],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    return {"x86_64": "amd64", "aarch64": "arm64"}.get(
+        platform.machine(), platform.machine()
+    )
+
+
+def _write_deb(path, package, commands, version, arch):
+    """
+    Write a stand-in .deb which, like the onedir packages, puts its commands
+    in /opt/saltstack/salt and links them into /usr/bin.
+    """
+    staging = path.parent / f".{path.stem}"
+    (staging / "DEBIAN").mkdir(parents=True)
+    (staging / "usr" / "bin").mkdir(parents=True)
+    onedir = staging / "opt" / "saltstack" / "salt"
+    onedir.mkdir(parents=True)
+    for command in commands:
+        (onedir / command).write_bytes(_stand_in_command(command, version))
+        (onedir / command).chmod(0o755)
+        (staging / "usr" / "bin" / command).symlink_to(f"/opt/saltstack/salt/{command}")
+    depends = (
+        "" if package == "salt-common" else f"Depends: salt-common (= {version})\n"
+    )
+    (staging / "DEBIAN" / "control").write_text(
+        f"Package: {package}\n"
+        f"Version: {version}\n"
+        f"Architecture: {arch}\n"
+        "Maintainer: Salt Bootstrap Tests <salt-bootstrap@localhost>\n"
+        f"{depends}"
+        f"Description: Stand-in {package} for the salt-bootstrap tests\n"
+    )
+    subprocess.run(
+        ["dpkg-deb", "--root-owner-group", "--build", str(staging), str(path)],
+        check=True,
+        capture_output=True,
+    )
+    shutil.rmtree(staging)
+
+
+def _write_rpm(rpm_repo, package, commands, version, gnupghome):
+    """
+    Write a stand-in .rpm laid out like the stand-in .deb packages, signed
+    when a ``gnupghome`` with the private key is passed and rpmsign is found.
+    """
+    topdir = rpm_repo / f".{package}-{version}"
+    staging = topdir / "root"
+    (staging / "usr" / "bin").mkdir(parents=True)
+    onedir = staging / "opt" / "saltstack" / "salt"
+    onedir.mkdir(parents=True)
+    for command in commands:
+        (onedir / command).write_bytes(_stand_in_command(command, version))
+        (onedir / command).chmod(0o755)
+        (staging / "usr" / "bin" / command).symlink_to(f"/opt/saltstack/salt/{command}")
+    requires = "" if package == "salt" else f"Requires: salt = {version}\n"
+    files = "".join(
+        f"/opt/saltstack/salt/{command}\n/usr/bin/{command}\n" for command in commands
+    )
+    spec = topdir / f"{package}.spec"
+    spec.write_text(
+        f"Name: {package}\n"
+        f"Version: {version}\n"
+        "Release: 0\n"
+        f"Summary: Stand-in {package} for the salt-bootstrap tests\n"
+        "License: Apache-2.0\n"
+        "AutoReqProv: no\n"
+        f"{requires}"
+        "%description\n"
+        f"Stand-in {package} for the salt-bootstrap tests\n"
+        "%install\n"
+        f"cp -a {staging}/. %{{buildroot}}/\n"
+        "%files\n"
+        f"{files}"
+    )
+    subprocess.run(
+        [
+            "rpmbuild",
+            "--define",
+            f"_topdir {topdir}",
+            "--define",
+            "debug_package %{nil}",
+            "--define",
+            "__os_install_post %{nil}",
+            "-bb",
+            str(spec),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    for rpm in (topdir / "RPMS").rglob("*.rpm"):
+        if gnupghome is not None and shutil.which("rpmsign"):
+            subprocess.run(
+                [
+                    "rpmsign",
+                    "--define",
+                    f"_gpg_path {gnupghome}",
+                    "--define",
+                    f"_gpg_name {LOCAL_REPO_KEY_UID}",
+                    "--addsign",
+                    str(rpm),
+                ],
+                check=True,
+                capture_output=True,
+            )
+        shutil.move(rpm, rpm_repo / rpm.name)
+    shutil.rmtree(topdir)
+
+
+def _write_apt_index(deb_repo, arch, gnupghome):
+    """
+    Index the .deb packages under ``deb_repo`` into a dists/ layout, signed
+    when a ``gnupghome`` with the private key is passed.
+    """
+    suite = deb_repo / "dists" / LOCAL_REPO_SUITE
+    binary = suite / LOCAL_REPO_COMPONENT / f"binary-{arch}"
+    binary.mkdir(parents=True, exist_ok=True)
+    packages = subprocess.run(
+        ["dpkg-scanpackages", "--multiversion", "--arch", arch, "pool"],
+        cwd=deb_repo,
+        check=True,
+        capture_output=True,
+    ).stdout
+    (binary / "Packages").write_bytes(packages)
+    (binary / "Packages.gz").write_bytes(gzip.compress(packages, mtime=0))
+
+    indexes = [binary / "Packages", binary / "Packages.gz"]
+    release = (
+        "Origin: Salt Project\n"
+        "Label: Salt Project\n"
+        f"Suite: {LOCAL_REPO_SUITE}\n"
+        f"Codename: {LOCAL_REPO_SUITE}\n"
+        f"Date: {email.utils.formatdate(usegmt=True)}\n"
+        f"Architectures: {arch}\n"
+        f"Components: {LOCAL_REPO_COMPONENT}\n"
+        "SHA256:\n"
+    )
+    for index in indexes:
+        release += (
+            f" {hashlib.sha256(index.read_bytes()).hexdigest()}"
+            f" {index.stat().st_size} {index.relative_to(suite)}\n"
+        )
+    (suite / "Release").write_text(release)
+    if gnupghome is not None:
+        (suite / "InRelease").write_bytes(
+            _gpg(gnupghome, "--clearsign", stdin=release.encode())
+        )
+        (suite / "Release.gpg").write_bytes(
+            _gpg(gnupghome, "--armor", "--detach-sign", stdin=release.encode())
+        )
+
+
+def _stand_in_command(command, version):
+    return f'#!/bin/sh\necho "{command} {version} (Chlorine)"\n'.encode()
+
+
+def _write_onedir_tarball(path, version):
+    """
+    Write a stand-in onedir tarball whose commands only report their version.
+    """
+    with tarfile.open(path, "w:xz") as tfile:
+        for command in ("salt-call", "salt-minion", "salt-master"):
+            script = _stand_in_command(command, version)
+            info = tarfile.TarInfo(f"salt/{command}")
+            info.size = len(script)
+            info.mode = 0o755
+            tfile.addfile(info, io.BytesIO(script))
+
+
+@pytest.fixture(scope="session")
+def local_repo(tmp_path_factory):
+    """
+    Serve a local stand-in for packages.broadcom.com/artifactory.
+
+    Yields a dictionary with the ``root`` being served, the ``repo_url`` to
+    pass to ``bootstrap-salt.sh -l -R``, the storage ``api_url`` and the
+    stand-in ``versions``.
+    """
+    root = tmp_path_factory.mktemp("artifactory")
+    gnupghome = tmp_path_factory.mktemp("gnupg")
+    try:
+        _build_local_repo(root, gnupghome)
+    finally:
+        if shutil.which("gpgconf"):
+            subprocess.run(
+                ["gpgconf", "--homedir", str(gnupghome), "--kill", "all"],
+                check=False,
+                capture_output=True,
+            )
+
+    handler = type(
+        "ConfiguredLocalRepoHandler",
+        (LocalRepoHandler,),
+        {
+            "latency": float(os.environ.get("BS_TEST_REPO_LATENCY", "0")) / 1000,
+            "bandwidth": int(os.environ.get("BS_TEST_REPO_BANDWIDTH", "0")),
+        },
+    )
+    server = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(handler, directory=str(root))
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    repo_url = f"127.0.0.1:{server.server_address[1]}/artifactory"
+    try:
+        yield {
+            "root": root,
+            "repo_url": repo_url,
+            "api_url": f"http://{repo_url}/api/storage",
+            "versions": _local_repo_versions(),
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
 
 @pytest.fixture(scope="session")
 def target_python_version():
@@ -15,10 +457,16 @@ def target_python_version():
 
 
 @pytest.fixture(scope="session")
-def target_salt_version():
+def target_salt_version(request):
 
     target_salt = os.environ.get("SaltVersion", "")
-    html_response = requests.get(API_URL)
+    api_url = API_URL
+    if os.environ.get("BS_TEST_LOCAL_REPO"):
+        api_url = (
+            f"{request.getfixturevalue('local_repo')['api_url']}"
+            "/saltproject-generic/windows"
+        )
+    html_response = requests.get(api_url)
     content = json.loads(html_response.text)
     folders = content["children"]
     versions = {}
@@ -0,0 +1,143 @@
+import os
+import pathlib
+import shutil
+import subprocess
+
+import pytest
+
+BOOTSTRAP_SCRIPT = pathlib.Path(__file__).resolve().parents[2] / "bootstrap-salt.sh"
+
+
+@pytest.mark.skipif(shutil.which("apt-get") is None, reason="Needs apt-get")
+def test_apt_repository(local_repo, tmp_path):
+    """
+    apt accepts the signed repository, laid out like the salt.sources
+    bootstrap-salt.sh writes for a -R mirror describes it.
+    """
+    keyfile = local_repo["root"] / "api/security/keypair/SaltProjectKey/public"
+    if not (local_repo["root"] / "saltproject-deb" / "dists").is_dir():
+        pytest.skip("Needs gpg, dpkg-deb and dpkg-scanpackages to build the repository")
+
+    etc = tmp_path / "etc"
+    (etc / "sources.list.d").mkdir(parents=True)
+    (etc / "preferences.d").mkdir()
+    for path in ("lists/partial", "cache/archives/partial"):
+        (tmp_path / path).mkdir(parents=True)
+    shutil.copyfile(keyfile, tmp_path / "salt-archive-keyring.pgp")
+    (etc / "sources.list.d" / "salt.sources").write_text(
+        "Types: deb\n"
+        f"URIs: http://{local_repo['repo_url']}/saltproject-deb\n"
+        f"Signed-By: {tmp_path / 'salt-archive-keyring.pgp'}\n"
+        "Suites: stable\n"
+        "Components: main\n"
+    )
+    apt_options = [
+        f"-oDir::Etc={etc}",
+        f"-oDir::State::Lists={tmp_path / 'lists'}",
+        f"-oDir::Cache={tmp_path / 'cache'}",
+        "-oDebug::NoLocking=1",
+    ]
+
+    update = subprocess.run(
+        ["apt-get", *apt_options, "update"], capture_output=True, text=True
+    )
+    assert update.returncode == 0, update.stderr
+    assert "NO_PUBKEY" not in update.stderr
+    assert "is not signed" not in update.stderr
+
+    madison = subprocess.run(
+        ["apt-cache", *apt_options, "madison", "salt-minion"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    for version in local_repo["versions"]:
+        assert f" {version} " in madison
+
+
+@pytest.mark.skipif(shutil.which("dnf") is None, reason="Needs dnf")
+def test_rpm_repository(local_repo, tmp_path):
+    """
+    dnf reads the repository, laid out like the salt.repo bootstrap-salt.sh
+    writes for a -R mirror describes it, and the packages carry valid
+    signatures from its key.
+    """
+    keyfile = local_repo["root"] / "api/security/keypair/SaltProjectKey/public"
+    rpm_repo = local_repo["root"] / "saltproject-rpm"
+    if not (rpm_repo / "repodata").is_dir():
+        pytest.skip("Needs rpmbuild and createrepo to build the repository")
+
+    reposdir = tmp_path / "yum.repos.d"
+    reposdir.mkdir()
+    (reposdir / "salt.repo").write_text(
+        "[salt-repo-test]\n"
+        "name=Salt Repo for the salt-bootstrap tests\n"
+        f"baseurl=http://{local_repo['repo_url']}/saltproject-rpm/\n"
+        "enabled=1\n"
+        "gpgcheck=1\n"
+        f"gpgkey=file://{keyfile}\n"
+    )
+    repoquery = subprocess.run(
+        [
+            "dnf",
+            "--quiet",
+            f"--setopt=reposdir={reposdir}",
+            f"--setopt=cachedir={tmp_path / 'cache'}",
+            "repoquery",
+            "salt-minion",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert repoquery.returncode == 0, repoquery.stderr
+    for version in local_repo["versions"]:
+        assert f"salt-minion-0:{version}-" in repoquery.stdout
+
+    if shutil.which("rpmsign") is None:
+        pytest.skip("Needs rpmsign to sign the packages")
+    rpm_options = [f"--dbpath={tmp_path / 'rpmdb'}"]
+    subprocess.run(["rpm", *rpm_options, "--initdb"], check=True)
+    subprocess.run(["rpm", *rpm_options, "--import", str(keyfile)], check=True)
+    checksig = subprocess.run(
+        ["rpm", *rpm_options, "--checksig", *map(str, rpm_repo.rglob("*.rpm"))],
+        capture_output=True,
+        text=True,
+    )
+    assert checksig.returncode == 0, checksig.stdout + checksig.stderr
+    for line in checksig.stdout.splitlines():
+        assert line.endswith("signatures OK"), line
+
+
+@pytest.mark.skipif(
+    not os.environ.get("BS_TEST_LOCAL_REPO") or os.geteuid() != 0,
+    reason="Installs salt, needs root and BS_TEST_LOCAL_REPO to be set",
+)
+def test_bootstrap_onedir_tarball(local_repo):
+    """
+    Bootstrap the stand-in onedir tarball from the local repository. The
+    phases after the install do not depend on the repository, and need the
+    real salt.
+    """
+    version = local_repo["versions"][-1]
+    ret = subprocess.run(
+        [
+            "sh",
+            str(BOOTSTRAP_SCRIPT),
+            "-l",
+            "-X",
+            "-o",
+            "deps,repo,install",
+            "-R",
+            local_repo["repo_url"],
+            "onedir_tarball",
+            version,
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert ret.returncode == 0, ret.stdout + ret.stderr
+
+    salt_call = subprocess.run(
+        ["/usr/bin/salt-call", "--version"], check=True, capture_output=True, text=True
+    )
+    assert salt_call.stdout.split() == ["salt-call", version, "(Chlorine)"]
@@ -0,0 +1,119 @@
+import pathlib
+import sys
+
+import pytest
+
+pytest.importorskip("ptscripts")
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[2]))
+
+from tools import logs  # noqa: E402
+
+
+def _write_log(path, lines):
+    path.write_text("".join(f"{line}\n" for line in lines))
+    return path
+
+
+def _info(second, msg):
+    return f"2026-01-01T00:{second // 60:02d}:{second % 60:02d}Z  *  INFO: {msg}"
+
+
+@pytest.mark.parametrize(
+    "func,phase",
+    [
+        ("__upgrade_system", "upgrade"),
+        ("__install_saltstack_ubuntu_onedir_repository", "repo"),
+        ("install_ubuntu_onedir_deps", "deps"),
+        ("install_onedir_tarball_deps", "deps"),
+        ("config_salt", "config"),
+        ("__auto_tune_configs", "config"),
+        ("preseed_master", "preseed"),
+        ("install_ubuntu_onedir", "install"),
+        ("install_onedir_tarball", "install"),
+        ("__hold_minion_start", "install"),
+        ("__release_minion_start", "install"),
+        ("install_ubuntu_onedir_post", "post"),
+        ("install_ubuntu_check_services", "post"),
+        ("__cleanup_build_leftovers", "cleanup"),
+        ("__lean_cleanup", "cleanup"),
+        ("__bake_reset_identity", "bake"),
+        ("__personalize_enable_services", "start"),
+        ("install_ubuntu_restart_daemons", "start"),
+        ("__defer_minion_start", "start"),
+        ("daemons_running_onedir", "start"),
+        ("daemons_running", "start"),
+    ],
+)
+def test_phase_name(func, phase):
+    assert logs._phase_name(func) == phase
+
+
+def test_runs_and_phases(tmp_path):
+    path = _write_log(
+        tmp_path / "bootstrap.log",
+        [
+            _info(0, "Running version: 2024.12.12"),
+            _info(0, "Command line: '/tmp/bootstrap-salt.sh -x python3 onedir 3007'"),
+            _info(0, "  Distribution: Ubuntu 24.04"),
+            _info(1, "Running install_ubuntu_onedir_deps()"),
+            _info(11, "Running install_ubuntu_onedir()"),
+            _info(41, "Running __lean_cleanup()"),
+            _info(43, "Running install_ubuntu_restart_daemons()"),
+            _info(45, "Salt installed!"),
+            # Logs are often appended to, a second run starts here
+            " *  INFO: Running version: 2024.12.12",
+            " *  ERROR: Failed to run install_ubuntu_stable()!!!",
+        ],
+    )
+    first, second = logs._iter_bootstrap_runs(path)
+
+    assert first["distro"] == "Ubuntu"
+    assert first["distro_version"] == "24.04"
+    assert first["install_type"] == "onedir"
+    assert first["version"] == "3007"
+    assert first["duration"] == 45
+    assert [(phase["name"], phase["duration"]) for phase in first["phases"]] == [
+        ("deps", 10),
+        ("install", 30),
+        ("cleanup", 2),
+        ("start", 2),
+    ]
+
+    assert second["duration"] is None
+    assert second["errors"] == 1
+
+
+def test_apt_lock_wait_is_timed(tmp_path):
+    lock = "Aware of the lock. Patiently waiting 60 more seconds..."
+    path = _write_log(
+        tmp_path / "bootstrap.log",
+        [
+            _info(0, "Running version: 2024.12.12"),
+            _info(1, "Running install_ubuntu_onedir_deps()"),
+            # The script sleeps a second between messages, these were slow to log
+            _info(2, lock),
+            _info(5, lock),
+            _info(9, lock),
+            _info(10, "Running install_ubuntu_onedir()"),
+            _info(100, lock),
+            _info(200, "Salt installed!"),
+        ],
+    )
+    (run,) = logs._iter_bootstrap_runs(path)
+
+    assert run["apt_lock_messages"] == 4
+    # Each wait runs to the last message plus the sleep after it, and not up to
+    # the next line, which may only come once apt is done installing
+    assert run["apt_lock_seconds"] == 8 + 1
+
+
+def test_outliers_are_bounded():
+    outliers = logs.Outliers(3)
+    for count in (5, 1, 9, 7, 3, 9):
+        outliers.add({"kind": "errors", "count": count}, count)
+    outliers.add({"kind": "slow-download", "seconds": 90}, 90)
+
+    assert outliers.counts == {"errors": 6, "slow-download": 1}
+    assert [outlier["count"] for outlier in outliers.worst()[:3]] == [9, 9, 7]
+    assert outliers.worst()[3] == {"kind": "slow-download", "seconds": 90}
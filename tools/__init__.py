@@ -2,8 +2,11 @@ import logging
 
 import ptscripts
 
+ptscripts.register_tools_module("tools.benchmark")
+ptscripts.register_tools_module("tools.logs")
 ptscripts.register_tools_module("tools.pre_commit")
 ptscripts.register_tools_module("tools.release")
+ptscripts.register_tools_module("tools.trace")
 
 for name in ("boto3", "botocore", "urllib3"):
     logging.getLogger(name).setLevel(logging.INFO)
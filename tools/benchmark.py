@@ -0,0 +1,378 @@
+"""
+These commands are used to benchmark freshly bootstrapped Salt installations.
+"""
+
+# pylint: disable=resource-leakage,broad-except,3rd-party-module-not-gated
+from __future__ import annotations
+
+import getpass
+import json
+import logging
+import os
+import pathlib
+import platform
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from datetime import timezone
+
+from ptscripts import command_group
+from ptscripts import Context
+
+import tools.utils
+
+log = logging.getLogger(__name__)
+
+# Define the command group
+benchmark = command_group(
+    name="benchmark",
+    help="Benchmark Related Commands",
+    description=__doc__,
+)
+
+MINION_ID_PREFIX = "bench-minion"
+POLL_INTERVAL = 0.5
+SCRIPT_VERSION_RE = re.compile(r'^__ScriptVersion="(?P<version>[^"]+)"', re.MULTILINE)
+
+
+def _salt_cmd(name: str) -> str:
+    # The onedir entry points are in /usr/bin, which might not be on a sudo PATH
+    return shutil.which(name) or f"/usr/bin/{name}"
+
+
+def _run_json(cmdline: list[str], timeout: float) -> dict | None:
+    try:
+        ret = subprocess.run(
+            cmdline,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            check=False,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    try:
+        return json.loads(ret.stdout)
+    except ValueError:
+        log.debug("Unable to parse the output of %s: %s", cmdline, ret.stderr)
+        return None
+
+
+def _write_config(path: pathlib.Path, config: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # JSON is valid YAML, so the tools interpreter does not need yaml installed
+    path.write_text(json.dumps(config, indent=2) + "\n")
+
+
+def _stop_daemon(pidfile: pathlib.Path, timeout: float = 30):
+    try:
+        pid = int(pidfile.read_text().strip())
+    except (OSError, ValueError):
+        return
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(POLL_INTERVAL)
+    os.kill(pid, signal.SIGKILL)
+
+
+def _host_info() -> dict:
+    mem_total_mb = None
+    try:
+        for line in pathlib.Path("/proc/meminfo").read_text().splitlines():
+            if line.startswith("MemTotal:"):
+                mem_total_mb = int(line.split()[1]) // 1024
+                break
+    except OSError:
+        pass
+    return {
+        "hostname": platform.node(),
+        "system": platform.system(),
+        "release": platform.release(),
+        "arch": platform.machine(),
+        "cpu_cores": os.cpu_count(),
+        "mem_total_mb": mem_total_mb,
+    }
+
+
+def _ping_run(
+    ctx: Context,
+    root: pathlib.Path,
+    count: int,
+    publish_port: int,
+    ret_port: int,
+    accept_keys: bool,
+    timeout: int,
+) -> dict:
+    """
+    Start a master and ``count`` minions below ``root`` and time how long the
+    keys take to be accepted, and the first and the last minion take to answer
+    ``test.ping``.
+    """
+    user = getpass.getuser()
+    master_dir = root / "master"
+    _write_config(
+        master_dir / "master",
+        {
+            "root_dir": str(master_dir),
+            "user": user,
+            "interface": "127.0.0.1",
+            "publish_port": publish_port,
+            "ret_port": ret_port,
+        },
+    )
+    master_pki = master_dir / "etc" / "salt" / "pki" / "master"
+    master_cli = ["-c", str(master_dir)]
+
+    minion_ids = [f"{MINION_ID_PREFIX}-{idx:04d}" for idx in range(count)]
+    gen_keys_dir = root / "keys"
+    gen_keys_dir.mkdir(parents=True)
+    for minion_id in minion_ids:
+        minion_dir = root / "minions" / minion_id
+        _write_config(
+            minion_dir / "minion",
+            {
+                "root_dir": str(minion_dir),
+                "id": minion_id,
+                "user": user,
+                "master": "127.0.0.1",
+                "master_port": ret_port,
+                "publish_port": publish_port,
+            },
+        )
+        # Pre-generated keys, the same way bootstrap-salt.sh -k expects them
+        ctx.run(
+            _salt_cmd("salt-key"),
+            *master_cli,
+            f"--gen-keys={minion_id}",
+            f"--gen-keys-dir={gen_keys_dir}",
+            capture=True,
+        )
+        minion_pki = minion_dir / "etc" / "salt" / "pki" / "minion"
+        minion_pki.mkdir(parents=True)
+        shutil.copy(gen_keys_dir / f"{minion_id}.pem", minion_pki / "minion.pem")
+        shutil.copy(gen_keys_dir / f"{minion_id}.pub", minion_pki / "minion.pub")
+        if not accept_keys:
+            # Preseed the master, like preseed_master does
+            (master_pki / "minions").mkdir(parents=True, exist_ok=True)
+            shutil.copy(
+                gen_keys_dir / f"{minion_id}.pub", master_pki / "minions" / minion_id
+            )
+
+    result = {
+        "minions": count,
+        "keys_accepted_seconds": None,
+        "first_ping_seconds": None,
+        "all_ping_seconds": None,
+        "responding": 0,
+    }
+    pidfiles = [master_dir / "var" / "run" / "salt-master.pid"]
+    try:
+        ctx.run(_salt_cmd("salt-master"), *master_cli, "-d")
+        started = time.monotonic()
+        for minion_id in minion_ids:
+            minion_dir = root / "minions" / minion_id
+            pidfiles.append(minion_dir / "var" / "run" / "salt-minion.pid")
+            ctx.run(_salt_cmd("salt-minion"), "-c", str(minion_dir), "-d")
+        deadline = started + timeout
+
+        accepted: set[str] = set()
+        while time.monotonic() < deadline:
+            if accept_keys:
+                subprocess.run(
+                    [_salt_cmd("salt-key"), *master_cli, "-yA"],
+                    capture_output=True,
+                    check=False,
+                )
+            listing = _run_json(
+                [_salt_cmd("salt-key"), *master_cli, "--list=accepted", "--out=json"],
+                timeout=30,
+            )
+            accepted = set((listing or {}).get("minions", ()))
+            if accepted.issuperset(minion_ids):
+                result["keys_accepted_seconds"] = round(time.monotonic() - started, 3)
+                break
+            time.sleep(POLL_INTERVAL)
+        else:
+            ctx.warn(
+                f"Only {len(accepted)} of {count} keys were accepted in {timeout}s"
+            )
+            return result
+
+        responding: set[str] = set()
+        while time.monotonic() < deadline:
+            returns = _run_json(
+                [
+                    _salt_cmd("salt"),
+                    *master_cli,
+                    "--out=json",
+                    "--static",
+                    "--timeout=5",
+                    f"{MINION_ID_PREFIX}-*",
+                    "test.ping",
+                ],
+                timeout=max(5, deadline - time.monotonic()),
+            )
+            responding.update(
+                minion_id for minion_id, ret in (returns or {}).items() if ret is True
+            )
+            now = round(time.monotonic() - started, 3)
+            if responding and result["first_ping_seconds"] is None:
+                result["first_ping_seconds"] = now
+            if responding.issuperset(minion_ids):
+                result["all_ping_seconds"] = now
+                break
+            time.sleep(POLL_INTERVAL)
+        else:
+            ctx.warn(
+                f"Only {len(responding)} of {count} minions answered in {timeout}s"
+            )
+        result["responding"] = len(responding)
+        return result
+    finally:
+        for pidfile in reversed(pidfiles):
+            _stop_daemon(pidfile)
+
+
+@benchmark.command(
+    name="ping",
+    arguments={
+        "counts": {
+            "help": "Comma separated numbers of minions to time, one master run each",
+        },
+        "install_type": {
+            "help": "The bootstrap install type, i.e. onedir, stable or git",
+        },
+        "version": {
+            "help": "The version, or git revision, to bootstrap",
+        },
+        "bootstrap_args": {
+            "help": "Extra arguments for bootstrap-salt.sh, passed as a single string",
+        },
+        "skip_bootstrap": {
+            "help": "Benchmark the Salt which is already installed",
+        },
+        "accept_keys": {
+            "help": (
+                "Let the minions submit their keys and accept them with 'salt-key -yA' "
+                "instead of preseeding the master with them"
+            ),
+        },
+        "publish_port": {
+            "help": "The benchmark master's publish port",
+        },
+        "ret_port": {
+            "help": "The benchmark master's return port",
+        },
+        "timeout": {
+            "help": "Seconds to wait for every minion to answer, per run",
+        },
+        "output": {
+            "help": "Where to write the JSON results",
+        },
+    },
+)
+def ping(
+    ctx: Context,
+    counts: str = "1,10,100",
+    install_type: str = "onedir",
+    version: str = None,
+    bootstrap_args: str = "",
+    skip_bootstrap: bool = False,
+    accept_keys: bool = False,
+    publish_port: int = 14505,
+    ret_port: int = 14506,
+    timeout: int = 600,
+    output: pathlib.Path = pathlib.Path("benchmark-ping.json"),
+):
+    """
+    Time a fresh master and N local minions until they answer test.ping.
+
+    Bootstraps this machine with 'bootstrap-salt.sh -M -X -y', then, for every
+    count, starts a master and that many minions, all with their own root_dir
+    and pre-generated keys, and times how long it takes until all the keys are
+    accepted and until the first and the last minion answer test.ping.
+    """
+    try:
+        minion_counts = [int(count) for count in counts.split(",") if count.strip()]
+    except ValueError:
+        ctx.error(f"Invalid minion counts: {counts}")
+        ctx.exit(1)
+    if not minion_counts or min(minion_counts) < 1:
+        ctx.error(f"Invalid minion counts: {counts}")
+        ctx.exit(1)
+
+    script = tools.utils.REPO_ROOT / "bootstrap-salt.sh"
+    match = SCRIPT_VERSION_RE.search(script.read_text())
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "script_version": match.group("version") if match else None,
+        "host": _host_info(),
+        "bootstrap": None,
+        "salt_version": None,
+        "runs": [],
+    }
+
+    if not skip_bootstrap:
+        if os.geteuid() != 0:
+            ctx.error("Bootstrapping requires root, or pass --skip-bootstrap")
+            ctx.exit(1)
+        cmdline = ["sh", str(script), "-M", "-X", "-y", *bootstrap_args.split()]
+        cmdline.append(install_type)
+        if version:
+            cmdline.append(version)
+        ctx.info(f"Bootstrapping with: {' '.join(cmdline)}")
+        started = time.monotonic()
+        ret = ctx.run(*cmdline, check=False)
+        results["bootstrap"] = {
+            "args": cmdline[2:],
+            "seconds": round(time.monotonic() - started, 3),
+            "returncode": ret.returncode,
+        }
+        if ret.returncode != 0:
+            ctx.error(f"Bootstrap failed with exit code {ret.returncode}")
+            ctx.exit(1)
+
+    versions = _run_json(
+        [_salt_cmd("salt-call"), "--local", "test.version", "--out=json"], 120
+    )
+    if versions is None:
+        ctx.error("Unable to run salt-call, is Salt installed?")
+        ctx.exit(1)
+    results["salt_version"] = versions.get("local")
+
+    for count in minion_counts:
+        ctx.info(f"Timing a master with {count} minion(s) ...")
+        with tempfile.TemporaryDirectory(prefix="salt-benchmark-") as tempdir:
+            run = _ping_run(
+                ctx,
+                pathlib.Path(tempdir),
+                count,
+                publish_port,
+                ret_port,
+                accept_keys,
+                timeout,
+            )
+        results["runs"].append(run)
+        ctx.info(
+            f"{count} minion(s): keys accepted in {run['keys_accepted_seconds']}s, "
+            f"first ping in {run['first_ping_seconds']}s, "
+            f"all pings in {run['all_ping_seconds']}s"
+        )
+
+    output.write_text(json.dumps(results, indent=2) + "\n")
+    ctx.info(f"Wrote {output}")
+    if any(run["all_ping_seconds"] is None for run in results["runs"]):
+        ctx.exit(1)
+    ctx.exit(0)
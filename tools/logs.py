@@ -0,0 +1,534 @@
+"""
+These commands are used to analyze Salt Bootstrap logs.
+"""
+
+# pylint: disable=resource-leakage,broad-except,3rd-party-module-not-gated
+from __future__ import annotations
+
+import bz2
+import gzip
+import heapq
+import io
+import itertools
+import json
+import logging
+import lzma
+import math
+import pathlib
+import re
+from collections import Counter
+from collections.abc import Iterator
+from datetime import datetime
+
+from ptscripts import command_group
+from ptscripts import Context
+
+log = logging.getLogger(__name__)
+
+# Define the command group
+logs = command_group(
+    name="logs",
+    help="Bootstrap Log Related Commands",
+    description=__doc__,
+)
+
+INSTALL_TYPES = ("stable", "testing", "git", "onedir", "onedir_rc", "onedir_tarball")
+PERCENTILES = (50, 90, 99)
+
+ANSI_ESCAPE_RE = re.compile(r"\x1b\[[0-9;]*m")
+# Lines written by echoinfo, echowarn, echoerror and echodebug. The timestamp is
+# there when the script ran with BS_LOG_TIMESTAMPS=1, or when the collector
+# prefixed the lines with one.
+LOG_LINE_RE = re.compile(
+    r"^(?:(?P<ts>\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?)\s+)?"
+    r"\s*\*\s+(?P<level>INFO|WARN|ERROR|DEBUG):\s?(?P<msg>.*)$"
+)
+RUNNING_RE = re.compile(r"^Running (?P<func>[\w]+)\(\)$")
+COMMAND_LINE_RE = re.compile(r"^Command line: '(?P<cmdline>.*)'$")
+DISTRIBUTION_RE = re.compile(r"^\s*Distribution:\s+(?P<distro>.*)$")
+APT_LOCK_RE = re.compile(r"^Aware of the lock\. Patiently waiting")
+DOWNLOAD_START_RE = re.compile(
+    r"^(?:Installing \S+\.tar\.xz into|Downloading|Fetching|Probing mirrors)"
+)
+DOWNLOAD_FAILURE_RE = re.compile(r"failed to download|failing over to", re.IGNORECASE)
+END_RE = re.compile(r"^(?:Salt installed!|Salt configured!|Bootstrap phases completed)")
+
+# The first matching pattern names the phase a Running <FUNC>() marker starts. These
+# are the functions the main body of bootstrap-salt.sh announces, the resolved
+# distribution functions and its own steps.
+PHASE_PATTERNS = (
+    ("upgrade", re.compile(r"^__upgrade_system$")),
+    ("repo", re.compile(r"^__install_saltstack_\w+_repository$")),
+    ("deps", re.compile(r"^install_\w+_deps$")),
+    ("config", re.compile(r"^(?:config_\w*salt|__auto_tune_configs)$")),
+    ("preseed", re.compile(r"^preseed_\w*master$")),
+    ("post", re.compile(r"^install_\w+_(?:post|check_services)$")),
+    ("cleanup", re.compile(r"^(?:__cleanup_build_leftovers|__lean_cleanup)$")),
+    ("bake", re.compile(r"^__bake_reset_identity$")),
+    (
+        "start",
+        re.compile(
+            r"^(?:__personalize_enable_services|install_\w+_restart_daemons"
+            r"|__defer_minion_start|daemons_running\w*)$"
+        ),
+    ),
+    ("install", re.compile(r"^(?:install_\w+|__(?:hold|release)_minion_start)$")),
+)
+
+
+class LatencyHistogram:
+    """
+    Log bucketed histogram, its memory use does not grow with the number of
+    samples. Percentiles are accurate to the bucket width, 5%.
+    """
+
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = 0.0
+
+    def add(self, value: float):
+        value = max(value, 0.0)
+        bucket = math.ceil(math.log(value + 1, self.GROWTH))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * pct / 100))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # Report the bucket's upper bound, clamped to what was seen
+                return min(max(self.GROWTH**bucket - 1, self.minimum), self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> dict[str, float]:
+        data = {"count": self.count}
+        if self.count:
+            data["min"] = round(self.minimum, 1)
+            data["mean"] = round(self.total / self.count, 1)
+            for pct in PERCENTILES:
+                data[f"p{pct}"] = round(self.percentile(pct), 1)
+            data["max"] = round(self.maximum, 1)
+        return data
+
+
+class Outliers:
+    """
+    Keep the worst ``limit`` outliers of each kind, and how many there were,
+    so memory use does not grow with the number of logs either.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.counts: Counter = Counter()
+        self._heaps: dict[str, list] = {}
+        self._seq = itertools.count()
+
+    def add(self, outlier: dict, score: float):
+        self.counts[outlier["kind"]] += 1
+        heap = self._heaps.setdefault(outlier["kind"], [])
+        # On ties the earliest outlier is kept
+        entry = (score, -next(self._seq), outlier)
+        if len(heap) < self.limit:
+            heapq.heappush(heap, entry)
+        else:
+            heapq.heappushpop(heap, entry)
+
+    def worst(self) -> list[dict]:
+        return [
+            outlier
+            for kind in sorted(self._heaps)
+            for _, _, outlier in sorted(self._heaps[kind], reverse=True)
+        ]
+
+
+def _open_log(path: pathlib.Path) -> io.TextIOBase:
+    """
+    Open a plain, gzip, bzip2 or xz compressed log as a text stream.
+    """
+    with open(path, "rb") as rfh:
+        magic = rfh.read(6)
+    if magic.startswith(b"\x1f\x8b"):
+        opener = gzip.open
+    elif magic.startswith(b"BZh"):
+        opener = bz2.open
+    elif magic.startswith(b"\xfd7zXZ\x00"):
+        opener = lzma.open
+    else:
+        opener = open
+    return opener(path, "rt", encoding="utf-8", errors="replace")
+
+
+def _parse_timestamp(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def _phase_name(func: str) -> str:
+    for name, pattern in PHASE_PATTERNS:
+        if pattern.search(func):
+            return name
+    return func
+
+
+def _parse_command_line(cmdline: str) -> tuple[str, str]:
+    """
+    Return the install type and version passed on the bootstrap command line.
+    """
+    tokens = cmdline.split()
+    for idx, token in enumerate(tokens):
+        if token in INSTALL_TYPES:
+            version = ""
+            if idx + 1 < len(tokens) and not tokens[idx + 1].startswith("-"):
+                version = tokens[idx + 1]
+            return token, version
+    return "stable", ""
+
+
+def _split_distro(distro: str) -> tuple[str, str]:
+    name, _, version = distro.strip().rpartition(" ")
+    if name and version[:1].isdigit():
+        return name, version
+    return distro.strip(), ""
+
+
+def _iter_bootstrap_runs(path: pathlib.Path) -> Iterator[dict]:
+    """
+    Stream a log and yield one summary per bootstrap run found in it.
+
+    Only the current run and the open phase are kept in memory.
+    """
+    run: dict | None = None
+    phase: dict | None = None
+    download: dict | None = None
+    apt_lock: list[float] | None = None
+
+    def close_phase(end: float | None):
+        nonlocal phase
+        if phase is not None and run is not None:
+            if phase["start"] is not None and end is not None:
+                phase["duration"] = end - phase["start"]
+            run["phases"].append(phase)
+        phase = None
+
+    def close_download(end: float | None):
+        nonlocal download
+        if download is not None and run is not None:
+            if download["start"] is not None and end is not None:
+                download["duration"] = end - download["start"]
+                run["downloads"].append(download)
+        download = None
+
+    def close_apt_lock():
+        nonlocal apt_lock
+        if apt_lock is not None and run is not None:
+            # The script sleeps one second after each message, then retries
+            run["apt_lock_seconds"] += apt_lock[1] - apt_lock[0] + 1
+        apt_lock = None
+
+    def finish() -> dict | None:
+        if run is None:
+            return None
+        close_phase(run["last_ts"])
+        close_download(run["last_ts"])
+        close_apt_lock()
+        if run["first_ts"] is not None and run["last_ts"] is not None:
+            run["duration"] = run["last_ts"] - run["first_ts"]
+        return run
+
+    with _open_log(path) as rfh:
+        for lineno, line in enumerate(rfh, start=1):
+            match = LOG_LINE_RE.match(ANSI_ESCAPE_RE.sub("", line.rstrip("\n")))
+            if not match:
+                continue
+            ts = _parse_timestamp(match.group("ts"))
+            level = match.group("level")
+            msg = match.group("msg").strip()
+
+            if msg.startswith("Running version:"):
+                # A new bootstrap run, logs are often appended to
+                done = finish()
+                if done is not None:
+                    yield done
+                run = {
+                    "file": str(path),
+                    "line": lineno,
+                    "distro": "unknown",
+                    "distro_version": "",
+                    "install_type": "stable",
+                    "version": "",
+                    "first_ts": ts,
+                    "last_ts": ts,
+                    "duration": None,
+                    "phases": [],
+                    "downloads": [],
+                    "download_failures": 0,
+                    "apt_lock_messages": 0,
+                    "apt_lock_seconds": 0.0,
+                    "errors": 0,
+                }
+                continue
+            if run is None:
+                continue
+
+            if ts is not None:
+                if run["first_ts"] is None:
+                    run["first_ts"] = ts
+                run["last_ts"] = ts
+                close_download(ts)
+
+            if level == "ERROR":
+                run["errors"] += 1
+
+            if APT_LOCK_RE.match(msg):
+                run["apt_lock_messages"] += 1
+                if ts is not None:
+                    apt_lock = [apt_lock[0] if apt_lock else ts, ts]
+            else:
+                close_apt_lock()
+
+            if found := COMMAND_LINE_RE.match(msg):
+                run["install_type"], run["version"] = _parse_command_line(
+                    found.group("cmdline")
+                )
+            elif found := DISTRIBUTION_RE.match(msg):
+                run["distro"], run["distro_version"] = _split_distro(
+                    found.group("distro")
+                )
+            elif found := RUNNING_RE.match(msg):
+                close_phase(ts)
+                phase = {
+                    "name": _phase_name(found.group("func")),
+                    "func": found.group("func"),
+                    "line": lineno,
+                    "start": ts,
+                    "duration": None,
+                }
+            elif END_RE.match(msg):
+                close_phase(ts)
+            elif DOWNLOAD_FAILURE_RE.search(msg):
+                run["download_failures"] += 1
+
+            if DOWNLOAD_START_RE.match(msg):
+                download = {"what": msg, "line": lineno, "start": ts}
+
+    done = finish()
+    if done is not None:
+        yield done
+
+
+def _group_key(run: dict) -> tuple[str, str, str]:
+    return (
+        f"{run['distro']} {run['distro_version']}".strip(),
+        run["install_type"],
+        run["version"] or "latest",
+    )
+
+
+@logs.command(
+    name="analyze",
+    arguments={
+        "files": {
+            "help": "Bootstrap logs to analyze, plain or gzip, bzip2 or xz compressed",
+            "nargs": "+",
+        },
+        "outlier_factor": {
+            "help": "Flag phases slower than this many times their group's median",
+        },
+        "apt_lock_threshold": {
+            "help": (
+                "Flag runs which waited on the apt lock for longer than this many "
+                "seconds, or logged that many lock messages when not timestamped"
+            ),
+        },
+        "download_threshold": {
+            "help": "Flag downloads which took longer than this many seconds",
+        },
+        "max_outliers": {
+            "help": "How many of the worst outliers of each kind to report",
+        },
+        "json_output": {
+            "help": "Print the report as JSON",
+        },
+    },
+)
+def analyze(
+    ctx: Context,
+    files: list[str],
+    outlier_factor: float = 3.0,
+    apt_lock_threshold: int = 30,
+    download_threshold: int = 60,
+    max_outliers: int = 20,
+    json_output: bool = False,
+):
+    """
+    Report per phase latency percentiles and outliers from bootstrap logs.
+
+    Phase boundaries come from the 'Running <FUNC>()' markers. Durations need
+    timestamped log lines, see BS_LOG_TIMESTAMPS in bootstrap-salt.sh. Logs
+    are streamed, twice when looking for slow phases, so memory use does not
+    grow with the number of logs.
+    """
+    paths = [pathlib.Path(fpath) for fpath in files]
+    for path in paths:
+        if not path.is_file():
+            ctx.error(f"{path} does not exist")
+            ctx.exit(1)
+
+    histograms: dict[tuple[str, str, str, str], LatencyHistogram] = {}
+    outliers = Outliers(max_outliers)
+    runs = 0
+    timed_runs = 0
+
+    # First pass, the latency histograms and the outliers with absolute thresholds
+    for path in paths:
+        for run in _iter_bootstrap_runs(path):
+            runs += 1
+            group = _group_key(run)
+            if run["duration"] is not None:
+                timed_runs += 1
+                histograms.setdefault((*group, "total"), LatencyHistogram()).add(
+                    run["duration"]
+                )
+            for phase in run["phases"]:
+                if phase["duration"] is not None:
+                    histograms.setdefault(
+                        (*group, phase["name"]), LatencyHistogram()
+                    ).add(phase["duration"])
+            if run["duration"] is not None:
+                apt_lock_wait = run["apt_lock_seconds"]
+            else:
+                # Without timestamps, each message stands for at least a second
+                apt_lock_wait = run["apt_lock_messages"]
+            if apt_lock_wait > apt_lock_threshold:
+                outliers.add(
+                    {
+                        "kind": "apt-lock-wait",
+                        "file": run["file"],
+                        "line": run["line"],
+                        "seconds": (
+                            round(run["apt_lock_seconds"], 1)
+                            if run["duration"] is not None
+                            else None
+                        ),
+                        "messages": run["apt_lock_messages"],
+                    },
+                    apt_lock_wait,
+                )
+            if run["errors"]:
+                outliers.add(
+                    {
+                        "kind": "errors",
+                        "file": run["file"],
+                        "line": run["line"],
+                        "count": run["errors"],
+                    },
+                    run["errors"],
+                )
+            if run["download_failures"]:
+                outliers.add(
+                    {
+                        "kind": "download-failure",
+                        "file": run["file"],
+                        "line": run["line"],
+                        "count": run["download_failures"],
+                    },
+                    run["download_failures"],
+                )
+            for download in run["downloads"]:
+                if download["duration"] > download_threshold:
+                    outliers.add(
+                        {
+                            "kind": "slow-download",
+                            "file": run["file"],
+                            "line": download["line"],
+                            "what": download["what"],
+                            "seconds": round(download["duration"], 1),
+                        },
+                        download["duration"],
+                    )
+
+    # Second pass, phases which took much longer than their group's median
+    if timed_runs:
+        medians = {key: hist.percentile(50) for key, hist in histograms.items()}
+        for path in paths:
+            for run in _iter_bootstrap_runs(path):
+                group = _group_key(run)
+                for phase in run["phases"]:
+                    if phase["duration"] is None:
+                        continue
+                    median = medians.get((*group, phase["name"]), 0.0)
+                    # Ignore phases too short for their jitter to matter
+                    if phase["duration"] > max(median * outlier_factor, 5.0):
+                        outliers.add(
+                            {
+                                "kind": "slow-phase",
+                                "file": run["file"],
+                                "line": phase["line"],
+                                "phase": phase["name"],
+                                "func": phase["func"],
+                                "seconds": round(phase["duration"], 1),
+                                "median": round(median, 1),
+                            },
+                            phase["duration"],
+                        )
+
+    report = {
+        "runs": runs,
+        "timed_runs": timed_runs,
+        "latency": [
+            {
+                "distro": distro,
+                "install_type": itype,
+                "version": version,
+                "phase": phase,
+                **hist.to_dict(),
+            }
+            for (distro, itype, version, phase), hist in sorted(histograms.items())
+        ],
+        "outliers": outliers.worst(),
+        "outlier_counts": dict(sorted(outliers.counts.items())),
+    }
+
+    if json_output:
+        print(json.dumps(report, indent=2), flush=True)
+        ctx.exit(0)
+
+    ctx.info(f"Analyzed {runs} bootstrap runs, {timed_runs} with timestamps")
+    if runs and not timed_runs:
+        ctx.warn(
+            "No timestamped lines found, run the bootstrap with BS_LOG_TIMESTAMPS=1 "
+            "to get phase latencies"
+        )
+    for entry in report["latency"]:
+        percentiles = " ".join(f"p{pct}={entry[f'p{pct}']:.1f}s" for pct in PERCENTILES)
+        ctx.info(
+            f"{entry['distro']} {entry['install_type']} {entry['version']} "
+            f"{entry['phase']}: n={entry['count']} {percentiles} max={entry['max']:.1f}s"
+        )
+    for outlier in report["outliers"]:
+        details = " ".join(
+            f"{key}={value}"
+            for key, value in outlier.items()
+            if key not in ("kind", "file", "line") and value is not None
+        )
+        ctx.warn(f"{outlier['kind']} {outlier['file']}:{outlier['line']} {details}")
+    for kind, count in report["outlier_counts"].items():
+        if count > max_outliers:
+            ctx.warn(f"{count - max_outliers} more {kind} outliers not shown")
+    ctx.exit(0)
@@ -83,6 +83,15 @@ def s3_publish(ctx: Context, branch: str, key_id: str = None):
                 "bootstrap/stable/bootstrap-salt.ps1.sha256",
                 "bootstrap/stable/winbootstrap/sha256",
             ],
+            "bootstrap-salt-loader.sh": [
+                "bootstrap/stable/bootstrap-salt-loader.sh",
+            ],
+            "bootstrap-salt-loader.sh.sha256": [
+                "bootstrap/stable/bootstrap-salt-loader.sh.sha256",
+            ],
+            "bootstrap-salt.manifest.json": [
+                "bootstrap/stable/bootstrap-salt.manifest.json",
+            ],
         },
         "develop": {
             f"{tools.utils.GPG_KEY_FILENAME}.gpg": [
@@ -105,6 +114,15 @@ def s3_publish(ctx: Context, branch: str, key_id: str = None):
             "bootstrap-salt.ps1.sha256": [
                 "bootstrap/develop/bootstrap-salt.ps1.sha256",
             ],
+            "bootstrap-salt-loader.sh": [
+                "bootstrap/develop/bootstrap-salt-loader.sh",
+            ],
+            "bootstrap-salt-loader.sh.sha256": [
+                "bootstrap/develop/bootstrap-salt-loader.sh.sha256",
+            ],
+            "bootstrap-salt.manifest.json": [
+                "bootstrap/develop/bootstrap-salt.manifest.json",
+            ],
         },
     }
 
@@ -115,17 +133,25 @@ def s3_publish(ctx: Context, branch: str, key_id: str = None):
         tools.utils.export_gpg_key(ctx, key_id, tools.utils.REPO_ROOT)
         for lpath, rpaths in upload_files[branch].items():
             ctx.info(f"Processing {lpath} ...")
-            if lpath.endswith(".sha256") and not os.path.exists(lpath):
+            if lpath.endswith((".sha256", ".manifest.json")) and not os.path.exists(
+                lpath
+            ):
+                # One pass over the artifacts writes the manifest and every
+                # missing .sha256 file
                 ret = ctx.run(
-                    "sha256sum",
-                    lpath.replace(".sha256", ""),
-                    capture=True,
+                    sys.executable,
+                    str(
+                        tools.utils.REPO_ROOT
+                        / ".github"
+                        / "workflows"
+                        / "scripts"
+                        / "release-manifest.py"
+                    ),
                     check=False,
                 )
                 if ret.returncode:
-                    ctx.error(f"Failed to get the sha256sum of {lpath}")
+                    ctx.error(f"Failed to write the release manifest for {lpath}")
                     ctx.exit(1)
-                pathlib.Path(lpath).write_bytes(ret.stdout)
             for rpath in rpaths:
                 files_to_upload.append((lpath, rpath))
             if not lpath.endswith((".gpg", ".pub")):
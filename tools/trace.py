@@ -0,0 +1,215 @@
+"""
+These commands are used to profile Salt Bootstrap from its BS_TRACE traces.
+"""
+
+# pylint: disable=resource-leakage,broad-except,3rd-party-module-not-gated
+from __future__ import annotations
+
+import json
+import logging
+import pathlib
+import re
+from collections import Counter
+from collections.abc import Iterator
+
+from ptscripts import command_group
+from ptscripts import Context
+
+log = logging.getLogger(__name__)
+
+# Define the command group
+trace = command_group(
+    name="trace",
+    help="Bootstrap Trace Related Commands",
+    description=__doc__,
+)
+
+# Lines written by set -x with the PS4 bootstrap-salt.sh sets when BS_TRACE is set,
+# the leading + is repeated once per level of indirection
+TRACE_LINE_RE = re.compile(
+    r"^\++(?P<ts>\d+[.,]\d+) (?P<pid>\d+) (?P<stack>[^|]*)\| (?P<cmd>.*)$"
+)
+ASSIGNMENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(?:\[[^]]*\])?\+?=")
+
+# Everything bash runs without forking, besides the script's own functions
+SHELL_BUILTINS = frozenset(
+    (
+        ". : [ [[ ]] alias bg bind break builtin caller case cd command compgen "
+        "complete compopt continue declare dirs disown do done echo elif else enable "
+        "esac eval exec exit export false fc fg fi for function getopts hash help "
+        "history if in jobs kill let local logout mapfile popd printf pushd pwd read "
+        "readarray readonly return select set shift shopt source suspend test then "
+        "time times trap true type typeset ulimit umask unalias unset until wait "
+        "while { } ! (( ))"
+    ).split()
+)
+
+
+def _iter_trace(
+    path: pathlib.Path,
+) -> Iterator[tuple[float, int, tuple[str, ...], str]]:
+    """
+    Yield the timestamp, process id, function stack, outermost first, and the
+    command of every trace line. The lines printed for multi-line commands
+    after their first one are skipped.
+    """
+    with open(path, errors="replace") as rfh:
+        for line in rfh:
+            match = TRACE_LINE_RE.match(line.rstrip("\n"))
+            if match is None:
+                continue
+            yield (
+                float(match.group("ts").replace(",", ".")),
+                int(match.group("pid")),
+                tuple(reversed(match.group("stack").split())),
+                match.group("cmd"),
+            )
+
+
+def _command_word(cmd: str) -> str | None:
+    if ASSIGNMENT_RE.match(cmd):
+        return None
+    word = cmd.split(" ", 1)[0].strip("'\"")
+    return word or None
+
+
+def fold_trace(path: pathlib.Path, commands: bool = False) -> tuple[Counter, dict]:
+    """
+    Fold a trace into collapsed stacks, in microseconds, and per function
+    statistics.
+
+    Every command is charged the time until the next traced command, whichever
+    process traced it. The script mostly waits for what it forks, so this
+    splits the wall time without counting the time spent in subshells twice.
+    Forks are the subshells, seen as new process ids, and the commands which
+    are neither shell builtins nor functions.
+    """
+    # First pass, the script's functions are whatever showed up on a stack
+    functions: set[str] = set()
+    for _, _, stack, _ in _iter_trace(path):
+        functions.update(stack)
+
+    stacks: Counter = Counter()
+    stats = {
+        name: {"calls": 0, "self_us": 0, "total_us": 0, "forks": 0}
+        for name in functions | {"main"}
+    }
+    pids: set[int] = set()
+    previous = None
+    for ts, pid, stack, cmd in _iter_trace(path):
+        stack = stack or ("main",)
+        if pids and pid not in pids:
+            stats[stack[-1]]["forks"] += 1
+        pids.add(pid)
+
+        word = _command_word(cmd)
+        if word in functions:
+            stats[word]["calls"] += 1
+        elif word is not None and word not in SHELL_BUILTINS:
+            stats[stack[-1]]["forks"] += 1
+
+        if previous is not None:
+            _charge(stacks, stats, previous, ts, commands)
+        previous = (ts, stack, word)
+
+    if previous is not None:
+        # Nothing tells how long the last command took
+        _charge(stacks, stats, previous, previous[0], commands)
+    return stacks, stats
+
+
+def _charge(stacks: Counter, stats: dict, previous: tuple, now: float, commands: bool):
+    ts, stack, word = previous
+    elapsed = max(0, round((now - ts) * 1_000_000))
+    frames = stack
+    if commands and word is not None and word not in stats:
+        frames = (*stack, f"[{word}]")
+    stacks[";".join(frames)] += elapsed
+    stats[stack[-1]]["self_us"] += elapsed
+    for name in set(stack):
+        stats[name]["total_us"] += elapsed
+
+
+@trace.command(
+    name="fold",
+    arguments={
+        "trace_file": {
+            "help": "The file bootstrap-salt.sh wrote with BS_TRACE set",
+        },
+        "output": {
+            "help": (
+                "Where to write the collapsed stacks, for flamegraph.pl, inferno or "
+                "speedscope. Default: the trace file with a .folded suffix"
+            ),
+        },
+        "commands": {
+            "help": "Add the commands each function ran as the leaves of its stacks",
+        },
+        "top": {
+            "help": "How many functions to report, by self time",
+        },
+        "json_output": {
+            "help": "Print the per function statistics as JSON",
+        },
+    },
+)
+def fold(
+    ctx: Context,
+    trace_file: pathlib.Path,
+    output: pathlib.Path = None,
+    commands: bool = False,
+    top: int = 25,
+    json_output: bool = False,
+):
+    """
+    Fold a bootstrap-salt.sh trace into flame graph stacks.
+
+    Run the script with BS_TRACE=/path/to/trace to get one. The collapsed stacks
+    weigh every function stack by the microseconds spent in it, and the report
+    lists the calls, self and total time and forks of each function.
+    """
+    if not trace_file.is_file():
+        ctx.error(f"{trace_file} does not exist")
+        ctx.exit(1)
+    if output is None:
+        output = trace_file.with_name(f"{trace_file.name}.folded")
+
+    stacks, stats = fold_trace(trace_file, commands=commands)
+    if not stacks:
+        ctx.error(
+            f"No trace lines found in {trace_file}, was it written with BS_TRACE?"
+        )
+        ctx.exit(1)
+
+    with open(output, "w") as wfh:
+        for stack, elapsed in sorted(stacks.items()):
+            if elapsed:
+                wfh.write(f"{stack} {elapsed}\n")
+
+    report = sorted(
+        (
+            {
+                "function": name,
+                "calls": values["calls"],
+                "self_seconds": round(values["self_us"] / 1_000_000, 6),
+                "total_seconds": round(values["total_us"] / 1_000_000, 6),
+                "forks": values["forks"],
+            }
+            for name, values in stats.items()
+            if values["total_us"] or values["forks"]
+        ),
+        key=lambda entry: (-entry["self_seconds"], entry["function"]),
+    )[:top]
+
+    if json_output:
+        print(json.dumps(report, indent=2), flush=True)
+        ctx.exit(0)
+
+    ctx.info(f"Wrote the collapsed stacks to {output}")
+    for entry in report:
+        ctx.info(
+            f"{entry['function']}: calls={entry['calls']} "
+            f"self={entry['self_seconds']:.3f}s total={entry['total_seconds']:.3f}s "
+            f"forks={entry['forks']}"
+        )
+    ctx.exit(0)